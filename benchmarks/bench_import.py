@@ -0,0 +1,64 @@
+"""导入耗时与首次调用基准测试
+
+在子进程中测量 ``import uglyrag`` 的耗时、导入后加载的模块数量，以及首次分割、分词调用的耗时 (模块在此时才加载)。
+--eager 模式在导入后立即加载全部模块，用于和旧的导入时加载方式对比。使用当前 config.ini 中配置的模块:
+
+    python benchmarks/bench_import.py --runs 5
+    python benchmarks/bench_import.py --eager
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+from uglyrag import SearchEngine
+from uglyrag.db_manager import DatabaseManager
+from uglyrag.utils import resolve_module
+imported = time.perf_counter()
+modules = len(sys.modules)
+if {eager}:
+    for target, name in ((DatabaseManager, "segment"), (DatabaseManager, "embeddings"), (SearchEngine, "rerank"), (SearchEngine, "split")):
+        resolve_module(target, name)
+loaded = time.perf_counter()
+SearchEngine.split("第一段内容。\\n\\n第二段 second paragraph.")
+split = time.perf_counter()
+DatabaseManager.segment("首次查询 first query")
+segment = time.perf_counter()
+print(json.dumps({{
+    "import_seconds": imported - start,
+    "load_seconds": loaded - imported,
+    "first_split_seconds": split - loaded,
+    "first_segment_seconds": segment - split,
+    "modules": modules,
+}}))
+"""
+
+
+def run_child(eager: bool) -> dict[str, float]:
+    code = CHILD.format(eager=eager)
+    output = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--eager", action="store_true", help="导入后立即加载全部模块")
+    args = parser.parse_args()
+
+    results = [run_child(args.eager) for _ in range(args.runs)]
+    summary: dict[str, float | int | str] = {"mode": "eager" if args.eager else "lazy", "runs": args.runs}
+    for key in results[0]:
+        summary[key] = round(statistics.median(r[key] for r in results), 4)
+    print(json.dumps(summary))
+
+
+if __name__ == "__main__":
+    main()
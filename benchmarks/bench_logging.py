@@ -0,0 +1,83 @@
+"""日志开销基准测试
+
+测量热路径上单次日志调用的平均耗时，对比同步 FileHandler 与后台线程写入的 AsyncHandler，
+以及 f-string 与 % 风格参数在日志级别被过滤时的差别:
+
+    python benchmarks/bench_logging.py --calls 100000
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import tempfile
+import time
+from collections.abc import Callable
+from logging import FileHandler
+from pathlib import Path
+
+from uglyrag.logger import AsyncHandler, create_formatter
+
+PAYLOAD = {"model": "jina-embeddings-v3", "input": ["检索增强生成 retrieval augmented generation"] * 64}
+
+
+def measure(calls: int, func: Callable[[int], None]) -> float:
+    start = time.perf_counter()
+    for i in range(calls):
+        func(i)
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def run(handler_name: str, level: int, calls: int) -> list[dict[str, float | str]]:
+    logger = logging.getLogger("uglyrag.bench")
+    logger.propagate = False
+    results: list[dict[str, float | str]] = []
+    with tempfile.TemporaryDirectory() as tmp:
+        file_handler = FileHandler(Path(tmp) / "bench.log", encoding="utf-8")
+        file_handler.setFormatter(create_formatter())
+        handler: logging.Handler = AsyncHandler(file_handler) if handler_name == "async" else file_handler
+        logger.addHandler(handler)
+        logger.setLevel(level)
+        cases: dict[str, Callable[[int], None]] = {
+            "info_percent": lambda i: logger.info("查询 %s 返回 %s 条结果", i, 5),
+            "debug_fstring_payload": lambda i: logger.debug(f"Sending POST request with data: {PAYLOAD}"),
+            "debug_percent_payload": lambda i: logger.debug("Sending POST request with data: %s", PAYLOAD),
+        }
+        for name, func in cases.items():
+            start = time.perf_counter()
+            per_call = measure(calls, func)
+            if isinstance(handler, AsyncHandler):
+                # 包含把队列中剩余日志写完的时间，便于比较总吞吐
+                handler.stop()
+                total = time.perf_counter() - start
+                handler.listener.start()
+            else:
+                total = time.perf_counter() - start
+            results.append(
+                {
+                    "handler": handler_name,
+                    "level": logging.getLevelName(level),
+                    "case": name,
+                    "us_per_call": round(per_call, 3),
+                    "total_seconds": round(total, 3),
+                }
+            )
+        logger.removeHandler(handler)
+        handler.close()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=20_000)
+    args = parser.parse_args()
+
+    for handler_name in ("sync", "async"):
+        for level in (logging.INFO, logging.DEBUG):
+            for result in run(handler_name, level, args.calls):
+                print(json.dumps(result, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
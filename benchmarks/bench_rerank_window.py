@@ -0,0 +1,100 @@
+"""rerank 输入长度与候选数基准测试
+
+对比不同的 rerank_max_chars (每个候选交给 rerank 的字符数) 和 rerank_max_docs (最多重排的候选数) 下的 rerank 耗时、
+输入字符数，以及与不加限制时的重排结果的一致程度 (agreement@k)。rerank 替身按查询词的命中比例打分，
+耗时与输入的字符数成正比 (--ms-per-kchar)，模拟 cross-encoder 的计算量随 token 数增长，不依赖网络:
+
+    python benchmarks/bench_rerank_window.py --chunks 2000 --max-chars 0,256,512,1024 --max-docs 0,10
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+from common import make_corpus, make_embedding, make_queries, percentiles, segment
+
+from uglyrag.database._sqlite import SQLiteDatebase
+from uglyrag.integrations.hashing import overlap_scores
+from uglyrag.search import rerank_candidates, rrf_fuse
+
+VAULT = "bench"
+
+
+def make_rerank(ms_per_kchar: float) -> Callable[[str, list[str]], list[float]]:
+    def rerank(query: str, documents: list[str]) -> list[float]:
+        time.sleep(ms_per_kchar * sum(len(document) for document in documents) / 1e6)
+        return overlap_scores(query, documents)
+
+    return rerank
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=2_000)
+    parser.add_argument("--words", default="200,800", help="每个分段的词数范围")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--depth", type=int, default=20, help="每路检索的候选数")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--dims", type=int, default=256)
+    parser.add_argument("--ms-per-kchar", type=float, default=1.0, help="rerank 每千字符的耗时 (毫秒)")
+    parser.add_argument("--max-chars", default="0,256,512,1024", help="逗号分隔, 0 表示不截断")
+    parser.add_argument("--max-docs", default="0,10", help="逗号分隔, 0 表示不限制")
+    args = parser.parse_args()
+
+    low, high = (int(w) for w in args.words.split(","))
+    corpus = make_corpus(args.chunks, chunk_words=(low, high))
+    queries = make_queries(corpus, args.queries)
+    embeddings = make_embedding(args.dims)
+    rerank = make_rerank(args.ms_per_kchar)
+    with tempfile.TemporaryDirectory() as tmp:
+        db = SQLiteDatebase(Path(tmp) / "bench.db", segment, lambda text: embeddings([text])[0])
+        db._check_vault(VAULT)
+        with db.bulk_load(VAULT):
+            db.insert_data(corpus, VAULT)
+            db.conn.commit()
+        candidates = {
+            query: rrf_fuse(
+                db._background_search_fts(query, VAULT, args.depth), db._background_search_vec(query, VAULT, args.depth)
+            )
+            for query in queries
+        }
+        db.conn.close()
+
+    # 以不加限制时的重排结果为基准
+    truths = {
+        query: [id for id, _ in rerank_candidates(overlap_scores, query, docs)[: args.k]]
+        for query, docs in candidates.items()
+    }
+    for max_docs in (int(d) for d in args.max_docs.split(",")):
+        for max_chars in (int(c) for c in args.max_chars.split(",")):
+            latencies, agreements, chars = [], [], []
+            for query, docs in candidates.items():
+                start = time.perf_counter()
+                ranked = rerank_candidates(rerank, query, docs, max_chars, max_docs)[: args.k]
+                latencies.append((time.perf_counter() - start) * 1000)
+                truth = truths[query]
+                agreements.append(len({id for id, _ in ranked} & set(truth)) / max(len(truth), 1))
+                limited = docs[:max_docs] if max_docs else docs
+                chars.append(sum(min(len(content), max_chars) if max_chars else len(content) for _, content in limited))
+            print(
+                json.dumps(
+                    {
+                        "max_chars": max_chars,
+                        "max_docs": max_docs,
+                        "mean_candidates": round(statistics.mean(len(docs) for docs in candidates.values()), 1),
+                        "mean_input_chars": round(statistics.mean(chars)),
+                        f"agreement@{args.k}": round(statistics.mean(agreements), 4),
+                    }
+                    | {f"rerank_{key}": value for key, value in percentiles(latencies).items()}
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""SQLite 导入吞吐量基准测试
+
+对比逐行触发器写入与批量导入模式 (bulk_load) 的导入速度，不依赖网络:
+
+    python benchmarks/bench_sqlite_bulk_load.py --chunks 100000 --dims 256
+    python benchmarks/bench_sqlite_bulk_load.py --chunks 1000000 --batch 10000 --mode bulk
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import random
+import struct
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+from uglyrag.database._sqlite import SQLiteDatebase
+
+WORDS = ["检索", "增强", "生成", "向量", "索引", "分词", "数据库", "search", "engine", "vector", "index", "query"]
+
+
+def make_embedding(dims: int) -> Callable[[str], list[float]]:
+    def embedding(text: str) -> list[float]:
+        digest = hashlib.blake2b(text.encode("utf-8"), digest_size=64).digest()
+        values = struct.unpack("64b", digest)
+        return [values[i % 64] / 128.0 for i in range(dims)]
+
+    return embedding
+
+
+def make_corpus(chunks: int, seed: int = 42) -> list[tuple[str, str, str]]:
+    rng = random.Random(seed)
+    return [
+        (f"doc-{i // 10}", str(i % 10 + 1), " ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 80))))
+        for i in range(chunks)
+    ]
+
+
+def run(mode: str, corpus: list[tuple[str, str, str]], dims: int, batch: int) -> dict[str, float | int | str]:
+    with tempfile.TemporaryDirectory() as tmp:
+        db = SQLiteDatebase(Path(tmp) / "bench.db", str.split, make_embedding(dims))
+        db._check_vault("bench")
+        start = time.perf_counter()
+        if mode == "bulk":
+            with db.bulk_load("bench"):
+                for i in range(0, len(corpus), batch):
+                    db.insert_data(corpus[i : i + batch], "bench")
+                    db.conn.commit()
+        else:
+            for i in range(0, len(corpus), batch):
+                db.insert_data(corpus[i : i + batch], "bench")
+                db.conn.commit()
+        elapsed = time.perf_counter() - start
+        size = sum(f.stat().st_size for f in Path(tmp).iterdir())
+        db.conn.close()
+    return {
+        "mode": mode,
+        "chunks": len(corpus),
+        "dims": dims,
+        "seconds": round(elapsed, 3),
+        "chunks_per_second": round(len(corpus) / elapsed, 1),
+        "db_bytes": size,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=100_000)
+    parser.add_argument("--dims", type=int, default=256)
+    parser.add_argument("--batch", type=int, default=5_000)
+    parser.add_argument("--mode", choices=["normal", "bulk", "both"], default="both")
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.chunks)
+    modes = ["normal", "bulk"] if args.mode == "both" else [args.mode]
+    for mode in modes:
+        print(json.dumps(run(mode, corpus, args.dims, args.batch)))
+
+
+if __name__ == "__main__":
+    main()
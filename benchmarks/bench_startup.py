@@ -0,0 +1,73 @@
+"""启动耗时基准测试
+
+在子进程中打开数据库并检查存储库，分别测量冷启动 (新建存储库，需要调用一次向量模型获取维度) 和
+热启动 (存储库已存在，维度从元数据读取) 的耗时。向量模型用固定延迟的替身模拟一次网络请求或模型推理，不依赖网络:
+
+    python benchmarks/bench_startup.py --embed-latency 0.3 --runs 5
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+from pathlib import Path
+from uglyrag.database._sqlite import SQLiteDatebase
+
+calls = 0
+def embedding(text):
+    global calls
+    calls += 1
+    time.sleep({latency})
+    return [0.1] * {dims}
+
+db = SQLiteDatebase(Path({db_path!r}), str.split, embedding)
+db._check_vault("bench")
+print(json.dumps({{"seconds": time.perf_counter() - start, "embedding_calls": calls}}))
+"""
+
+
+def run_child(db_path: Path, latency: float, dims: int) -> dict[str, float]:
+    code = CHILD.format(db_path=str(db_path), latency=latency, dims=dims)
+    output = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--embed-latency", type=float, default=0.3, help="模拟的单次向量模型调用耗时 (秒)")
+    parser.add_argument("--dims", type=int, default=1024)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    cold: list[dict[str, float]] = []
+    warm: list[dict[str, float]] = []
+    for _ in range(args.runs):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = Path(tmp) / "bench.db"
+            cold.append(run_child(db_path, args.embed_latency, args.dims))
+            warm.append(run_child(db_path, args.embed_latency, args.dims))
+    for name, results in (("cold", cold), ("warm", warm)):
+        print(
+            json.dumps(
+                {
+                    "start": name,
+                    "runs": args.runs,
+                    "embed_latency": args.embed_latency,
+                    "median_seconds": round(statistics.median(r["seconds"] for r in results), 4),
+                    "embedding_calls": max(r["embedding_calls"] for r in results),
+                }
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
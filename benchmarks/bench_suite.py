@@ -0,0 +1,211 @@
+"""导入与查询性能基准测试
+
+使用 common.py 中的合成中英文语料、哈希向量和 rerank 替身，不依赖网络，在笔记本上即可运行。
+对每种数据库分别测量:
+
+- 导入: 每秒写入的分段数 (经过 DatabaseManager.add_documents，包含向量化、写入和重建索引)
+- 查询: 经过 SearchEngine.search 的 p50/p95/p99 延迟，分别走 RRF 融合和 rerank 两条路径，
+  --rerank-batch-size 大于 0 时增加跨查询合并 rerank 的路径 (rerank_batched)
+- 并发: 不同并发线程数下的 QPS
+- 资源: 导入后的常驻内存、峰值内存和数据库文件大小
+
+每种数据库在独立的子进程中运行，内存数据互不影响。结果每行输出一个 JSON，--output 同时写入文件，
+--compare 对比两次运行的结果，出现超过阈值的退化时以非零状态退出:
+
+    python benchmarks/bench_suite.py --chunks 5000 --output new.json
+    python benchmarks/bench_suite.py --backend sqlite --concurrency 1,8 --rerank-latency 0.02
+    python benchmarks/bench_suite.py --concurrency 8 --rerank-latency 0.02 --rerank-exclusive --rerank-batch-size 64
+    python benchmarks/bench_suite.py --compare old.json new.json --threshold 0.1
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import sys
+import tempfile
+import time
+from collections.abc import Callable, Iterator
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Any
+from unittest.mock import patch
+
+from common import (
+    make_corpus,
+    make_embedding,
+    make_queries,
+    make_rerank,
+    make_score_pairs,
+    peak_rss_mb,
+    percentiles,
+    rss_mb,
+    segment,
+)
+
+from uglyrag.batching import RerankScheduler
+from uglyrag.database import Database
+from uglyrag.database._sqlite import SQLiteDatebase
+from uglyrag.db_manager import DatabaseManager
+from uglyrag.search import SearchEngine
+
+VAULT = "bench"
+DB_SUFFIXES = {"sqlite": ".db", "duckdb": ".ddb"}
+# 数值越小越好的指标后缀，其余指标 (吞吐量) 越大越好
+LOWER_IS_BETTER = ("_ms", "_mb", "_bytes", "_seconds")
+
+
+def open_database(backend: str, db_path: Path) -> Database:
+    if backend == "duckdb":
+        from uglyrag.database._duckdb import DuckDBDatabase
+
+        return DuckDBDatabase(db_path, segment, DatabaseManager._get_embedding)
+    return SQLiteDatebase(db_path, segment, DatabaseManager._get_embedding)
+
+
+@contextmanager
+def use_database(db: Database, args: argparse.Namespace) -> Iterator[None]:
+    """让 DatabaseManager 和 SearchEngine 使用基准数据库和替身模块，不读写用户的配置和数据目录"""
+    with ExitStack() as stack:
+        stack.enter_context(patch.object(DatabaseManager, "get_database", lambda: db))
+        stack.enter_context(patch.object(DatabaseManager, "_get_vault_dims", lambda vault: 0))
+        stack.enter_context(patch.object(DatabaseManager, "segment", staticmethod(segment)))
+        stack.enter_context(
+            patch.object(DatabaseManager, "embeddings", staticmethod(make_embedding(args.dims, args.embed_latency)))
+        )
+        stack.enter_context(patch.object(DatabaseManager, "_check_vault_dict", {}))
+        stack.enter_context(patch.object(DatabaseManager, "_embeddings_dict", {}))
+        stack.enter_context(patch.object(DatabaseManager, "_query_embeddings", {}))
+        stack.enter_context(patch.object(SearchEngine, "rerank", None))
+        yield
+
+
+def measure_latency(queries: list[str], top_n: int) -> dict[str, float]:
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        SearchEngine.search(query, VAULT, top_n)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return percentiles(latencies)
+
+
+def measure_qps(queries: list[str], top_n: int, concurrency: int) -> float:
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        start = time.perf_counter()
+        for _ in pool.map(lambda query: SearchEngine.search(query, VAULT, top_n), queries):
+            pass
+        elapsed = time.perf_counter() - start
+    return round(len(queries) / elapsed, 2)
+
+
+def run_queries(
+    result: dict[str, Any], name: str, queries: list[str], args: argparse.Namespace, rerank: Callable | None
+) -> None:
+    with patch.object(SearchEngine, "rerank", rerank):
+        # 每轮查询前清空向量缓存，使查询向量都需要重新计算
+        DatabaseManager._query_embeddings.clear()
+        for key, value in measure_latency(queries, args.top_n).items():
+            result[f"{name}_{key}"] = value
+        for concurrency in args.concurrency:
+            DatabaseManager._query_embeddings.clear()
+            result[f"{name}_qps@{concurrency}"] = measure_qps(queries, args.top_n, concurrency)
+
+
+def run(backend: str, args: argparse.Namespace) -> dict[str, Any]:
+    corpus = make_corpus(args.chunks, seed=args.seed)
+    queries = make_queries(corpus, args.queries, seed=args.seed + 1)
+    result: dict[str, Any] = {"backend": backend, "chunks": args.chunks, "dims": args.dims, "queries": len(queries)}
+    with tempfile.TemporaryDirectory() as tmp:
+        db = open_database(backend, (Path(tmp) / "bench").with_suffix(DB_SUFFIXES[backend]))
+        with use_database(db, args):
+            start = time.perf_counter()
+            for i in range(0, len(corpus), args.batch):
+                DatabaseManager.add_documents(corpus[i : i + args.batch], VAULT)
+            elapsed = time.perf_counter() - start
+            result["ingest_seconds"] = round(elapsed, 3)
+            result["ingest_chunks_per_s"] = round(len(corpus) / elapsed, 1)
+            # 导入时缓存的文档向量不计入查询阶段的内存
+            DatabaseManager._embeddings_dict.clear()
+            result["rss_mb"] = rss_mb()
+            result["db_bytes"] = db.file_size()
+
+            run_queries(result, "rrf", queries, args, None)
+            run_queries(result, "rerank", queries, args, make_rerank(args.rerank_latency, args.rerank_exclusive))
+            if args.rerank_batch_size > 0:
+                scheduler = RerankScheduler(
+                    make_score_pairs(args.rerank_latency, args.rerank_exclusive),
+                    args.rerank_batch_size,
+                    args.rerank_batch_wait_ms / 1000,
+                )
+                run_queries(result, "rerank_batched", queries, args, scheduler)
+                scheduler.close()
+            result["peak_rss_mb"] = peak_rss_mb()
+        db.conn.close()
+    return result
+
+
+def compare(old_path: Path, new_path: Path, threshold: float) -> int:
+    """逐项对比两次运行的结果，返回退化超过阈值的指标数量"""
+    old = {r["backend"]: r for r in json.loads(old_path.read_text())["results"]}
+    new = {r["backend"]: r for r in json.loads(new_path.read_text())["results"]}
+    regressions = 0
+    for backend in (backend for backend in new if backend in old):
+        for key, value in new[backend].items():
+            base = old[backend].get(key)
+            if key in ("chunks", "dims", "queries") or not isinstance(value, int | float) or not base:
+                continue
+            change = (value - base) / base
+            worse = change > threshold if key.endswith(LOWER_IS_BETTER) else change < -threshold
+            regressions += worse
+            print(
+                json.dumps(
+                    {"backend": backend, "metric": key, "old": base, "new": value, "change": round(change, 4)}
+                    | ({"regression": True} if worse else {})
+                )
+            )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", nargs="+", choices=["sqlite", "duckdb"], default=["sqlite", "duckdb"])
+    parser.add_argument("--chunks", type=int, default=5_000)
+    parser.add_argument("--batch", type=int, default=256, help="每次 add_documents 写入的分段数")
+    parser.add_argument("--dims", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-n", type=int, default=5)
+    parser.add_argument("--concurrency", type=lambda s: [int(c) for c in s.split(",")], default=[1, 4, 8])
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="模拟的单次向量模型调用耗时 (秒)")
+    parser.add_argument("--rerank-latency", type=float, default=0.0, help="模拟的单次 rerank 调用耗时 (秒)")
+    parser.add_argument(
+        "--rerank-exclusive", action="store_true", help="模拟本地 rerank 模型，同一时间只能执行一次推理"
+    )
+    parser.add_argument(
+        "--rerank-batch-size", type=int, default=0, help="跨查询合并 rerank 的最大 (query, document) 对数"
+    )
+    parser.add_argument("--rerank-batch-wait-ms", type=float, default=2.0, help="合并 rerank 时最多等待的毫秒数")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=Path, help="将结果写入 JSON 文件，用于之后对比")
+    parser.add_argument("--compare", nargs=2, type=Path, metavar=("OLD", "NEW"), help="对比两次运行的结果")
+    parser.add_argument("--threshold", type=float, default=0.1, help="判定退化的相对变化阈值")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.threshold) else 0)
+
+    results = []
+    for backend in args.backend:
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+            result = pool.submit(run, backend, args).result()
+        print(json.dumps(result))
+        results.append(result)
+    if args.output:
+        meta = {"python": platform.python_version(), "platform": platform.platform(), "time": time.time()}
+        args.output.write_text(json.dumps({"meta": meta, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""SQLite 向量量化与维度基准测试
+
+对比 float32、int8 和二值量化向量以及不同的存储库向量维度下的数据库大小、查询延迟和相对于全维度精确检索的召回率，
+不依赖网络:
+
+    python benchmarks/bench_vec_quantization.py --chunks 20000 --dims 512
+    python benchmarks/bench_vec_quantization.py --quantization binary --rescore-factor 8
+    python benchmarks/bench_vec_quantization.py --quantization none --dims 1024 --vault-dims 0,512,256
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import statistics
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+from uglyrag.database._sqlite import SQLiteDatebase
+
+
+def make_embedding(dims: int, topics: int = 64) -> Callable[[str], list[float]]:
+    """
+    生成归一化的伪向量: 文本按哈希分配到若干主题中心附近，使相近的向量成簇，接近真实向量的分布
+    """
+    rng = random.Random(0)
+    centers = [[rng.gauss(0, 1) for _ in range(dims)] for _ in range(topics)]
+
+    def embedding(text: str) -> list[float]:
+        seed = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+        local = random.Random(seed)
+        center = centers[seed % topics]
+        vector = [c + local.gauss(0, 0.6) for c in center]
+        norm = math.sqrt(sum(v * v for v in vector))
+        return [v / norm for v in vector]
+
+    return embedding
+
+
+def exact_top_ids(db: SQLiteDatebase, vault: str, query: str, k: int) -> list[int]:
+    vectors = db.conn.execute(f"SELECT id, content FROM {vault}").fetchall()
+    q = db.embedding(query)
+    scored = sorted(vectors, key=lambda row: sum((a - b) ** 2 for a, b in zip(db.embedding(row[1]), q)))
+    return [row[0] for row in scored[:k]]
+
+
+def run(
+    quantization: str, chunks: int, dims: int, queries: int, k: int, rescore_factor: int, vault_dims: int = 0
+) -> dict[str, float | int | str]:
+    embedding = make_embedding(dims)
+    with tempfile.TemporaryDirectory() as tmp:
+        db = SQLiteDatebase(
+            Path(tmp) / "bench.db",
+            str.split,
+            embedding,
+            vec_quantization=quantization,
+            vec_rescore_factor=rescore_factor,
+        )
+        db._check_vault("bench", vault_dims)
+        vault_dims = db.vault_dims("bench")
+        with db.bulk_load("bench"):
+            db.insert_data([(f"doc-{i}", "1", f"chunk {i}") for i in range(chunks)], "bench")
+            db.conn.commit()
+        db.conn.execute("VACUUM")
+        size = sum(f.stat().st_size for f in Path(tmp).iterdir())
+        # KNN 扫描的只有向量表的数据块，原始向量表只在重新排序时按 id 读取
+        index_size = db.conn.execute("SELECT sum(length(vectors)) FROM bench_vec_vector_chunks00").fetchone()[0]
+
+        rng = random.Random(42)
+        probes = [f"chunk {rng.randrange(chunks)} query" for _ in range(queries)]
+        latencies = []
+        recalls = []
+        for query in probes:
+            start = time.perf_counter()
+            ids = [row[0] for row in db._background_search_vec(query, "bench", top_n=k)]
+            latencies.append((time.perf_counter() - start) * 1000)
+            # 以全维度向量的精确检索结果作为基准
+            truth = exact_top_ids(db, "bench", query, k)
+            recalls.append(len(set(ids) & set(truth)) / k)
+        db.conn.close()
+    return {
+        "quantization": quantization,
+        "chunks": chunks,
+        "dims": dims,
+        "vault_dims": vault_dims,
+        "rescore_factor": rescore_factor,
+        "db_bytes": size,
+        "vec_index_bytes": index_size,
+        f"recall@{k}": round(statistics.mean(recalls), 4),
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p95_ms": round(statistics.quantiles(latencies, n=20)[-1], 3),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=5_000)
+    parser.add_argument("--dims", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rescore-factor", type=int, default=4)
+    parser.add_argument("--quantization", choices=["none", "int8", "binary", "all"], default="all")
+    parser.add_argument("--vault-dims", default="0", help="逗号分隔的存储库向量维度, 0 表示不截断")
+    args = parser.parse_args()
+
+    modes = ["none", "int8", "binary"] if args.quantization == "all" else [args.quantization]
+    for vault_dims in (int(d) for d in args.vault_dims.split(",")):
+        for mode in modes:
+            print(json.dumps(run(mode, args.chunks, args.dims, args.queries, args.k, args.rescore_factor, vault_dims)))
+
+
+if __name__ == "__main__":
+    main()
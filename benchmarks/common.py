@@ -0,0 +1,151 @@
+"""基准测试共用的离线替身
+
+提供可复现的中英文混合语料，以及基于 uglyrag.integrations.hashing 的分词函数、向量模型和 rerank 替身，
+不依赖网络和模型。替身的输出只由输入文本决定，多次运行之间的结果可以直接比较。
+"""
+
+from __future__ import annotations
+
+import random
+import resource
+import statistics
+import sys
+import threading
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+from uglyrag.integrations.hashing import hash_embedding, overlap_scores, tokenize
+
+CJK_CHARS = (
+    "检索增强生成向量索引分词数据库模型查询文档语料排序召回精度延迟吞吐缓存内存磁盘压缩"
+    "网络服务请求批量并发线程进程队列调度日志指标采样评估实验配置存储读取写入更新删除"
+)
+LATIN_SYLLABLES = ["ra", "ve", "lo", "tic", "mon", "sa", "qu", "er", "dex", "in", "ka", "zu", "pri", "ton", "el"]
+
+
+def make_vocabulary(size: int, seed: int = 0) -> list[str]:
+    """生成中文词 (两到三个汉字) 和英文词 (两到四个音节) 各占一半的词表"""
+    rng = random.Random(seed)
+    words: dict[str, None] = {}
+    while len(words) < size:
+        if len(words) % 2:
+            word = "".join(rng.choice(LATIN_SYLLABLES) for _ in range(rng.randint(2, 4)))
+        else:
+            word = "".join(rng.choice(CJK_CHARS) for _ in range(rng.randint(2, 3)))
+        words[word] = None
+    return list(words)
+
+
+def make_text(rng: random.Random, vocabulary: list[str], weights: list[float], length: int) -> str:
+    """按词频权重抽词组成文本，中文词之间不加空格，与真实的中英文混排一致"""
+    text = ""
+    for word in rng.choices(vocabulary, weights, k=length):
+        if text and (word.isascii() or text[-1].isascii()):
+            text += " "
+        text += word
+    return text
+
+
+def make_corpus(
+    chunks: int, vocabulary_size: int = 2000, chunk_words: tuple[int, int] = (30, 120), seed: int = 42
+) -> list[tuple[str, str, str]]:
+    """
+    生成 (source, part_id, content) 形式的分段语料，词频服从 Zipf 分布，每个来源包含 10 个分段
+    """
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(vocabulary_size, seed)
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    return [
+        (f"doc-{i // 10}", str(i % 10 + 1), make_text(rng, vocabulary, weights, rng.randint(*chunk_words)))
+        for i in range(chunks)
+    ]
+
+
+def make_queries(corpus: list[tuple[str, str, str]], count: int, seed: int = 7) -> list[str]:
+    """从随机分段中抽取 2 到 4 个词组成查询，查询之间互不相同，避免命中向量缓存"""
+    rng = random.Random(seed)
+    queries: dict[str, None] = {}
+    while len(queries) < count:
+        tokens = segment(rng.choice(corpus)[2])
+        queries[" ".join(rng.sample(tokens, min(len(tokens), rng.randint(2, 4))))] = None
+    return list(queries)
+
+
+def segment(text: str) -> list[str]:
+    """英文按单词切分并转为小写，中文按相邻两字切分"""
+    return tokenize(text)
+
+
+def make_embedding(dims: int, latency: float = 0.0) -> Callable[[list[str]], list[list[float]]]:
+    """
+    uglyrag.integrations.hashing 中的词袋哈希向量，共享词越多的文本向量越接近。
+    latency 为每次批量调用附加的耗时 (秒)，用于模拟网络请求或模型推理
+    """
+
+    def embeddings(texts: list[str]) -> list[list[float]]:
+        if latency:
+            time.sleep(latency)
+        return [hash_embedding(text, dims) for text in texts]
+
+    return embeddings
+
+
+# 本地模型同一时间只能执行一次推理，exclusive 的替身在推理期间持有此锁
+_model_lock = threading.Lock()
+
+
+def _infer(latency: float, exclusive: bool) -> None:
+    if not latency:
+        return
+    if exclusive:
+        with _model_lock:
+            time.sleep(latency)
+    else:
+        time.sleep(latency)
+
+
+def make_rerank(latency: float = 0.0, exclusive: bool = False) -> Callable[[str, list[str]], list[float]]:
+    """按查询词在文档中出现的比例打分，latency 为每次调用附加的耗时 (秒)"""
+
+    def rerank(query: str, docs: list[str]) -> list[float]:
+        _infer(latency, exclusive)
+        return overlap_scores(query, docs)
+
+    return rerank
+
+
+def make_score_pairs(latency: float = 0.0, exclusive: bool = False) -> Callable[[list[tuple[str, str]]], list[float]]:
+    """与 make_rerank 相同的打分，一次调用对多个查询的 (query, document) 对打分"""
+
+    def score_pairs(pairs: list[tuple[str, str]]) -> list[float]:
+        _infer(latency, exclusive)
+        return [overlap_scores(query, [doc])[0] for query, doc in pairs]
+
+    return score_pairs
+
+
+def percentiles(latencies: list[float]) -> dict[str, float]:
+    """延迟的 p50/p95/p99 和平均值 (毫秒)"""
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else latencies * 99
+    return {
+        "p50_ms": round(cuts[49], 3),
+        "p95_ms": round(cuts[94], 3),
+        "p99_ms": round(cuts[98], 3),
+        "mean_ms": round(statistics.mean(latencies), 3),
+    }
+
+
+def rss_mb() -> float:
+    """当前进程的常驻内存 (MiB)，非 Linux 系统上返回峰值"""
+    statm = Path("/proc/self/statm")
+    if statm.exists():
+        return round(int(statm.read_text().split()[1]) * resource.getpagesize() / 2**20, 1)
+    return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    """当前进程的峰值常驻内存 (MiB)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 上单位为 KiB，macOS 上为字节
+    return round(peak / 2**20 if sys.platform == "darwin" else peak / 1024, 1)
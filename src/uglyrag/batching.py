@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import threading
+import time
+import weakref
+from collections.abc import Callable, Sequence
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Generic, TypeVar
+
+from uglyrag import metrics
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class MicroBatcher(Generic[T, R]):
+    """
+    把短时间内并发提交的请求合并为一次批量调用。
+
+    第一个请求到达后最多等待 max_wait 秒，期间到达的请求 (最多 max_batch 个) 合并为一批调用 func，
+    func 接收请求列表并按相同顺序返回结果。最多同时执行 concurrency 批，都在执行时新到达的请求继续累积，
+    有批次完成后再合并发出，负载越高每批越大。
+    可以在线程中调用 (submit 或直接调用实例)，也可以在事件循环中 await asubmit。
+    fork 出的子进程中会丢弃父进程尚未发出的请求，重新创建后台线程
+    """
+
+    def __init__(
+        self,
+        func: Callable[[list[T]], Sequence[R]],
+        max_batch: int = 32,
+        max_wait: float = 0.005,
+        concurrency: int = 4,
+        name: str = "batch",
+    ) -> None:
+        if max_batch <= 0:
+            raise ValueError("max_batch 必须大于 0")
+        self.func = func
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.name = name
+        self.concurrency = concurrency
+        self.batch_size = metrics.histogram(
+            f"uglyrag_{name}_batch_size", f"{name} 每批合并的请求数", metrics.SIZE_BOUNDS
+        )
+        self._pending: list[tuple[T, Future[R]]] = []
+        self._condition = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=name)
+        self._slots = threading.Semaphore(concurrency)
+        self._thread: threading.Thread | None = None
+        self._closed = False
+        _batchers.add(self)
+
+    def submit(self, item: T) -> Future[R]:
+        return self.submit_many([item])[0]
+
+    def submit_many(self, items: Sequence[T]) -> list[Future[R]]:
+        """一次提交多个请求，这些请求按顺序进入队列，不会与其他调用方的请求交错"""
+        futures: list[Future[R]] = [Future() for _ in items]
+        with self._condition:
+            if self._closed:
+                raise RuntimeError(f"{self.name} 已关闭")
+            self._pending.extend(zip(items, futures))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._dispatch, name=f"{self.name}-dispatch", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return futures
+
+    def __call__(self, item: T) -> R:
+        return self.submit(item).result()
+
+    async def asubmit(self, item: T) -> R:
+        return await asyncio.wrap_future(self.submit(item))
+
+    def _dispatch(self) -> None:
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+                # 从第一个请求到达开始计时，凑满一批或超时后发出
+                deadline = time.monotonic() + self.max_wait
+                while len(self._pending) < self.max_batch and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+            # 等待空闲的执行线程，期间到达的请求合并到这一批
+            self._slots.acquire()
+            with self._condition:
+                batch, self._pending = self._pending[: self.max_batch], self._pending[self.max_batch :]
+            self._executor.submit(self._run, batch)
+
+    def _run(self, batch: list[tuple[T, Future[R]]]) -> None:
+        try:
+            self._run_batch(batch)
+        finally:
+            self._slots.release()
+
+    def _run_batch(self, batch: list[tuple[T, Future[R]]]) -> None:
+        # 跳过已被取消的请求
+        batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        self.batch_size.observe(len(batch))
+        try:
+            results = self.func([item for item, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError(f"{self.name} 返回了 {len(results)} 个结果，应为 {len(batch)} 个")
+        except Exception as e:
+            logging.error(f"{self.name} 批量调用失败: {e}")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def close(self) -> None:
+        """发出剩余的请求并等待完成"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+        self._executor.shutdown(wait=True)
+
+    def _reset_after_fork(self) -> None:
+        self._pending = []
+        self._condition = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=self.name)
+        self._slots = threading.Semaphore(self.concurrency)
+        self._thread = None
+
+
+_batchers: weakref.WeakSet[MicroBatcher] = weakref.WeakSet()
+
+
+def _reset_after_fork() -> None:
+    # 子进程中没有父进程的后台线程，父进程尚未完成的请求由父进程处理
+    for batcher in list(_batchers):
+        batcher._reset_after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def pairwise(rerank: Callable[[str, list[str]], list[float]]) -> Callable[[list[tuple[str, str]]], list[float]]:
+    """把 rerank(query, documents) 转换为对 (query, document) 对打分的函数，同一查询的文档合并为一次调用"""
+
+    def score_pairs(pairs: list[tuple[str, str]]) -> list[float]:
+        groups: dict[str, list[int]] = {}
+        for i, (query, _) in enumerate(pairs):
+            groups.setdefault(query, []).append(i)
+        scores = [0.0] * len(pairs)
+        for query, indexes in groups.items():
+            for i, score in zip(indexes, rerank(query, [pairs[i][1] for i in indexes])):
+                scores[i] = score
+        return scores
+
+    return score_pairs
+
+
+class RerankScheduler:
+    """
+    跨查询合并重排序请求。
+
+    并发的查询各自提交 (query, document) 对，max_wait 秒内到达的 (最多 max_batch 对) 合并为一次 score_pairs 调用，
+    分数按原顺序返回给各个查询。本地模型的一次推理已经使用多个核，默认同一时间只执行一批，
+    推理期间到达的请求合并为下一批。可以直接替换 SearchEngine.rerank
+    """
+
+    def __init__(
+        self,
+        score_pairs: Callable[[list[tuple[str, str]]], Sequence[float]],
+        max_batch: int = 64,
+        max_wait: float = 0.002,
+        concurrency: int = 1,
+    ) -> None:
+        self.batcher: MicroBatcher[tuple[str, str], float] = MicroBatcher(
+            score_pairs, max_batch, max_wait, concurrency, name="rerank"
+        )
+
+    def __call__(self, query: str, documents: list[str]) -> list[float]:
+        futures = self.batcher.submit_many([(query, document) for document in documents])
+        return [future.result() for future in futures]
+
+    def close(self) -> None:
+        self.batcher.close()
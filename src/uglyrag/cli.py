@@ -0,0 +1,229 @@
+from __future__ import annotations
+
+import argparse
+import json
+from collections.abc import Sequence
+from pathlib import Path
+
+
+def _ingest(args: argparse.Namespace) -> int:
+    from uglyrag import SearchEngine
+
+    stats = SearchEngine.build_from_paths(
+        args.paths, args.vault, workers=args.workers, force=args.force, bulk_load=args.bulk_load
+    )
+    print(stats)
+    return 1 if stats.files_failed else 0
+
+
+def _maintain(args: argparse.Namespace) -> int:
+    from uglyrag import SearchEngine
+
+    print(SearchEngine.maintain(args.vault, online=not args.offline))
+    return 0
+
+
+def _parse_sweep(value: str) -> tuple[str, list[float]]:
+    name, _, values = value.partition("=")
+    try:
+        return name.strip(), [float(v) for v in values.split(",")]
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(f"无效的参数扫描: {value}，格式为 name=v1,v2") from e
+
+
+def _eval(args: argparse.Namespace) -> int:
+    from uglyrag import SearchEngine
+    from uglyrag.db_manager import DatabaseManager
+    from uglyrag.evaluation import evaluate, format_report, load_queries, write_report
+    from uglyrag.utils import resolve_module
+
+    vault = args.vault or SearchEngine.default_vault
+    queries = load_queries(args.queries)
+    sweep = dict(args.sweep)
+    stores = (
+        [(path.name, DatabaseManager.open_database(path)) for path in args.db]
+        if args.db
+        else [("", DatabaseManager.get_database())]
+    )
+    results = []
+    for name, store in stores:
+        options = {"rerank": resolve_module(SearchEngine, "rerank")} if "rerank" in args.mode else {}
+        results += evaluate(store, vault, queries, args.k, sweep, args.mode, backend=name, **options)
+    if args.output:
+        write_report(results, args.output)
+    print(format_report(results), end="")
+    return 0
+
+
+def _replay(args: argparse.Namespace) -> int:
+    from uglyrag import SearchEngine
+    from uglyrag.querylog import read_log
+    from uglyrag.replay import find_saturation, replay
+
+    queries = read_log(args.logs)
+    if not queries:
+        print("查询日志为空")
+        return 1
+    reports = []
+    for qps in args.qps:
+        report = replay(
+            queries, SearchEngine.search, qps, args.concurrency, args.duration, args.arrival, args.vault, args.seed
+        )
+        print(report)
+        reports.append(report)
+    saturation = find_saturation(reports)
+    print(f"饱和点: {saturation:g} QPS" if saturation is not None else "所有档位均未饱和")
+    if args.output:
+        args.output.write_text(
+            json.dumps({"saturation_qps": saturation, "steps": [r.to_dict() for r in reports]}, indent=2),
+            encoding="utf-8",
+        )
+    return 1 if any(r.errors for r in reports) else 0
+
+
+def _mock_jina(args: argparse.Namespace) -> int:
+    from uglyrag.mock_jina import MockJinaServer
+
+    server = MockJinaServer(
+        args.host,
+        args.port,
+        dims=args.dims,
+        latency=args.latency,
+        latency_per_item=args.latency_per_item,
+        rpm=args.rpm,
+        tpm=args.tpm,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        max_bytes=args.max_bytes,
+        max_items=args.max_items,
+        seed=args.seed,
+    )
+    print(f"Jina 模拟服务: {server.url}，在配置文件的 [JINA] 中设置 url = {server.url} 即可使用")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(dict(server.stats))
+    return 0
+
+
+def _serve(args: argparse.Namespace) -> int:
+    import asyncio
+
+    from uglyrag import SearchEngine
+    from uglyrag.db_manager import DatabaseManager
+    from uglyrag.server import SearchServer, serve
+
+    if args.processes != 1:
+        from uglyrag.prefork import serve_prefork
+
+        serve_prefork(
+            args.host,
+            args.port,
+            args.processes,
+            args.workers,
+            args.read_connections if args.read_connections is not None else DatabaseManager._read_connections,
+            args.batch_size,
+            args.batch_wait_ms / 1000,
+            writer=not args.no_writer,
+        )
+        return 0
+    if args.read_connections is not None:
+        DatabaseManager.configure_readers(args.read_connections)
+    if args.warmup:
+        SearchEngine.warmup()
+    server = SearchServer(args.host, args.port, args.workers, args.batch_size, args.batch_wait_ms / 1000)
+    try:
+        asyncio.run(serve(server))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="uglyrag", description="UglyRAG 命令行工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest = subparsers.add_parser("ingest", help="从文件、目录或 glob 模式导入文档")
+    ingest.add_argument("paths", nargs="+", help="文件、目录或 glob 模式，如 'docs/**/*.md'")
+    ingest.add_argument("--vault", default=None, help="导入的存储库，默认为 SearchEngine.default_vault")
+    ingest.add_argument("--workers", type=int, default=None, help="并行读取文件的线程数")
+    ingest.add_argument("--force", action="store_true", help="忽略修改时间和大小，重新导入所有文件")
+    ingest.add_argument("--bulk-load", action="store_true", help="使用批量导入模式")
+    ingest.set_defaults(func=_ingest)
+
+    maintain = subparsers.add_parser("maintain", help="合并索引、回收空间并更新统计信息")
+    maintain.add_argument("--vault", default=None, help="维护的存储库，默认为 SearchEngine.default_vault")
+    maintain.add_argument("--offline", action="store_true", help="执行 VACUUM 等需要独占数据库的操作")
+    maintain.set_defaults(func=_maintain)
+
+    evaluation = subparsers.add_parser("eval", help="评估不同检索设置的召回率、nDCG 和延迟")
+    evaluation.add_argument("queries", type=Path, help="查询集文件，每行一个查询或一个 JSON 对象")
+    evaluation.add_argument("--vault", default=None, help="评估的存储库，默认为 SearchEngine.default_vault")
+    evaluation.add_argument(
+        "--db", type=Path, action="append", help="评估的数据库文件，可以指定多个，默认为配置的数据库"
+    )
+    evaluation.add_argument("--k", type=int, default=10, help="评估前 k 个结果")
+    evaluation.add_argument("--mode", nargs="+", choices=["vec", "hybrid", "rerank"], default=["vec", "hybrid"])
+    evaluation.add_argument(
+        "--sweep",
+        type=_parse_sweep,
+        action="append",
+        default=[],
+        help="扫描的参数，如 ef_search=16,64,256、m=8,16、rescore_factor=2,8、depth=10,50、rrf_k=10,60、weight_fts=0.5,1、"
+        "rerank_chars=256,1024、rerank_docs=10,20",
+    )
+    evaluation.add_argument("--output", type=Path, help="报告文件，.json 为 JSON，其他为 Markdown")
+    evaluation.set_defaults(func=_eval)
+
+    replay = subparsers.add_parser("replay", help="按目标 QPS 开环回放查询日志，测量延迟和吞吐量")
+    replay.add_argument("logs", type=Path, nargs="+", help="查询日志文件")
+    replay.add_argument(
+        "--qps", type=lambda s: [float(v) for v in s.split(",")], default=[10.0], help="逗号分隔的目标 QPS，逐档回放"
+    )
+    replay.add_argument("--concurrency", type=int, default=8, help="执行查询的线程数")
+    replay.add_argument("--duration", type=float, default=0.0, help="每档回放的秒数，0 表示每个查询回放一次")
+    replay.add_argument("--arrival", choices=["poisson", "uniform"], default="poisson", help="查询到达的时间分布")
+    replay.add_argument("--vault", default=None, help="回放到指定的存储库，默认使用日志中记录的存储库")
+    replay.add_argument("--seed", type=int, default=None, help="到达时间的随机种子")
+    replay.add_argument("--output", type=Path, help="将结果写入 JSON 文件")
+    replay.set_defaults(func=_replay)
+
+    server = subparsers.add_parser("serve", help="启动 HTTP 搜索服务")
+    server.add_argument("--host", default="127.0.0.1")
+    server.add_argument("--port", type=int, default=8000)
+    server.add_argument("--workers", type=int, default=8, help="执行检索的线程数")
+    server.add_argument(
+        "--read-connections", type=int, default=None, help="数据库的查询连接数，默认使用 [SEARCH] read_connections"
+    )
+    server.add_argument("--batch-size", type=int, default=32, help="合并为一次向量模型调用的最大查询数")
+    server.add_argument("--batch-wait-ms", type=float, default=5.0, help="合并查询时最多等待的毫秒数")
+    server.add_argument("--warmup", action="store_true", help="启动时预先加载模块并打开存储库")
+    server.add_argument("--processes", type=int, default=1, help="查询进程数，大于 1 时使用多进程模式，0 表示 CPU 核数")
+    server.add_argument(
+        "--no-writer", action="store_true", help="多进程模式下不创建写入进程，数据库以 immutable 模式打开"
+    )
+    server.set_defaults(func=_serve)
+
+    mock_jina = subparsers.add_parser("mock-jina", help="启动本地的 Jina API 模拟服务，用于离线测试")
+    mock_jina.add_argument("--host", default="127.0.0.1")
+    mock_jina.add_argument("--port", type=int, default=8787)
+    mock_jina.add_argument("--dims", type=int, default=1024, help="请求中未指定 dimensions 时的向量维度")
+    mock_jina.add_argument("--latency", type=float, default=0.0, help="每个请求附加的耗时 (秒)")
+    mock_jina.add_argument("--latency-per-item", type=float, default=0.0, help="每个文本附加的耗时 (秒)")
+    mock_jina.add_argument("--rpm", type=int, default=0, help="每分钟的请求数上限，0 表示不限制")
+    mock_jina.add_argument("--tpm", type=int, default=0, help="每分钟的 token 数上限，0 表示不限制")
+    mock_jina.add_argument("--error-rate", type=float, default=0.0, help="随机返回错误的比例")
+    mock_jina.add_argument("--error-status", type=int, default=500, help="注入错误的状态码")
+    mock_jina.add_argument("--max-bytes", type=int, default=0, help="请求体的字节数上限，0 表示不限制")
+    mock_jina.add_argument("--max-items", type=int, default=2048, help="一次请求的文本数上限")
+    mock_jina.add_argument("--seed", type=int, default=None, help="注入错误的随机种子")
+    mock_jina.set_defaults(func=_mock_jina)
+    return parser
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.func(args)
@@ -27,7 +27,7 @@ class Config:
         try:
             # 读取配置文件
             self.config.read(self.config_path)
-            logging.debug(f"配置文件读取成功: {self.config_path}")
+            logging.debug("配置文件读取成功: %s", self.config_path)
         except FileNotFoundError:
             logging.warning(f"配置文件未找到: {self.config_path}")
         except configparser.Error as e:
@@ -49,19 +49,24 @@ class Config:
     def configure_logging(self) -> None:
         log_level = self.get("level", "LOGGING", "info")
         configure_basic_logging(log_level)
-        configure_file_logging(self.data_dir)
+        configure_file_logging(
+            self.data_dir,
+            log_level=self.get("file_level", "LOGGING", "info"),
+            max_bytes=int(self.get("max_bytes", "LOGGING", str(10 * 1024 * 1024))),
+            backup_count=int(self.get("backup_count", "LOGGING", "5")),
+        )
 
     def get(self, option: str, section: str = "DEFAULT", default: str = "") -> str:
         try:
             value = self.config.get(section, option)
-            logging.debug(f"从节 '{section}' 中获取选项 '{option}': {value}")
+            logging.debug("从节 '%s' 中获取选项 '%s': %s", section, option, value)
             return value
         except (configparser.NoSectionError, configparser.NoOptionError):
             if default:
-                logging.debug(f"节 '{section}' 中未找到选项 '{option}'，使用默认值: {default}")
+                logging.debug("节 '%s' 中未找到选项 '%s'，使用默认值: %s", section, option, default)
                 self.set(option, default, section)
             else:
-                logging.debug(f"节 '{section}' 中未找到选项 '{option}', 返回 \"\"")
+                logging.debug("节 '%s' 中未找到选项 '%s', 返回 \"\"", section, option)
             return default
 
     def set(self, option: str, value: str, section: str = "DEFAULT") -> None:
@@ -74,12 +79,12 @@ class Config:
 
         try:
             self.config.set(section, option, str(value))
-            logging.debug(f"在节 '{section}' 中设置选项 '{option}' 为: {value}")
+            logging.debug("在节 '%s' 中设置选项 '%s' 为: %s", section, option, value)
         except configparser.NoSectionError:
-            logging.debug(f"添加节 '{section}'")
+            logging.debug("添加节 '%s'", section)
             self.config.add_section(section)
             self.config.set(section, option, str(value))
-            logging.debug(f"在节 '{section}' 中设置选项 '{option}' 为: {value}")
+            logging.debug("在节 '%s' 中设置选项 '%s' 为: %s", section, option, value)
 
         self._changed = True  # 标记配置文件已更改
 
@@ -94,7 +99,7 @@ class Config:
         self.config_path.parent.mkdir(parents=True, exist_ok=True)
         with self.config_path.open("w") as configfile:
             self.config.write(configfile)
-            logging.debug(f"配置文件保存成功: {self.config_path}")
+            logging.debug("配置文件保存成功: %s", self.config_path)
 
         # 重置更改标志
         self._changed = False
@@ -102,7 +107,7 @@ class Config:
     # 注销 Config 实例时，保存配置文件
     def __del__(self) -> None:
         self.save()
-        logging.debug(f"{self.__class__.__name__} 实例正在被删除，配置已保存。")
+        logging.debug("%s 实例正在被删除，配置已保存。", self.__class__.__name__)
 
 
 config = Config()
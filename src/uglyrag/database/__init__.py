@@ -1,5 +1,5 @@
 from __future__ import annotations
 
-from .base import Database
+from .base import Database, MaintenanceReport
 
-__all__ = ["Database"]
+__all__ = ["Database", "MaintenanceReport"]
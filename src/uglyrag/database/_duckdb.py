@@ -1,41 +1,119 @@
 from __future__ import annotations
 
 import logging
+import time
+from array import array
+from collections.abc import Iterator
+from contextlib import contextmanager
 from dataclasses import dataclass, field
 from pathlib import Path
+from threading import Lock
+from types import TracebackType
 
 from duckdb import DuckDBPyConnection, Error, connect
 
-from .base import Database
+from .base import METADATA_TABLE, ConnectionPool, Database, MaintenanceReport, is_valid_vault_name
+
+
+@dataclass
+class _FTSState:
+    """
+    记录某个 vault 全文索引的状态
+    """
+
+    indexed: bool = False  # 全文索引是否已经建立
+    watermark: int = 0  # 已进入全文索引的最大 id
+    pending: int = 0  # 上次重建后新增或删除的行数
+    last_rebuild: float = field(default_factory=time.monotonic)
+
+    @property
+    def dirty(self) -> bool:
+        return self.pending > 0
 
 
 @dataclass
 class DuckDBDatabase(Database):
     conn: DuckDBPyConnection = field(init=False)
     DATABASE_FILE_EXTENSION: str = "ddb"
+    # 全文索引重建策略: immediate 每次写入后重建; deferred 仅标记为脏, 按阈值、时间间隔或查询时重建
+    fts_rebuild: str = "immediate"
+    fts_rebuild_threshold: int = 1000  # deferred 模式下累计多少行变更后重建
+    fts_rebuild_interval: float = 0.0  # deferred 模式下距上次重建多少秒后重建, 0 表示不按时间重建
+    fts_rebuild_on_query: bool = True  # 查询时发现索引为脏是否立即重建, 否则合并增量结果
+    hnsw_m: int = 16  # HNSW 索引每个节点的最大邻居数, 修改后需要重建索引
+    hnsw_ef_construction: int = 128  # 构建 HNSW 索引时的候选列表大小
+    hnsw_ef_search: int = 64  # 查询 HNSW 索引时的候选列表大小, 越大召回率越高、查询越慢
+    _fts_states: dict[str, _FTSState] = field(default_factory=dict, init=False)
+    _fts_lock: Lock = field(default_factory=Lock, init=False)
+    _pool: ConnectionPool[DuckDBPyConnection] | None = field(default=None, init=False)
 
     def __post_init__(self) -> None:
         super().__post_init__()
+        if self.fts_rebuild not in ("immediate", "deferred"):
+            raise ValueError(f"不支持的全文索引重建策略: {self.fts_rebuild}")
         self.conn = self._connect_db(self.db_path)
+        self._open_pool()
+
+    def _open_pool(self) -> None:
+        if self.read_connections > 0:
+            self._pool = ConnectionPool(self._connect_reader, self.read_connections)
+
+    def _connect_reader(self) -> DuckDBPyConnection:
+        # cursor 是共享同一个数据库实例的独立连接，hnsw_ef_search 是连接级别的设置
+        conn = self.conn.cursor()
+        conn.execute(f"SET hnsw_ef_search = {int(self.hnsw_ef_search)}")
+        return conn
+
+    @contextmanager
+    def _reader(self) -> Iterator[DuckDBPyConnection]:
+        """
+        查询使用的连接。未开启连接池时与写入共用一个连接，查询需要持有锁，
+        避免与后台索引线程写入的批次同时使用连接
+        """
+        if self._pool is None:
+            with self._lock:
+                yield self.conn
+            return
+        with self._pool.connection() as conn:
+            yield conn
+
+    def __enter__(self) -> Database:
+        self._lock.acquire()
+        return super().__enter__()
+
+    def __exit__(
+        self, exc_type: type[BaseException] | None, exc_val: BaseException | None, exc_tb: TracebackType | None
+    ) -> None:
+        super().__exit__(exc_type, exc_val, exc_tb)
+        self._lock.release()
 
     def reset(self) -> None:
         """
         重置数据库
         """
         super().reset()
+        if self._pool is not None:
+            self._pool.reset()
         self.conn.close()
+        self._fts_states.clear()
         self.conn = self._connect_db(self.db_path)
+        self._open_pool()
 
     def _connect_db(self, db_path: Path) -> DuckDBPyConnection:
         # 连接到 DuckDB 数据库
         try:
-            conn = connect(db_path, config={"hnsw_enable_experimental_persistence": 1})
-            logging.debug(f"已连接到数据库: {db_path}")
+            conn = connect(db_path, read_only=self.read_only, config={"hnsw_enable_experimental_persistence": 1})
+            logging.debug("已连接到数据库: %s", db_path)
         except Error as e:
             logging.error(f"连接数据库失败: {e}")
             raise
 
         self._init_conn(conn)
+        # 存储库元数据
+        if not self.read_only:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {METADATA_TABLE} (vault TEXT NOT NULL, key TEXT NOT NULL, value TEXT, PRIMARY KEY (vault, key))"
+            )
         return conn
 
     def _init_conn(self, conn: DuckDBPyConnection) -> None:
@@ -49,42 +127,60 @@ class DuckDBDatabase(Database):
             conn.install_extension("vss")
             conn.load_extension("vss")
             logging.debug("DuckDB 扩展 `vss` 安装成功")
+            conn.execute(f"SET hnsw_ef_search = {int(self.hnsw_ef_search)}")
         except Error as e:
             logging.error(f"安装 DuckDB 扩展失败: {e}")
             raise
 
-    def _check_vault(self, vault: str) -> bool:
+    def has_vault(self, vault: str) -> bool:
+        return (
+            self.conn.execute("SELECT 1 FROM information_schema.tables WHERE table_name=?", (vault,)).fetchone()
+            is not None
+        )
+
+    def _check_vault(self, vault: str, dims: int = 0) -> bool:
         """
         检查数据库是否存在，不存在则创建
         """
-        if vault.endswith("_fts") or vault.endswith("_vec"):
-            logging.warning(f"表名 {vault} 结尾为 _fts 或 _vec，将无法使用。")
+        if not is_valid_vault_name(vault):
+            logging.warning(f"存储库名称 {vault!r} 无效，只能包含字母、数字和下划线，且不能以 _fts 或 _vec 结尾。")
             return False
         try:
-            self.conn.execute(f"SELECT * FROM information_schema.tables WHERE table_name='{vault}'")
-            if not bool(self.conn.fetchone()):
-                self._create_vault(vault)
+            if not self.has_vault(vault):
+                if self.read_only:
+                    logging.error(f"存储库 {vault} 不存在，只读模式下不能创建")
+                    return False
+                self._create_vault(vault, dims)
+            else:
+                self._check_metadata(vault)
             return True
         except Error as e:
             logging.error(f"检查或创建表失败: {e}")
             return False
 
-    def _create_vault(self, vault: str) -> None:
+    def _create_vault(self, vault: str, dims: int = 0) -> None:
+        dims = self._create_metadata(vault, dims)
         with self.conn.cursor() as cursor:
             # 创建表
             # 创建数据表
             cursor.execute(
-                f"CREATE TABLE IF NOT EXISTS {vault} (id INTEGER PRIMARY KEY, content TEXT NOT NULL, content_fts TEXT NOT NULL, content_vec FLOAT[{self.dims}], part_id TEXT, source TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+                f"CREATE TABLE IF NOT EXISTS {vault} (id INTEGER PRIMARY KEY, content TEXT NOT NULL, content_fts TEXT NOT NULL, content_vec FLOAT[{dims}], part_id TEXT, source TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
             )
             # 创建自增ID列
             cursor.execute("CREATE SEQUENCE seq_id START 1;")
             # 创建向量搜索索引
-            cursor.execute(f"CREATE INDEX {vault}_vec_index ON {vault} USING HNSW (content_vec);")
+            self._create_vec_index(cursor, vault)
+
+    def _embed(self, text: str, vault: str) -> list[float]:
+        # DuckDB 不接受 array 类型的参数，array('f') 的向量转换为列表
+        vector = super()._embed(text, vault)
+        return list(vector) if isinstance(vector, array) else vector
 
     def insert_data(self, data: list[tuple[str, str, str]], vault: str) -> None:
         """
         插入数据
         """
+        self._check_writable()
         new_data = []
         if not data:
             raise Exception("No content to insert")
@@ -95,7 +191,7 @@ class DuckDBDatabase(Database):
                 else:
                     source, part_id, content = doc
                     content_fts = " ".join(self.segment(content))
-                    content_vec = self.embedding(content)
+                    content_vec = self._embed(content, vault)
                     new_doc = (source, part_id, content, content_fts, content_vec)
                     new_data.append(new_doc)
         with self.conn.cursor() as cursor:
@@ -104,13 +200,121 @@ class DuckDBDatabase(Database):
                 new_data,
             )
             logging.debug("已插入数据")
+        self._get_fts_state(vault).pending += len(new_data)
+
+    def get_metadata(self, vault: str) -> dict[str, str]:
+        rows = self.conn.execute(f"SELECT key, value FROM {METADATA_TABLE} WHERE vault=?", (vault,)).fetchall()
+        return dict(rows)
+
+    def set_metadata(self, vault: str, values: dict[str, str]) -> None:
+        self._check_writable()
+        self.conn.executemany(
+            f"INSERT OR REPLACE INTO {METADATA_TABLE} (vault, key, value) VALUES (?, ?, ?)",
+            [(vault, key, value) for key, value in values.items()],
+        )
 
-    def rebuild_index(self, vault: str) -> None:
+    def rebuild_index(self, vault: str, force: bool = False) -> None:
         """
         重建全文搜索索引
+
+        deferred 模式下只有在累计变更达到阈值、距上次重建超过时间间隔或 force 为 True 时才会真正重建
         """
+        state = self._get_fts_state(vault)
+        if force or self.fts_rebuild == "immediate" or self._should_rebuild(state):
+            self._rebuild_fts_index(vault)
+        else:
+            logging.debug("延迟重建 %s 的全文索引, 待处理变更: %s", vault, state.pending)
+
+    def _should_rebuild(self, state: _FTSState) -> bool:
+        if not state.dirty:
+            return False
+        if state.pending >= self.fts_rebuild_threshold:
+            return True
+        return self.fts_rebuild_interval > 0 and time.monotonic() - state.last_rebuild >= self.fts_rebuild_interval
+
+    def _rebuild_fts_index(self, vault: str) -> None:
+        with self._fts_lock:
+            with self.conn.cursor() as cursor:
+                cursor.execute(f"PRAGMA create_fts_index({vault}, id, content_fts, overwrite = 1)")
+                result = cursor.execute(f"SELECT max(id) FROM {vault}").fetchone()
+            self._fts_states[vault] = _FTSState(indexed=True, watermark=(result[0] or 0) if result else 0)
+            logging.debug("已重建 %s 的全文索引", vault)
+
+    def _get_fts_state(self, vault: str) -> _FTSState:
+        """
+        获取全文索引状态, 首次访问时根据已有索引推算水位线, 以便进程重启后仍能识别未被索引的数据
+        """
+        if vault in self._fts_states:
+            return self._fts_states[vault]
+        with self.conn.cursor() as cursor:
+            try:
+                result = cursor.execute(f"SELECT max(name) FROM fts_main_{vault}.docs").fetchone()
+                indexed, watermark = True, (result[0] or 0) if result else 0
+            except Error:
+                indexed, watermark = False, 0  # 尚未建立全文索引
+            result = cursor.execute(f"SELECT count(*) FROM {vault} WHERE id > ?", (watermark,)).fetchone()
+        state = _FTSState(indexed=indexed, watermark=watermark, pending=result[0] if result else 0)
+        self._fts_states[vault] = state
+        return state
+
+    def sample_contents(self, vault: str, n: int = 5) -> list[str]:
+        rows = self.conn.execute(f"SELECT content FROM {vault} ORDER BY random() LIMIT ?", (n,)).fetchall()
+        return [row[0] for row in rows]
+
+    def maintain(self, vault: str, online: bool = True) -> MaintenanceReport:
+        """
+        维护存储库
+
+        全文索引为脏时重建，压缩 HNSW 索引中已删除的节点，更新统计信息并执行 CHECKPOINT。
+        在线模式使用普通 CHECKPOINT，有其他事务时会跳过；离线模式使用 FORCE CHECKPOINT。
+        DuckDB 不会收缩数据库文件，释放的块会被后续写入复用。
+        """
+        self._check_writable()
+        report = MaintenanceReport(vault, online, bytes_before=self.file_size())
+        state = self._get_fts_state(vault)
+        if not state.indexed or state.dirty:
+            self._rebuild_fts_index(vault)
+            report.steps.append("重建全文索引")
         with self.conn.cursor() as cursor:
-            cursor.execute(f"PRAGMA create_fts_index({vault}, id, content_fts, overwrite = 1)")
+            cursor.execute(f"PRAGMA hnsw_compact_index('{vault}_vec_index')")
+            report.steps.append("HNSW compact")
+            try:
+                cursor.execute("ANALYZE")
+                report.steps.append("ANALYZE")
+            except Error as e:
+                logging.warning(f"ANALYZE 失败: {e}")
+            cursor.execute("CHECKPOINT" if online else "FORCE CHECKPOINT")
+            report.steps.append("CHECKPOINT" if online else "FORCE CHECKPOINT")
+        report.bytes_after = self.file_size()
+        return report
+
+    def _create_vec_index(self, cursor: DuckDBPyConnection, vault: str) -> None:
+        cursor.execute(
+            f"CREATE INDEX {vault}_vec_index ON {vault} USING HNSW (content_vec) "
+            f"WITH (M = {int(self.hnsw_m)}, ef_construction = {int(self.hnsw_ef_construction)});"
+        )
+
+    def search_options(self) -> dict[str, int]:
+        return {"m": self.hnsw_m, "ef_construction": self.hnsw_ef_construction, "ef_search": self.hnsw_ef_search}
+
+    def set_search_options(self, vault: str, **options: int) -> None:
+        """
+        ef_search 立即生效；m 和 ef_construction 改变时会重建存储库的 HNSW 索引
+        """
+        super().set_search_options(vault, **options)
+        if "ef_search" in options:
+            self.hnsw_ef_search = options["ef_search"]
+            self.conn.execute(f"SET hnsw_ef_search = {int(self.hnsw_ef_search)}")
+            if self._pool is not None:
+                self._pool.reset()
+        m = options.get("m", self.hnsw_m)
+        ef_construction = options.get("ef_construction", self.hnsw_ef_construction)
+        if (m, ef_construction) != (self.hnsw_m, self.hnsw_ef_construction):
+            self.hnsw_m, self.hnsw_ef_construction = m, ef_construction
+            with self.conn.cursor() as cursor:
+                cursor.execute(f"DROP INDEX IF EXISTS {vault}_vec_index")
+                self._create_vec_index(cursor, vault)
+            logging.info(f"已按 M={m}, ef_construction={ef_construction} 重建存储库 {vault} 的 HNSW 索引")
 
     def check_source(self, source: str, vault: str) -> bool:
         """
@@ -124,9 +328,11 @@ class DuckDBDatabase(Database):
         """
         删除特定来源的数据
         """
+        self._check_writable()
         try:
             with self.conn.cursor() as cursor:
                 cursor.execute(f"DELETE FROM {vault} WHERE source=?", (source,))
+            self._get_fts_state(vault).pending += 1
             return True
         except Error as e:
             logging.error(f"删除数据失败: {e}")
@@ -139,11 +345,39 @@ class DuckDBDatabase(Database):
         :param vault: 存储库名称
         :param top_n: 返回结果数量
         """
-        self.conn.execute(
-            f"SELECT id, content FROM (SELECT *, fts_main_{vault}.match_bm25(id, ?) AS score FROM {vault}) WHERE score IS NOT NULL ORDER BY score DESC LIMIT ?",
-            (" ".join(self.segment(query)), top_n),
-        )
-        return self.conn.fetchall()
+        state = self._get_fts_state(vault)
+        words = self.segment(query)
+        if self.read_only:
+            # 只读模式下不能重建索引, 尚未被索引的数据只通过增量检索查询
+            if not state.indexed:
+                with self._reader() as conn:
+                    return self._search_fts_delta(conn, words, vault, state.watermark, top_n)
+        elif not state.indexed or state.dirty and (self.fts_rebuild_on_query or self._should_rebuild(state)):
+            # 重建索引使用写入连接，需要等待正在写入的批次完成
+            with self._lock:
+                self._rebuild_fts_index(vault)
+            state = self._get_fts_state(vault)
+        with self._reader() as conn:
+            results = conn.execute(
+                f"SELECT id, content FROM (SELECT *, fts_main_{vault}.match_bm25(id, ?) AS score FROM {vault}) WHERE score IS NOT NULL ORDER BY score DESC LIMIT ?",
+                (" ".join(words), top_n),
+            ).fetchall()
+            if not state.dirty:
+                return results
+            # 索引为脏时, 尚未被索引的增量数据按命中词数排序后与索引结果交替合并
+            delta = self._search_fts_delta(conn, words, vault, state.watermark, top_n)
+        return _interleave(results, delta, top_n)
+
+    @staticmethod
+    def _search_fts_delta(
+        conn: DuckDBPyConnection, words: list[str], vault: str, watermark: int, top_n: int
+    ) -> list[tuple[str, str]]:
+        if not words:
+            return []
+        return conn.execute(
+            f"SELECT id, content FROM (SELECT id, content, len(list_intersect(string_split(content_fts, ' '), ?::VARCHAR[])) AS hits FROM {vault} WHERE id > ?) WHERE hits > 0 ORDER BY hits DESC, id LIMIT ?",
+            (words, watermark, top_n),
+        ).fetchall()
 
     def _background_search_vec(self, query: str, vault: str, top_n: int = 5) -> list[tuple[str, str]]:
         """
@@ -152,8 +386,28 @@ class DuckDBDatabase(Database):
         :param vault: 存储库名称
         :param top_n: 返回结果数量
         """
-        self.conn.execute(
-            f"SELECT {vault}.id, {vault}.content FROM {vault} ORDER BY array_distance(content_vec, ?::FLOAT[{self.dims}]) LIMIT ?",
-            (self.embedding(query), top_n),
-        )
-        return self.conn.fetchall()
+        vector = self._embed(query, vault)
+        with self._reader() as conn:
+            return conn.execute(
+                f"SELECT {vault}.id, {vault}.content FROM {vault} ORDER BY array_distance(content_vec, ?::FLOAT[{self.vault_dims(vault)}]) LIMIT ?",
+                (vector, top_n),
+            ).fetchall()
+
+    def _exact_search_vec(self, query: str, vault: str, top_n: int = 5) -> list[tuple[str, str]]:
+        # 排序表达式不是单独的 array_distance 时不会使用 HNSW 索引，而是扫描全表
+        vector = self._embed(query, vault)
+        with self._reader() as conn:
+            return conn.execute(
+                f"SELECT {vault}.id, {vault}.content FROM {vault} ORDER BY array_distance(content_vec, ?::FLOAT[{self.vault_dims(vault)}]) + 0 LIMIT ?",
+                (vector, top_n),
+            ).fetchall()
+
+
+def _interleave(first: list[tuple[str, str]], second: list[tuple[str, str]], top_n: int) -> list[tuple[str, str]]:
+    """交替合并两个结果列表并去重"""
+    merged: dict[str, str] = {}
+    for i in range(max(len(first), len(second))):
+        for results in (first, second):
+            if i < len(results):
+                merged.setdefault(results[i][0], results[i][1])
+    return list(merged.items())[:top_n]
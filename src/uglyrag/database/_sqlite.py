@@ -2,20 +2,46 @@ from __future__ import annotations
 
 import logging
 import sqlite3
+from array import array
+from collections.abc import Iterator
+from contextlib import contextmanager
 from dataclasses import dataclass, field
 from pathlib import Path
-from sqlite3 import Connection, Error
+from sqlite3 import Connection, Cursor, Error
 from types import TracebackType
 
 import sqlite_vec
 from sqlite_vec import serialize_float32
 
-from .base import Database
+from uglyrag.utils import truncate_embedding
+
+from .base import METADATA_TABLE, ConnectionPool, Database, MaintenanceReport, is_valid_vault_name
+
+# 各量化方式对应的向量列类型和量化函数
+VEC_COLUMN_TYPES = {"none": "FLOAT", "int8": "INT8", "binary": "BIT"}
+QUANTIZE_FUNCTIONS = {"none": "{}", "int8": "vec_quantize_int8({}, 'unit')", "binary": "vec_quantize_binary({})"}
+
+
+def serialize_embedding(vector: list[float]) -> bytes:
+    """序列化为 sqlite-vec 使用的 float32 字节，array('f') (如 Jina 的 base64 向量) 直接复制内存"""
+    if isinstance(vector, array) and vector.typecode == "f":
+        return vector.tobytes()
+    return serialize_float32(vector)
 
 
 @dataclass
 class SQLiteDatebase(Database):
     conn: Connection = field(init=False)
+    bulk_synchronous: str = "OFF"  # 批量导入模式下的 synchronous 设置, 可选 OFF 或 NORMAL
+    fts_automerge: int = 4  # FTS5 的 automerge 参数
+    vec_compact_ratio: float = 0.5  # 向量表的有效行占比低于该值时在离线维护中重建
+    maintenance_step_pages: int = 256  # 在线维护每一步合并或回收的页数
+    vec_quantization: str = "none"  # 新建存储库的向量量化方式, 可选 none, int8 或 binary
+    vec_rescore_factor: int = 4  # 量化向量检索时召回 top_n 的倍数作为候选, 再用原始向量重新排序
+    immutable: bool = False  # 只读模式下声明数据库文件不会被修改, 跳过加锁和变更检测, 不能与写入进程同时使用
+    _bulk_vaults: set[str] = field(default_factory=set, init=False)
+    _vec_quantizations: dict[str, str] = field(default_factory=dict, init=False)
+    _pool: ConnectionPool[Connection] | None = field(default=None, init=False)
 
     def __post_init__(self) -> None:
         """
@@ -24,8 +50,31 @@ class SQLiteDatebase(Database):
         此方法在类实例化后调用，用于初始化与SQLite数据库的连接，
         并配置必要的数据库扩展和函数。
         """
+        if self.vec_quantization not in QUANTIZE_FUNCTIONS:
+            raise ValueError(f"不支持的向量量化方式: {self.vec_quantization}")
         super().__post_init__()
         self.conn = self._connect_db(self.db_path)
+        self._open_pool()
+
+    def _open_pool(self) -> None:
+        if self.read_connections > 0:
+            if not self.read_only:
+                # WAL 模式下查询连接读取时不会阻塞写入
+                self.conn.execute("PRAGMA journal_mode=WAL")
+            self._pool = ConnectionPool(lambda: self._connect_db(self.db_path), self.read_connections)
+
+    @contextmanager
+    def _reader(self) -> Iterator[Connection]:
+        """
+        查询使用的连接。未开启连接池时与写入共用一个连接，查询需要持有锁，
+        避免与后台索引线程写入的批次交错执行，或读到尚未提交的数据
+        """
+        if self._pool is None:
+            with self._lock:
+                yield self.conn
+            return
+        with self._pool.connection() as conn:
+            yield conn
 
     def __enter__(self) -> Database:
         self._lock.acquire()
@@ -43,8 +92,12 @@ class SQLiteDatebase(Database):
         重置数据库
         """
         super().reset()
+        self._vec_quantizations.clear()
+        if self._pool is not None:
+            self._pool.reset()
         self.conn.close()
         self.conn = self._connect_db(self.db_path)
+        self._open_pool()
 
     def _connect_db(self, db_path: Path) -> Connection:
         """
@@ -52,8 +105,12 @@ class SQLiteDatebase(Database):
         """
         # 连接到 SQLite 数据库
         try:
-            conn = sqlite3.connect(db_path, check_same_thread=False)
-            logging.debug(f"已连接到数据库: {db_path}")
+            if self.read_only:
+                uri = f"{db_path.resolve().as_uri()}?{'immutable=1' if self.immutable else 'mode=ro'}"
+                conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            else:
+                conn = sqlite3.connect(db_path, check_same_thread=False)
+            logging.debug("已连接到数据库: %s", db_path)
         except Error as e:
             logging.error(f"连接数据库失败: {e}")
             raise
@@ -90,11 +147,23 @@ class SQLiteDatebase(Database):
 
         # 注册一个名为"embedding"的SQL函数，用于生成文本的嵌入表示
         def embedding_func(x: str) -> bytes:
-            return serialize_float32(self.embedding(x))
+            return serialize_embedding(self.embedding(x))
+
+        # 带维度参数的版本，截断到存储库使用的维度
+        def truncated_embedding_func(x: str, dims: int) -> bytes:
+            return serialize_embedding(truncate_embedding(self.embedding(x), dims))
 
         conn.create_function("embedding", 1, embedding_func)
+        conn.create_function("embedding", 2, truncated_embedding_func)
         logging.debug("SQL函数 `embedding` 注册成功")
 
+        # 存储库元数据
+        if not self.read_only:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {METADATA_TABLE} (vault TEXT NOT NULL, key TEXT NOT NULL, value TEXT, PRIMARY KEY (vault, key))"
+            )
+            conn.commit()
+
     @staticmethod
     def _check_versions(conn: Connection) -> tuple[str, str]:
         """
@@ -103,27 +172,36 @@ class SQLiteDatebase(Database):
         """
         try:
             sqlite_version, vec_version = conn.execute("SELECT sqlite_version(), vec_version()").fetchone()
-            logging.debug(f"SQLite版本：{sqlite_version}, sqlite_vec 版本：{vec_version}")
+            logging.debug("SQLite版本：%s, sqlite_vec 版本：%s", sqlite_version, vec_version)
             return sqlite_version, vec_version
         except Error as e:
             logging.error(f"执行 SQL 失败: {e}")
             raise
 
-    def _check_vault(self, vault: str) -> bool:
-        cursor = self.conn.cursor()
-        if vault.endswith("_fts") or vault.endswith("_vec"):
-            logging.warning(f"表名 {vault} 结尾为 _fts 或 _vec，将无法使用。")
+    def has_vault(self, vault: str) -> bool:
+        cursor = self.conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (vault,))
+        return cursor.fetchone() is not None
+
+    def _check_vault(self, vault: str, dims: int = 0) -> bool:
+        if not is_valid_vault_name(vault):
+            logging.warning(f"存储库名称 {vault!r} 无效，只能包含字母、数字和下划线，且不能以 _fts 或 _vec 结尾。")
             return False
         try:
-            cursor.execute(f"SELECT name FROM sqlite_master WHERE type='table' AND name='{vault}'")
-            if not bool(cursor.fetchone()):
-                self._create_vault(vault, self.conn)
+            if not self.has_vault(vault):
+                if self.read_only:
+                    logging.error(f"存储库 {vault} 不存在，只读模式下不能创建")
+                    return False
+                self._create_vault(vault, self.conn, dims)
+            else:
+                self._check_metadata(vault)
+                if not self.read_only and not self._is_external_fts(vault):
+                    self._migrate_fts(vault)
             return True
         except Error as e:
             logging.error(f"检查或创建表失败: {e}")
             return False
 
-    def _create_vault(self, vault: str, conn: Connection) -> None:
+    def _create_vault(self, vault: str, conn: Connection, dims: int = 0) -> None:
         cursor = conn.cursor()
         # 创建表
         # 创建数据表
@@ -131,33 +209,328 @@ class SQLiteDatebase(Database):
             f"CREATE TABLE IF NOT EXISTS {vault} (id INTEGER PRIMARY KEY AUTOINCREMENT, content TEXT NOT NULL, part_id TEXT, source TEXT, created_at DATETIME DEFAULT CURRENT_TIMESTAMP);"
         )
         # 创建全文搜索表
-        cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {vault}_fts USING fts5(indexed_content);")
-        # 创建向量搜索表
-        cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {vault}_vec USING vec0(embedding FLOAT[{self.dims}]);")
+        self._create_fts(vault, cursor)
+        # 创建向量搜索表, 使用量化向量时原始向量保存在 {vault}_vec_full 中用于重新排序
+        quantization = self.vec_quantization
+        dims = self._create_metadata(vault, dims)
+        if quantization == "binary" and dims % 8:
+            raise ValueError(f"二值量化要求向量维度是 8 的倍数, 当前维度为 {dims}")
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {vault}_vec USING vec0(embedding {VEC_COLUMN_TYPES[quantization]}[{dims}]);"
+        )
+        if quantization != "none":
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {vault}_vec_full (id INTEGER PRIMARY KEY, embedding BLOB NOT NULL);"
+            )
+        self._vec_quantizations[vault] = quantization
 
         # 创建触发器保持表同步
+        self._create_triggers(vault, cursor)
+        self.conn.commit()
+
+    @staticmethod
+    def _create_fts(vault: str, cursor: Cursor) -> None:
+        """
+        创建外部内容的全文搜索表。
+
+        索引的内容来自视图 {vault}_fts_content，由 {vault} 的原文实时分词得到，全文搜索表只保存倒排索引，
+        不再额外保存一份分词后的文本。删除和更新时需要用相同的分词结果从索引中移除旧的词条，
+        因此元数据中记录了分词函数，打开存储库时发现分词函数改变会重建索引 (见 _segment_changed)。
+        """
+        cursor.execute(
+            f"CREATE VIEW IF NOT EXISTS {vault}_fts_content AS SELECT id, segment(content) AS indexed_content FROM {vault};"
+        )
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {vault}_fts USING fts5(indexed_content, content='{vault}_fts_content', content_rowid='id');"
+        )
+
+    def _segment_changed(self, vault: str, recorded: str, current: str) -> None:
+        """
+        外部内容表删除词条时按当前的分词函数重新分词，与写入时的分词结果不同会破坏索引，
+        因此分词函数改变后立即按原文重建全文索引；只读模式下不能重建，拒绝打开存储库
+        """
+        if self.read_only:
+            raise Error(f"存储库 {vault} 的分词函数已从 {recorded} 变为 {current}，只读模式下无法重建全文索引")
+        logging.warning(f"存储库 {vault} 的分词函数已从 {recorded} 变为 {current}，重建全文索引...")
+        if self._is_external_fts(vault):
+            self.rebuild_index(vault, force=True)
+        self.set_metadata(vault, self.segment_info)
+
+    def _is_external_fts(self, vault: str) -> bool:
+        row = self.conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (f"{vault}_fts",)
+        ).fetchone()
+        return row is not None and "content=" in row[0].replace(" ", "")
+
+    def _migrate_fts(self, vault: str) -> None:
+        """
+        将旧版本保存分词文本的全文搜索表迁移为外部内容表，迁移时根据原文重新分词建立索引
+        """
+        logging.info(f"迁移 {vault} 的全文搜索表为外部内容表...")
+        self.conn.commit()
+        try:
+            self.conn.execute("BEGIN")
+            cursor = self.conn.cursor()
+            for trigger in ("ai", "ad", "au"):
+                cursor.execute(f"DROP TRIGGER IF EXISTS {vault}_{trigger}")
+            cursor.execute(f"DROP TABLE IF EXISTS {vault}_fts")
+            self._create_fts(vault, cursor)
+            cursor.execute(f"INSERT INTO {vault}_fts({vault}_fts) VALUES('rebuild')")
+            self._create_triggers(vault, cursor)
+            self.conn.commit()
+        except Error:
+            self.conn.rollback()
+            raise
+        logging.info(f"{vault} 的全文搜索表迁移完成")
+
+    def _create_triggers(self, vault: str, cursor: Cursor) -> None:
+        dims = self.vault_dims(vault)
+        if self._get_quantization(vault) == "none":
+            vec_insert = f"INSERT INTO {vault}_vec(rowid, embedding) VALUES (new.id, embedding(new.content, {dims}));"
+            vec_delete = f"DELETE FROM {vault}_vec WHERE rowid = old.id;"
+            vec_update = f"UPDATE {vault}_vec SET embedding = embedding(new.content, {dims}) WHERE rowid = new.id;"
+        else:
+            # 触发器中 INSERT ... SELECT 会丢失量化函数结果的向量类型, 因此用子查询读取原始向量
+            quantized = self._quantize_sql(vault, f"(SELECT embedding FROM {vault}_vec_full WHERE id = new.id)")
+            vec_insert = (
+                f"INSERT INTO {vault}_vec_full(id, embedding) VALUES (new.id, embedding(new.content, {dims}));"
+                f"INSERT INTO {vault}_vec(rowid, embedding) VALUES (new.id, {quantized});"
+            )
+            vec_delete = f"DELETE FROM {vault}_vec WHERE rowid = old.id;DELETE FROM {vault}_vec_full WHERE id = old.id;"
+            vec_update = (
+                f"UPDATE {vault}_vec_full SET embedding = embedding(new.content, {dims}) WHERE id = new.id;"
+                f"DELETE FROM {vault}_vec WHERE rowid = new.id;"
+                f"INSERT INTO {vault}_vec(rowid, embedding) VALUES (new.id, {quantized});"
+            )
         cursor.execute(
             f"CREATE TRIGGER IF NOT EXISTS {vault}_ai AFTER INSERT ON {vault} BEGIN "
             f"INSERT INTO {vault}_fts(rowid, indexed_content) VALUES (new.id, segment(new.content));"
-            f"INSERT INTO {vault}_vec(rowid, embedding) VALUES (new.id, embedding(new.content));"
+            f"{vec_insert}"
             f"END;"
         )
         cursor.execute(
             f"CREATE TRIGGER IF NOT EXISTS {vault}_ad AFTER DELETE ON {vault} BEGIN "
-            f"DELETE FROM {vault}_fts WHERE rowid = old.id;"
-            f"DELETE FROM {vault}_vec WHERE rowid = old.id;"
+            f"INSERT INTO {vault}_fts({vault}_fts, rowid, indexed_content) VALUES('delete', old.id, segment(old.content));"
+            f"{vec_delete}"
             f"END;"
         )
         cursor.execute(
             f"CREATE TRIGGER IF NOT EXISTS {vault}_au AFTER UPDATE ON {vault} BEGIN "
-            f"UPDATE {vault}_fts SET indexed_content = segment(new.content) WHERE rowid = new.id;"
-            f"UPDATE {vault}_vec SET embedding = embedding(new.content) WHERE rowid = new.id;"
+            f"INSERT INTO {vault}_fts({vault}_fts, rowid, indexed_content) VALUES('delete', old.id, segment(old.content));"
+            f"INSERT INTO {vault}_fts(rowid, indexed_content) VALUES (new.id, segment(new.content));"
+            f"{vec_update}"
             f"END;"
         )
+
+    def _get_quantization(self, vault: str) -> str:
+        """
+        存储库的向量量化方式，由向量表的列类型决定，与当前的 vec_quantization 设置无关
+        """
+        if vault not in self._vec_quantizations:
+            row = self.conn.execute(
+                "SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (f"{vault}_vec",)
+            ).fetchone()
+            sql = row[0].upper() if row else ""
+            self._vec_quantizations[vault] = next(
+                (name for name, column in VEC_COLUMN_TYPES.items() if name != "none" and f" {column}[" in sql),
+                "none",
+            )
+        return self._vec_quantizations[vault]
+
+    def _quantize_sql(self, vault: str, expr: str) -> str:
+        return QUANTIZE_FUNCTIONS[self._get_quantization(vault)].format(expr)
+
+    @contextmanager
+    def bulk_load(self, vault: str) -> Iterator[None]:
+        """
+        批量导入模式。
+
+        切换到 WAL 日志和较低的 synchronous 级别, 删除插入触发器并关闭 FTS5 的自动合并,
+        插入的数据在每批结束时统一写入全文索引和向量索引。退出时恢复触发器与原有设置, 并对全文索引执行 optimize。
+        """
+        self._check_writable()
+        with self._lock:
+            self.conn.commit()
+            journal_mode = self.conn.execute("PRAGMA journal_mode").fetchone()[0]
+            synchronous = self.conn.execute("PRAGMA synchronous").fetchone()[0]
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(f"PRAGMA synchronous={self.bulk_synchronous}")
+            self.conn.execute(f"DROP TRIGGER IF EXISTS {vault}_ai")
+            self.conn.execute(f"INSERT INTO {vault}_fts({vault}_fts, rank) VALUES('automerge', 0)")
+            self.conn.commit()
+            self._bulk_vaults.add(vault)
+            logging.debug("%s 进入批量导入模式", vault)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._bulk_vaults.discard(vault)
+                self.conn.commit()
+                cursor = self.conn.cursor()
+                self._create_triggers(vault, cursor)
+                cursor.execute(
+                    f"INSERT INTO {vault}_fts({vault}_fts, rank) VALUES('automerge', ?)", (self.fts_automerge,)
+                )
+                cursor.execute(f"INSERT INTO {vault}_fts({vault}_fts) VALUES('optimize')")
+                self.conn.commit()
+                self.conn.execute(f"PRAGMA synchronous={synchronous}")
+                self.conn.execute(f"PRAGMA journal_mode={journal_mode}")
+                logging.debug("%s 退出批量导入模式", vault)
+
+    def get_metadata(self, vault: str) -> dict[str, str]:
+        rows = self.conn.execute(f"SELECT key, value FROM {METADATA_TABLE} WHERE vault=?", (vault,)).fetchall()
+        return dict(rows)
+
+    def set_metadata(self, vault: str, values: dict[str, str]) -> None:
+        self._check_writable()
+        self.conn.executemany(
+            f"INSERT OR REPLACE INTO {METADATA_TABLE} (vault, key, value) VALUES (?, ?, ?)",
+            [(vault, key, value) for key, value in values.items()],
+        )
         self.conn.commit()
 
+    def rebuild_index(self, vault: str, force: bool = False) -> None:
+        """
+        全文索引由触发器实时维护，只有 force 为 True 时才根据原文重新分词并重建索引
+        """
+        if force:
+            self.conn.execute(f"INSERT INTO {vault}_fts({vault}_fts) VALUES('rebuild')")
+            self.conn.commit()
+            logging.debug("%s 的全文索引已重建", vault)
+
+    def sample_contents(self, vault: str, n: int = 5) -> list[str]:
+        rows = self.conn.execute(f"SELECT content FROM {vault} ORDER BY random() LIMIT ?", (n,)).fetchall()
+        return [row[0] for row in rows]
+
+    def maintain(self, vault: str, online: bool = True) -> MaintenanceReport:
+        """
+        维护存储库
+
+        在线模式: 分步合并 FTS5 的段，每一步之间释放锁，若数据库启用了增量 auto_vacuum 则分步回收空闲页。
+        离线模式: 执行 FTS5 optimize，向量表有效行占比过低时重建向量表，并执行 VACUUM。
+        两种模式都会执行 ANALYZE 和 PRAGMA optimize。
+        """
+        self._check_writable()
+        report = MaintenanceReport(vault, online, bytes_before=self.file_size())
+        with self._lock:
+            self.conn.execute(
+                f"INSERT INTO {vault}_fts({vault}_fts, rank) VALUES('automerge', ?)", (self.fts_automerge,)
+            )
+            self.conn.commit()
+        if online:
+            steps = self._step_until_done(
+                f"INSERT INTO {vault}_fts({vault}_fts, rank) VALUES('merge', {self.maintenance_step_pages})"
+            )
+            report.steps.append(f"FTS5 merge: {steps} 步")
+        else:
+            with self._lock:
+                self.conn.execute(f"INSERT INTO {vault}_fts({vault}_fts) VALUES('optimize')")
+                self.conn.commit()
+            report.steps.append("FTS5 optimize")
+            ratio = self._vec_fill_ratio(vault)
+            if ratio is not None and ratio < self.vec_compact_ratio:
+                self._rebuild_vec(vault)
+                report.steps.append(f"重建向量表 (有效行占比 {ratio:.0%})")
+        with self._lock:
+            self.conn.execute("ANALYZE")
+            self.conn.execute("PRAGMA optimize")
+            self.conn.commit()
+        report.steps.append("ANALYZE")
+        if online:
+            if self.conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+                steps = self._incremental_vacuum()
+                report.steps.append(f"incremental_vacuum: {steps} 步")
+            else:
+                report.steps.append("跳过 VACUUM (需要离线模式)")
+        else:
+            with self._lock:
+                self.conn.commit()
+                self.conn.execute("VACUUM")
+            report.steps.append("VACUUM")
+        report.bytes_after = self.file_size()
+        return report
+
+    def _step_until_done(self, sql: str) -> int:
+        """
+        重复执行一个可分步完成的维护语句直到没有更多工作，每一步之间释放锁以便查询和写入可以穿插执行
+        """
+        steps = 0
+        while True:
+            with self._lock:
+                before = self.conn.total_changes
+                self.conn.execute(sql).fetchall()
+                self.conn.commit()
+                changes = self.conn.total_changes - before
+            steps += 1
+            # FTS5 merge 没有可合并的段时变更数小于 2
+            if changes < 2:
+                return steps
+
+    def _incremental_vacuum(self) -> int:
+        """
+        每步回收 maintenance_step_pages 个空闲页，直到空闲页数为 0 或不再减少，每一步之间释放锁。
+        incremental_vacuum 不计入 total_changes，只能根据 freelist_count 判断是否完成
+        """
+        steps = 0
+        with self._lock:
+            remaining = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+        while remaining > 0:
+            with self._lock:
+                # 每回收一页返回一行，需要取完结果才会执行完
+                self.conn.execute(f"PRAGMA incremental_vacuum({self.maintenance_step_pages})").fetchall()
+                self.conn.commit()
+                freelist = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+            steps += 1
+            if freelist >= remaining:
+                break
+            remaining = freelist
+        return steps
+
+    def _vec_fill_ratio(self, vault: str) -> float | None:
+        """
+        向量表已分配的槽位中有效行的占比，删除的行不会释放所在的块
+        """
+        try:
+            rows = self.conn.execute(f"SELECT count(*) FROM {vault}_vec_rowids").fetchone()[0]
+            capacity = self.conn.execute(f"SELECT coalesce(sum(size), 0) FROM {vault}_vec_chunks").fetchone()[0]
+        except Error as e:
+            logging.warning(f"无法读取向量表的块信息: {e}")
+            return None
+        return rows / capacity if capacity else None
+
+    def _rebuild_vec(self, vault: str) -> None:
+        with self._lock:
+            self.conn.commit()
+            sql = self.conn.execute(
+                "SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (f"{vault}_vec",)
+            ).fetchone()[0]
+            quantized = self._get_quantization(vault) != "none"
+            try:
+                # DDL 语句不会隐式开启事务，显式开启以保证失败时可以回滚
+                self.conn.execute("BEGIN")
+                if not quantized:
+                    self.conn.execute(f"CREATE TEMP TABLE {vault}_vec_copy AS SELECT rowid, embedding FROM {vault}_vec")
+                self.conn.execute(f"DROP TABLE {vault}_vec")
+                self.conn.execute(sql)
+                if quantized:
+                    # 量化向量由原始向量重新生成
+                    self.conn.execute(
+                        f"INSERT INTO {vault}_vec(rowid, embedding) SELECT id, {self._quantize_sql(vault, 'embedding')} FROM {vault}_vec_full"
+                    )
+                else:
+                    self.conn.execute(
+                        f"INSERT INTO {vault}_vec(rowid, embedding) SELECT rowid, embedding FROM temp.{vault}_vec_copy"
+                    )
+                self.conn.commit()
+            except Error:
+                self.conn.rollback()
+                raise
+            finally:
+                self.conn.execute(f"DROP TABLE IF EXISTS temp.{vault}_vec_copy")
+
     # 插入数据
     def insert_data(self, data: list[tuple[str, str, str]], vault: str) -> None:
+        self._check_writable()
         cursor = self.conn.cursor()
         if not data:
             raise Exception("No content to insert")
@@ -166,7 +539,30 @@ class SQLiteDatebase(Database):
                 if len(doc) != 3:
                     logging.error(f"Invalid document format: {doc}")
                     raise Exception("Invalid document format")
+        if vault not in self._bulk_vaults:
+            cursor.executemany(f"INSERT INTO {vault} (source, part_id, content) VALUES (?,?,?)", data)
+            return
+        # 批量导入模式下没有插入触发器, 整批写入后再统一填充全文索引和向量索引
+        watermark = cursor.execute(f"SELECT coalesce(max(id), 0) FROM {vault}").fetchone()[0]
         cursor.executemany(f"INSERT INTO {vault} (source, part_id, content) VALUES (?,?,?)", data)
+        cursor.execute(
+            f"INSERT INTO {vault}_fts(rowid, indexed_content) SELECT id, segment(content) FROM {vault} WHERE id > ?",
+            (watermark,),
+        )
+        if self._get_quantization(vault) == "none":
+            cursor.execute(
+                f"INSERT INTO {vault}_vec(rowid, embedding) SELECT id, embedding(content, {self.vault_dims(vault)}) FROM {vault} WHERE id > ?",
+                (watermark,),
+            )
+            return
+        cursor.execute(
+            f"INSERT INTO {vault}_vec_full(id, embedding) SELECT id, embedding(content, {self.vault_dims(vault)}) FROM {vault} WHERE id > ?",
+            (watermark,),
+        )
+        cursor.execute(
+            f"INSERT INTO {vault}_vec(rowid, embedding) SELECT id, {self._quantize_sql(vault, 'embedding')} FROM {vault}_vec_full WHERE id > ?",
+            (watermark,),
+        )
 
     def check_source(self, source: str, vault: str) -> bool:
         result = self.conn.execute(f"SELECT EXISTS(SELECT 1 FROM {vault} WHERE source=?)", (source,)).fetchone()
@@ -174,6 +570,7 @@ class SQLiteDatebase(Database):
         return result[0] == 1
 
     def del_source(self, source: str, vault: str) -> bool:
+        self._check_writable()
         cursor = self.conn.cursor()
         try:
             cursor.execute(f"DELETE FROM {vault} WHERE source=?", (source,))
@@ -184,11 +581,6 @@ class SQLiteDatebase(Database):
             return False
 
     def _background_search_fts(self, query: str, vault: str, top_n: int = 5) -> list[tuple[str, str]]:
-        cursor = self.conn.cursor()
-        cursor.execute(
-            f"SELECT {vault}.id, {vault}.content FROM {vault}_fts join {vault} on {vault}_fts.rowid={vault}.id WHERE {vault}_fts MATCH ? ORDER BY bm25({vault}_fts) LIMIT ?",
-            (" OR ".join(self.segment(query)), top_n),
-        )
         '''
         # TODO: 如果希望对相同来源的文档召回的数量进行限制，可以用下面的方法，具体代码还需要进一步修改
         self.cursor.execute(
@@ -215,12 +607,45 @@ class SQLiteDatebase(Database):
             (" OR ".join(self.segment(query)), 5, top_n),
         )
         '''
-        return cursor.fetchall()
+        with self._reader() as conn:
+            return conn.execute(
+                f"SELECT {vault}.id, {vault}.content FROM {vault}_fts join {vault} on {vault}_fts.rowid={vault}.id WHERE {vault}_fts MATCH ? ORDER BY bm25({vault}_fts) LIMIT ?",
+                (" OR ".join(self.segment(query)), top_n),
+            ).fetchall()
 
     def _background_search_vec(self, query: str, vault: str, top_n: int = 5) -> list[tuple[str, str]]:
-        cursor = self.conn.cursor()
-        cursor.execute(
-            f"SELECT {vault}.id, {vault}.content FROM {vault}_vec join {vault} on {vault}_vec.rowid={vault}.id WHERE embedding MATCH ? AND k = ? ORDER BY distance;",
-            (serialize_float32(self.embedding(query)), top_n),
-        )
-        return cursor.fetchall()
+        vector = serialize_embedding(self._embed(query, vault))
+        quantization = self._get_quantization(vault)
+        with self._reader() as conn:
+            if quantization == "none":
+                return conn.execute(
+                    f"SELECT {vault}.id, {vault}.content FROM {vault}_vec join {vault} on {vault}_vec.rowid={vault}.id WHERE embedding MATCH ? AND k = ? ORDER BY distance;",
+                    (vector, top_n),
+                ).fetchall()
+            # 先在量化向量上召回候选, 再用原始向量计算距离重新排序
+            return conn.execute(
+                f"SELECT {vault}.id, {vault}.content FROM (SELECT rowid FROM {vault}_vec WHERE embedding MATCH {self._quantize_sql(vault, '?')} AND k = ?) candidates "
+                f"join {vault}_vec_full on {vault}_vec_full.id=candidates.rowid join {vault} on {vault}.id=candidates.rowid "
+                f"ORDER BY vec_distance_l2({vault}_vec_full.embedding, ?) LIMIT ?;",
+                (vector, top_n * self.vec_rescore_factor, vector, top_n),
+            ).fetchall()
+
+    def search_options(self) -> dict[str, int]:
+        return {"rescore_factor": self.vec_rescore_factor}
+
+    def set_search_options(self, vault: str, **options: int) -> None:
+        super().set_search_options(vault, **options)
+        self.vec_rescore_factor = options.get("rescore_factor", self.vec_rescore_factor)
+
+    def _exact_search_vec(self, query: str, vault: str, top_n: int = 5) -> list[tuple[str, str]]:
+        vector = serialize_embedding(self._embed(query, vault))
+        if self._get_quantization(vault) == "none":
+            table, id_column = f"{vault}_vec", "rowid"
+        else:
+            table, id_column = f"{vault}_vec_full", "id"
+        with self._reader() as conn:
+            return conn.execute(
+                f"SELECT {vault}.id, {vault}.content FROM {table} join {vault} on {table}.{id_column}={vault}.id "
+                f"ORDER BY vec_distance_l2({table}.embedding, ?) LIMIT ?;",
+                (vector, top_n),
+            ).fetchall()
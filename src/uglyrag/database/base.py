@@ -1,11 +1,123 @@
 from __future__ import annotations
 
+import logging
+import re
+import threading
+import time
 from abc import ABC, abstractmethod
-from collections.abc import Callable
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
 from dataclasses import dataclass, field
+from datetime import datetime, timezone
 from pathlib import Path
-from threading import Lock
 from types import TracebackType
+from typing import Generic, Protocol, TypeVar
+
+from uglyrag import metrics
+from uglyrag.metrics import TimedLock
+from uglyrag.utils import truncate_embedding
+
+# 记录存储库元数据的表
+METADATA_TABLE = "_uglyrag_meta"
+# 存储库名称会作为表名拼接到 SQL 语句中，只允许字母、数字和下划线
+VAULT_NAME_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+# 存储库的表结构版本，新建存储库时写入元数据
+SCHEMA_VERSION = "2"
+
+LOCK_WAIT_SECONDS = metrics.histogram("uglyrag_db_lock_wait_seconds", "等待数据库连接锁的时间 (秒)")
+POOL_WAIT_SECONDS = metrics.histogram("uglyrag_db_pool_wait_seconds", "等待查询连接的时间 (秒)")
+
+
+class _Connection(Protocol):
+    def close(self) -> None: ...
+
+
+C = TypeVar("C", bound=_Connection)
+
+
+def is_valid_vault_name(vault: str) -> bool:
+    """存储库名称是否是合法的标识符，且不与全文索引和向量表的后缀冲突"""
+    return (
+        isinstance(vault, str)
+        and VAULT_NAME_PATTERN.fullmatch(vault) is not None
+        and not vault.endswith(("_fts", "_vec"))
+        and not vault.startswith("_uglyrag")
+    )
+
+
+class ConnectionPool(Generic[C]):
+    """
+    查询使用的连接池。连接在首次需要时创建，最多 size 个，全部占用时等待归还。
+    reset 后正在使用的连接在归还时关闭，之后取出的都是新建的连接，用于连接级别的设置发生变化的情况
+    """
+
+    def __init__(self, connect: Callable[[], C], size: int) -> None:
+        if size <= 0:
+            raise ValueError("连接池的大小必须大于 0")
+        self.size = size
+        self._connect = connect
+        self._idle: list[C] = []
+        self._generation = 0
+        self._semaphore = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self) -> Iterator[C]:
+        start = time.perf_counter()
+        self._semaphore.acquire()
+        POOL_WAIT_SECONDS.observe(time.perf_counter() - start)
+        try:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+                generation = self._generation
+            if conn is None:
+                conn = self._connect()
+            try:
+                yield conn
+            finally:
+                with self._lock:
+                    if generation == self._generation:
+                        self._idle.append(conn)
+                        conn = None
+                if conn is not None:
+                    conn.close()
+        finally:
+            self._semaphore.release()
+
+    def reset(self) -> None:
+        """关闭空闲的连接，正在使用的连接在归还时关闭"""
+        with self._lock:
+            self._generation += 1
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+@dataclass
+class MaintenanceReport:
+    """
+    存储库维护结果
+    """
+
+    vault: str
+    online: bool
+    steps: list[str] = field(default_factory=list)
+    bytes_before: int = 0
+    bytes_after: int = 0
+    latency_before_ms: float | None = None
+    latency_after_ms: float | None = None
+
+    @property
+    def bytes_reclaimed(self) -> int:
+        return self.bytes_before - self.bytes_after
+
+    def __str__(self) -> str:
+        lines = [f"存储库 {self.vault} 维护完成 ({'在线' if self.online else '离线'}模式)"]
+        lines += [f"  - {step}" for step in self.steps]
+        lines.append(f"文件大小: {self.bytes_before} -> {self.bytes_after} 字节, 回收 {self.bytes_reclaimed} 字节")
+        if self.latency_before_ms is not None and self.latency_after_ms is not None:
+            lines.append(f"查询延迟: {self.latency_before_ms:.2f}ms -> {self.latency_after_ms:.2f}ms")
+        return "\n".join(lines)
 
 
 @dataclass
@@ -17,14 +129,28 @@ class Database(ABC):
     db_path: Path
     segment: Callable[[str], list[str]]
     embedding: Callable[[str], list[float]]
-    dims: int = field(init=False)
     DATABASE_FILE_EXTENSION: str = "db"
-    _lock: Lock = field(default_factory=Lock)
+    embedding_info: dict[str, str] = field(default_factory=dict)  # 向量模块和模型的名称, 新建存储库时写入元数据
+    segment_info: dict[str, str] = field(default_factory=dict)  # 分词函数的名称, 新建存储库时写入元数据
+    read_connections: int = 0  # 查询使用的连接数, 0 表示查询与写入共用一个连接
+    read_only: bool = False  # 只读模式, 用于多进程服务中的查询进程, 不能写入数据或新建存储库
+    _lock: TimedLock = field(default_factory=lambda: TimedLock(LOCK_WAIT_SECONDS))
+    _dims: int | None = field(default=None, init=False)
+    _vault_dims: dict[str, int] = field(default_factory=dict, init=False)
 
     def __post_init__(self) -> None:
         if not self.db_path.name.endswith(f".{self.DATABASE_FILE_EXTENSION}"):
             raise ValueError(f"无效的数据库文件路径，必须以 .{self.DATABASE_FILE_EXTENSION} 结尾")
-        self.dims = len(self.embedding("Hello"))
+
+    @property
+    def dims(self) -> int:
+        """
+        向量模型输出的维度，只在首次需要时调用一次向量模型获得。已有的存储库从元数据中读取维度，不会触发调用
+        """
+        if self._dims is None:
+            self._dims = len(self.embedding("Hello"))
+            logging.debug("向量模型的维度为 %s", self._dims)
+        return self._dims
 
     def __enter__(self) -> Database:
         return self
@@ -39,13 +165,152 @@ class Database(ABC):
         """
         重置数据库
         """
+        self._check_writable()
         with self._lock:
+            self._vault_dims.clear()
             if self.db_path.exists():
                 self.db_path.unlink()
 
-    def rebuild_index(self, vault: str) -> None:
+    @contextmanager
+    def bulk_load(self, vault: str) -> Iterator[None]:
+        """
+        批量导入模式，在上下文中调用 insert_data 时可以跳过逐行维护索引的开销
+        """
+        yield
+
+    def get_metadata(self, vault: str) -> dict[str, str]:
+        """
+        读取存储库的元数据
+        """
+        return {}
+
+    def set_metadata(self, vault: str, values: dict[str, str]) -> None:
+        """
+        写入存储库的元数据
+        """
+        return
+
+    def vault_dims(self, vault: str) -> int:
+        """
+        存储库使用的向量维度，由创建时记录的元数据决定，未记录时为模型的原始维度
+        """
+        if vault not in self._vault_dims:
+            dims = self.get_metadata(vault).get("dims")
+            self._vault_dims[vault] = int(dims) if dims else self.dims
+        return self._vault_dims[vault]
+
+    def _create_metadata(self, vault: str, dims: int) -> int:
+        """
+        确定新建存储库的向量维度，并记录向量模块、模型、分词函数、维度、表结构版本和创建时间
+        :param dims: 期望的维度, 0 表示使用模型的原始维度
+        :return: 存储库使用的向量维度
+        """
+        if dims > self.dims:
+            raise ValueError(f"存储库 {vault} 的向量维度 {dims} 超过了模型的维度 {self.dims}")
+        dims = dims or self.dims
+        self.set_metadata(
+            vault,
+            {
+                **self.embedding_info,
+                **self.segment_info,
+                "dims": str(dims),
+                "schema_version": SCHEMA_VERSION,
+                "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            },
+        )
+        self._vault_dims[vault] = dims
+        return dims
+
+    def _check_metadata(self, vault: str) -> None:
+        """
+        打开已有的存储库时检查元数据。旧版本创建的存储库没有元数据，调用一次向量模型补充记录维度；
+        当前使用的向量模块或模型与创建时不同时给出警告，分词函数不同时交给 _segment_changed 处理
+        """
+        metadata = self.get_metadata(vault)
+        if "dims" not in metadata:
+            if self.read_only:
+                logging.warning(f"存储库 {vault} 没有元数据，只读模式下无法补充")
+                return
+            self.set_metadata(vault, {"dims": str(self.dims), **self.segment_info})
+            logging.info(f"已为存储库 {vault} 补充元数据")
+            return
+        for key, value in self.embedding_info.items():
+            if metadata.get(key, value) != value:
+                logging.warning(f"存储库 {vault} 创建时使用的 {key} 为 {metadata[key]}，与当前的 {value} 不一致")
+        segment = self.segment_info.get("segment")
+        if segment and metadata.get("segment") != segment:
+            if "segment" not in metadata:
+                # 更早的版本没有记录分词函数，按当前的分词函数补充记录
+                if not self.read_only:
+                    self.set_metadata(vault, self.segment_info)
+            else:
+                self._segment_changed(vault, metadata["segment"], segment)
+
+    def _segment_changed(self, vault: str, recorded: str, current: str) -> None:
+        """
+        当前的分词函数与元数据中记录的不同。全文索引保存的是写入时的分词结果，新的分词函数只影响之后写入的文档和查询
+        """
+        logging.warning(f"存储库 {vault} 创建时使用的分词函数为 {recorded}，与当前的 {current} 不一致")
+
+    def _check_writable(self) -> None:
+        if self.read_only:
+            raise PermissionError(f"数据库 {self.db_path} 以只读模式打开，不能写入")
+
+    def _embed(self, text: str, vault: str) -> list[float]:
+        """
+        生成存储库使用的向量，模型输出的维度高于存储库的维度时截断并重新归一化
+        """
+        return truncate_embedding(self.embedding(text), self.vault_dims(vault))
+
+    def file_size(self) -> int:
+        """
+        数据库文件及其日志文件的总大小
+        """
+        paths = [
+            self.db_path,
+            *(self.db_path.with_name(self.db_path.name + suffix) for suffix in ("-wal", "-shm", ".wal")),
+        ]
+        return sum(path.stat().st_size for path in paths if path.exists())
+
+    def sample_contents(self, vault: str, n: int = 5) -> list[str]:
+        """
+        随机抽取存储库中的内容，用于生成测试查询
+        """
+        return []
+
+    def maintain(self, vault: str, online: bool = True) -> MaintenanceReport:
+        """
+        维护存储库：合并全文索引、压缩向量索引并回收空间
+        :param online: 在线模式下每一步都只短暂占用连接，不阻塞查询；离线模式会执行需要独占数据库的操作
+        """
+        size = self.file_size()
+        return MaintenanceReport(vault, online, bytes_before=size, bytes_after=size)
+
+    def search_options(self) -> dict[str, int]:
+        """
+        当前可调整的向量检索参数
+        """
+        return {}
+
+    def set_search_options(self, vault: str, **options: int) -> None:
+        """
+        调整向量检索参数，用于评估不同设置下的召回率和延迟
+        """
+        unsupported = set(options) - set(self.search_options())
+        if unsupported:
+            raise ValueError(f"{type(self).__name__} 不支持检索参数: {', '.join(sorted(unsupported))}")
+
+    @abstractmethod
+    def _exact_search_vec(self, query: str, vault: str, top_n: int = 5) -> list[tuple[str, str]]:
+        """
+        不使用向量索引和量化向量，逐条计算距离的精确向量检索，用作评估近似检索的基准
+        """
+        pass
+
+    def rebuild_index(self, vault: str, force: bool = False) -> None:
         """
         重建全文搜索索引
+        :param force: 是否忽略延迟重建策略立即重建
         """
         return
 
@@ -71,9 +336,17 @@ class Database(ABC):
         pass
 
     @abstractmethod
-    def _check_vault(self, vault: str) -> bool:
+    def has_vault(self, vault: str) -> bool:
+        """
+        存储库是否存在，不存在时不会创建
+        """
+        pass
+
+    @abstractmethod
+    def _check_vault(self, vault: str, dims: int = 0) -> bool:
         """
         检查数据库是否存在，不存在则创建
+        :param dims: 新建存储库的向量维度, 0 表示使用模型的原始维度; 已存在的存储库沿用创建时的维度
         """
         pass
 
@@ -2,23 +2,57 @@ from __future__ import annotations
 
 import asyncio
 import logging
+import statistics
+import time
 from collections import defaultdict
-from collections.abc import Callable
+from collections.abc import Awaitable, Callable, Iterator
 from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from functools import cache
+from pathlib import Path
 from threading import Lock
 from typing import Any
 
+from uglyrag import metrics
 from uglyrag.config import config
-from uglyrag.database import Database
+from uglyrag.database import Database, MaintenanceReport
 from uglyrag.database._sqlite import SQLiteDatebase
+from uglyrag.database.base import is_valid_vault_name
+from uglyrag.integrations import hashing
+from uglyrag.modules.embed import get_embedding_info
+from uglyrag.tracing import span
+from uglyrag.utils import LRUCache, resolve_module
+
+INGESTED_CHUNKS = metrics.counter("uglyrag_ingested_chunks_total", "写入数据库的分段数")
+EMBEDDING_CALLS = metrics.counter("uglyrag_embedding_calls_total", "向量模型的调用次数")
+EMBEDDING_BATCH_SIZE = metrics.histogram(
+    "uglyrag_embedding_batch_size", "每次调用向量模型的文本数", metrics.SIZE_BOUNDS
+)
+EMBEDDING_CACHE_HITS = metrics.counter("uglyrag_embedding_cache_hits_total", "向量缓存命中次数")
+EMBEDDING_CACHE_MISSES = metrics.counter("uglyrag_embedding_cache_misses_total", "向量缓存未命中次数")
+VAULT_CACHE_HITS = metrics.counter("uglyrag_vault_cache_hits_total", "存储库检查结果缓存命中次数")
+VAULT_CACHE_MISSES = metrics.counter("uglyrag_vault_cache_misses_total", "存储库检查结果缓存未命中次数")
+
+
+def no_segment(text: str) -> list[str]:
+    """未能加载分词模块时不分词，由全文索引的分词器按空白和标点切分"""
+    return [text]
 
 
 class DatabaseManager:
-    segment: Callable[[str], list[str]] = staticmethod(lambda x: [x])
-    embeddings: Callable[[list[str]], list[list[float]]] = staticmethod(lambda x: [[1.0] * len(x)])
-    _executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=1)  # 使用多线程池
-    _embeddings_dict: defaultdict[str, list[float]] = defaultdict(list)
+    segment: Callable[[str], list[str]] = staticmethod(no_segment)
+    # 未能加载向量模块时使用哈希向量，维度与 [Hash] dimensions 一致
+    embeddings: Callable[[list[str]], list[list[float]]] = staticmethod(hashing.embeddings)
+    # 查询使用的连接数，0 表示查询与写入共用一个连接，此时查询在单个线程中依次执行
+    _read_connections: int = int(config.get("read_connections", "SEARCH") or 0)
+    _executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=max(1, _read_connections))  # 使用多线程池
+    # 只读模式用于多进程服务中的查询进程，immutable 表示没有其他进程写入数据库 (仅 SQLite)
+    _read_only: bool = False
+    _immutable: bool = False
+    # 导入时预先计算的文档向量，写入数据库时由 embedding() 函数读取；查询向量单独缓存，两者都有容量上限
+    _embeddings_dict: LRUCache[str, list[float]] = LRUCache(int(config.get("embedding_cache_size", "INGEST") or 10_000))
+    _query_embeddings: LRUCache[str, list[float]] = LRUCache(int(config.get("query_cache_size", "SEARCH") or 1024))
+    _pinned_embeddings: dict[str, list[float]] = {}
     _check_vault_dict: defaultdict[str, bool] = defaultdict(bool)
     _lock = Lock()
 
@@ -27,13 +61,40 @@ class DatabaseManager:
     def get_database() -> Database:
         """获取数据库实例"""
         db_filename = config.get("db_name")
-        db_path = config.data_dir / db_filename
-        db_type = config.get("db_type").lower()
+        return DatabaseManager.open_database(config.data_dir / db_filename, config.get("db_type").lower())
+
+    @classmethod
+    def configure_readers(cls, read_connections: int, read_only: bool = False, immutable: bool = False) -> None:
+        """
+        设置查询使用的连接数和查询线程数，以及是否以只读模式打开数据库，需要在首次打开数据库之前调用
+        """
+        if DatabaseManager.get_database.cache_info().currsize:
+            logging.warning("数据库已经打开，查询连接数的设置在重新打开数据库后生效")
+        cls._read_connections = read_connections
+        cls._read_only = read_only
+        cls._immutable = immutable
+        executor, cls._executor = cls._executor, ThreadPoolExecutor(max_workers=max(1, read_connections))
+        executor.shutdown(wait=False)
+
+    @staticmethod
+    def open_database(db_path: Path, db_type: str = "") -> Database:
+        """
+        打开指定路径的数据库，db_type 为空时按扩展名判断 (.db 为 SQLite，.ddb 为 DuckDB)
+        """
+        if not db_type:
+            db_type = "duckdb" if db_path.suffix == ".ddb" else "sqlite"
         db_classes: dict[str, type[Database] | None] = {
             "sqlite": SQLiteDatebase,
             "duckdb": None,  # DuckDBDatabase will be imported later
         }
         db_class: type[Database] | None = db_classes.get(db_type)
+        options: dict[str, Any] = {}
+        if db_type == "sqlite":
+            options = {
+                "vec_quantization": config.get("vec_quantization", "SQLite", "none").lower(),
+                "vec_rescore_factor": int(config.get("vec_rescore_factor", "SQLite", "4")),
+                "immutable": DatabaseManager._read_only and DatabaseManager._immutable,
+            }
         if db_class is None:
             if db_type == "duckdb":
                 try:
@@ -42,11 +103,44 @@ class DatabaseManager:
                     db_class = DuckDBDatabase
                 except ImportError as e:
                     raise ImportError("DuckDB 未安装，请先安装 DuckDB") from e
+                options = {
+                    "fts_rebuild": config.get("fts_rebuild", "DuckDB", "immediate"),
+                    "fts_rebuild_threshold": int(config.get("fts_rebuild_threshold", "DuckDB", "1000")),
+                    "fts_rebuild_interval": float(config.get("fts_rebuild_interval", "DuckDB", "0")),
+                    "fts_rebuild_on_query": config.get("fts_rebuild_on_query", "DuckDB", "true").lower() == "true",
+                    "hnsw_m": int(config.get("hnsw_m", "DuckDB", "16")),
+                    "hnsw_ef_construction": int(config.get("hnsw_ef_construction", "DuckDB", "128")),
+                    "hnsw_ef_search": int(config.get("hnsw_ef_search", "DuckDB", "64")),
+                }
             else:
                 logging.error(f"不支持的数据库类型: {db_type}")
                 raise ValueError(f"不支持的数据库类型: {db_type}")
-        logging.debug(f"使用 {db_type.upper()} 数据库")
-        return db_class(db_path, DatabaseManager.segment, DatabaseManager._get_embedding)
+        logging.debug("使用 %s 数据库", db_type.upper())
+        options["embedding_info"] = DatabaseManager._embedding_info()
+        options["segment_info"] = DatabaseManager._segment_info()
+        options["read_connections"] = DatabaseManager._read_connections
+        options["read_only"] = DatabaseManager._read_only
+        return db_class(db_path, DatabaseManager._segment, DatabaseManager._get_embedding, **options)
+
+    @classmethod
+    def _embedding_info(cls) -> dict[str, str]:
+        """
+        实际使用的向量模块和模型。配置的模块未能加载时退回哈希向量，此时记录为 Hash，
+        避免存储库的元数据与其中的向量不符
+        """
+        embeddings = resolve_module(cls, "embeddings")
+        if embeddings is hashing.embeddings:
+            if config.get("embedding", "MODULES", "JINA") != "Hash":
+                logging.error("向量模块未能加载，使用哈希向量，存储库的元数据中记录为 Hash")
+            return get_embedding_info("Hash")
+        return get_embedding_info()
+
+    @classmethod
+    def _segment_info(cls) -> dict[str, str]:
+        """实际使用的分词函数，SQLite 的全文索引删除词条时依赖与写入时相同的分词结果"""
+        segment = resolve_module(cls, "segment")
+        name = getattr(segment, "__qualname__", type(segment).__name__)
+        return {"segment": f"{getattr(segment, '__module__', '')}.{name}"}
 
     @classmethod
     def reset(cls) -> None:
@@ -57,22 +151,124 @@ class DatabaseManager:
         return asyncio.run(cls._async_search(query, vault, top_n))
 
     @classmethod
-    def add_documents(cls, data: list[tuple[str, str, str]], vault: str) -> None:
-        """添加文档到数据库"""
+    def add_documents(
+        cls, data: list[tuple[str, str, str]], vault: str, embeddings: dict[str, list[float]] | None = None
+    ) -> None:
+        """
+        添加文档到数据库，embeddings 为已经计算好的向量 (如导入日志中记录的向量)，缺少的向量在写入前计算。
+        写入期间本批次的向量固定在 _pinned_embeddings 中，不会因为超过导入缓存的容量被淘汰而逐条重新计算
+        """
         if not data:
             return
         if not cls._is_vault_valid(vault):
             raise Exception("No such vault")
 
-        request_docs = [content for _, _, content in data if content not in cls._embeddings_dict]
-        embeddings = cls.embeddings(request_docs)
-        with cls._lock:
-            cls._embeddings_dict.update(zip(request_docs, embeddings))
+        if embeddings is None or any(content not in embeddings for _, _, content in data):
+            embeddings = {**cls.embed_documents(data), **(embeddings or {})}
 
         with cls.get_database() as store:
             logging.info("构建索引...")
-            store.insert_data(data, vault)
-            store.rebuild_index(vault)
+            # 写入在数据库锁内依次进行，同一时刻只有一个批次的向量被固定
+            cls._pinned_embeddings = embeddings
+            try:
+                with span("ingest.insert", vault, chunks=len(data)):
+                    store.insert_data(data, vault)
+            finally:
+                cls._pinned_embeddings = {}
+            with span("ingest.index", vault):
+                store.rebuild_index(vault)
+        INGESTED_CHUNKS.inc(len(data))
+
+    @classmethod
+    @contextmanager
+    def bulk_load(cls, vault: str) -> Iterator[None]:
+        """批量导入模式，上下文中的 add_documents 调用会跳过逐行维护索引的开销"""
+        if not cls._is_vault_valid(vault):
+            raise Exception("No such vault")
+        with cls.get_database().bulk_load(vault):
+            yield
+
+    @classmethod
+    def rebuild_index(cls, vault: str) -> None:
+        """立即重建全文索引，用于延迟重建模式下的手动刷新"""
+        if not cls._is_vault_valid(vault):
+            raise Exception("No such vault")
+        with cls.get_database() as store:
+            store.rebuild_index(vault, force=True)
+
+    @classmethod
+    def warmup(cls, vault: str) -> None:
+        """打开数据库和存储库，并调用一次分词和向量模块以加载模型"""
+        if not cls._is_vault_valid(vault):
+            raise Exception("No such vault")
+        try:
+            cls.segment("warmup")
+            cls._get_embedding("warmup")
+        except Exception as e:
+            logging.warning(f"预热模块失败: {e}")
+
+    @classmethod
+    def maintain(cls, vault: str, online: bool = True, probes: int = 5) -> MaintenanceReport:
+        """维护存储库，并用抽样查询对比维护前后的查询延迟"""
+        if not cls._is_vault_valid(vault):
+            raise Exception("No such vault")
+        store = cls.get_database()
+        queries = [content[:64] for content in store.sample_contents(vault, probes)]
+        for query in queries:
+            cls._get_embedding(query)  # 预先计算向量，避免把向量模型的耗时计入查询延迟
+        latency_before = cls._probe_latency(store, vault, queries)
+        report = store.maintain(vault, online)
+        report.latency_before_ms = latency_before
+        report.latency_after_ms = cls._probe_latency(store, vault, queries)
+        logging.info(str(report))
+        return report
+
+    @staticmethod
+    def _probe_latency(store: Database, vault: str, queries: list[str]) -> float | None:
+        """抽样查询的延迟中位数 (毫秒)"""
+        timings = []
+        for query in queries:
+            try:
+                start = time.perf_counter()
+                store._background_search_fts(query, vault)
+                store._background_search_vec(query, vault)
+                timings.append((time.perf_counter() - start) * 1000)
+            except Exception as e:
+                logging.debug("测试查询失败: %s", e)
+        return statistics.median(timings) if timings else None
+
+    @classmethod
+    def embed_documents(cls, data: list[tuple[str, str, str]]) -> dict[str, list[float]]:
+        """计算文档的嵌入向量并写入缓存，返回每段内容对应的向量"""
+        request_docs = list(dict.fromkeys(content for _, _, content in data if content not in cls._embeddings_dict))
+        EMBEDDING_CACHE_HITS.inc(len(data) - len(request_docs))
+        embedded: dict[str, list[float]] = {}
+        if request_docs:
+            EMBEDDING_CACHE_MISSES.inc(len(request_docs))
+            embedded = dict(zip(request_docs, cls._call_embeddings(request_docs)))
+            cls.cache_embeddings(embedded)
+        result = {}
+        for _, _, content in data:
+            # 批次超过缓存容量时，先写入的向量可能已被淘汰
+            vector = embedded.get(content)
+            if vector is None:
+                vector = cls._embeddings_dict.get(content)
+            result[content] = vector if vector is not None else cls._get_embedding(content)
+        return result
+
+    @classmethod
+    def cache_embeddings(cls, embeddings: dict[str, list[float]]) -> None:
+        """将已有的嵌入向量写入导入缓存"""
+        cls._embeddings_dict.update(embeddings)
+
+    @classmethod
+    def cache_query_embeddings(cls, embeddings: dict[str, list[float]]) -> None:
+        """将查询向量写入查询缓存，供随后的向量检索使用"""
+        cls._query_embeddings.update(embeddings)
+
+    @classmethod
+    def has_query_embedding(cls, query: str) -> bool:
+        return query in cls._query_embeddings or query in cls._embeddings_dict
 
     @classmethod
     def is_source_valid(cls, source: str, vault: str, rm_if_exist: bool = False) -> bool:
@@ -86,22 +282,58 @@ class DatabaseManager:
 
     @classmethod
     def _get_embedding(cls, text: str) -> list[float]:
-        """获取文本的嵌入向量"""
-        if text in cls._embeddings_dict:
-            return cls._embeddings_dict[text]
-        embedding = cls.embeddings([text])[0]
-        with cls._lock:
-            cls._embeddings_dict[text] = embedding
+        """获取文本的嵌入向量，依次查找正在写入的批次、导入缓存和查询缓存，未命中时计算并写入查询缓存"""
+        embedding = cls._pinned_embeddings.get(text)
+        if embedding is None:
+            embedding = cls._embeddings_dict.get(text)
+        if embedding is None:
+            embedding = cls._query_embeddings.get(text)
+        if embedding is not None:
+            EMBEDDING_CACHE_HITS.inc()
+            return embedding
+        EMBEDDING_CACHE_MISSES.inc()
+        embedding = cls._call_embeddings([text])[0]
+        cls._query_embeddings[text] = embedding
         return embedding
 
+    @classmethod
+    def _call_embeddings(cls, texts: list[str]) -> list[list[float]]:
+        """调用向量模型，并记录耗时和批量大小"""
+        EMBEDDING_CALLS.inc()
+        EMBEDDING_BATCH_SIZE.observe(len(texts))
+        with span("embedding", texts=len(texts), chars=sum(map(len, texts))):
+            return cls.embeddings(texts)
+
+    @classmethod
+    def _segment(cls, text: str) -> list[str]:
+        """分词，并记录分词阶段的耗时"""
+        with span("segment", chars=len(text)) as s:
+            tokens = cls.segment(text)
+            s.set(tokens=len(tokens))
+        return tokens
+
+    @staticmethod
+    def _get_vault_dims(vault: str) -> int:
+        """新建存储库使用的向量维度，可在 [EMBEDDING] 中用 dims.<vault> 单独设置，0 表示使用模型的原始维度"""
+        return int(config.get(f"dims.{vault}", "EMBEDDING") or config.get("dims", "EMBEDDING", "0"))
+
+    @classmethod
+    def vault_exists(cls, vault: str) -> bool:
+        """存储库是否存在，与 _is_vault_valid 不同，不存在时不会创建"""
+        if cls._check_vault_dict.get(vault):
+            return True
+        return is_valid_vault_name(vault) and cls.get_database().has_vault(vault)
+
     @classmethod
     def _is_vault_valid(cls, vault: str) -> bool:
         with cls.get_database() as store:
             if vault in cls._check_vault_dict:
+                VAULT_CACHE_HITS.inc()
                 return cls._check_vault_dict[vault]
             else:
+                VAULT_CACHE_MISSES.inc()
                 try:
-                    result = store._check_vault(vault)
+                    result = store._check_vault(vault, cls._get_vault_dims(vault))
                     with cls._lock:
                         cls._check_vault_dict[vault] = result
                     return result
@@ -131,7 +363,35 @@ class DatabaseManager:
             raise Exception("No such vault")
         store = cls.get_database()
         result = await asyncio.gather(
-            cls._run_in_executor(store._background_search_fts, query, vault, top_n),
-            cls._run_in_executor(store._background_search_vec, query, vault, top_n),
+            cls._traced_search(
+                "search.fts", vault, cls._run_in_executor(store._background_search_fts, query, vault, top_n)
+            ),
+            cls._traced_search(
+                "search.vec", vault, cls._run_in_executor(store._background_search_vec, query, vault, top_n)
+            ),
         )
         return list(result)
+
+    @staticmethod
+    async def _traced_search(name: str, vault: str, search: Awaitable[list[tuple[str, str]]]) -> list[tuple[str, str]]:
+        """等待一路检索完成，记录的耗时包含在线程池中排队的时间"""
+        with span(name, vault) as s:
+            results = await search
+            s.set(results=len(results))
+        return results
+
+
+metrics.gauge(
+    "uglyrag_embedding_cache_hit_ratio",
+    "向量缓存命中率",
+    metrics.hit_ratio(EMBEDDING_CACHE_HITS, EMBEDDING_CACHE_MISSES),
+)
+metrics.gauge("uglyrag_embedding_cache_size", "向量缓存中的文本数", lambda: len(DatabaseManager._embeddings_dict))
+metrics.gauge(
+    "uglyrag_vault_cache_hit_ratio", "存储库检查结果缓存命中率", metrics.hit_ratio(VAULT_CACHE_HITS, VAULT_CACHE_MISSES)
+)
+metrics.gauge(
+    "uglyrag_executor_queue_depth",
+    "查询线程池中等待执行的任务数",
+    lambda: DatabaseManager._executor._work_queue.qsize(),
+)
@@ -0,0 +1,239 @@
+from __future__ import annotations
+
+import itertools
+import json
+import logging
+import math
+import statistics
+import time
+from collections.abc import Callable, Sequence
+from dataclasses import asdict, dataclass, field
+from functools import partial
+from pathlib import Path
+from typing import Any
+
+from uglyrag.database import Database
+from uglyrag.search import rerank_candidates, rrf_fuse
+from uglyrag.utils import percentile
+
+# 混合检索的评估参数: 每路检索的候选数量、RRF 的 k 和两路结果的权重
+HYBRID_OPTIONS = {"depth", "rrf_k", "weight_fts", "weight_vec"}
+# 重排序的评估参数: 每个候选交给 rerank 的最大字符数和最多重排的候选数, 0 表示不限制
+RERANK_OPTIONS = {"rerank_chars", "rerank_docs"}
+# 修改后需要重建索引的参数，扫描时放在最外层以减少重建次数
+REBUILD_OPTIONS = ("m", "ef_construction")
+
+
+@dataclass
+class EvalQuery:
+    query: str
+    relevant: list[str] = field(default_factory=list)  # 标注的相关分段 id, 为空时以精确向量检索的结果为准
+
+
+@dataclass
+class EvalResult:
+    """
+    一组检索设置在查询集上的评估结果
+    """
+
+    backend: str
+    mode: str  # vec 只评估向量检索, hybrid 评估 RRF 融合后的结果, rerank 评估融合后再重排序的结果
+    settings: dict[str, float]
+    k: int
+    queries: int
+    recall: float
+    ndcg: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+
+    def to_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+def load_queries(path: Path) -> list[EvalQuery]:
+    """
+    读取查询集，每行一个查询。可以是纯文本，也可以是 {"query": ..., "relevant": [...]} 形式的 JSON
+    """
+    queries = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("{"):
+            item = json.loads(line)
+            queries.append(EvalQuery(item["query"], [str(i) for i in item.get("relevant", [])]))
+        else:
+            queries.append(EvalQuery(line))
+    return queries
+
+
+def recall_at_k(results: Sequence[str], truth: Sequence[str], k: int) -> float:
+    if not truth:
+        return 0.0
+    return len(set(results[:k]) & set(truth[:k])) / min(k, len(truth))
+
+
+def ndcg_at_k(results: Sequence[str], truth: Sequence[str], k: int) -> float:
+    """以 truth 中的分段为相关 (增益为 1) 计算 nDCG@k"""
+    relevant = set(truth[:k])
+    dcg = sum(1 / math.log2(rank + 2) for rank, id in enumerate(results[:k]) if id in relevant)
+    ideal = sum(1 / math.log2(rank + 2) for rank in range(min(k, len(relevant))))
+    return dcg / ideal if ideal else 0.0
+
+
+def _sweep(sweep: dict[str, list[float]], keys: set[str]) -> list[dict[str, float]]:
+    names = sorted((name for name in sweep if name in keys), key=lambda name: name not in REBUILD_OPTIONS)
+    return [dict(zip(names, values)) for values in itertools.product(*(sweep[name] for name in names))]
+
+
+def _measure(
+    backend: str,
+    mode: str,
+    settings: dict[str, float],
+    k: int,
+    queries: list[EvalQuery],
+    truths: list[list[str]],
+    search: Callable[[str], list[tuple[Any, str]]],
+) -> EvalResult:
+    recalls, ndcgs, latencies = [], [], []
+    for query, truth in zip(queries, truths):
+        start = time.perf_counter()
+        ids = [str(id) for id, _ in search(query.query)]
+        latencies.append((time.perf_counter() - start) * 1000)
+        recalls.append(recall_at_k(ids, truth, k))
+        ndcgs.append(ndcg_at_k(ids, truth, k))
+    result = EvalResult(
+        backend,
+        mode,
+        settings,
+        k,
+        len(queries),
+        round(statistics.mean(recalls), 4),
+        round(statistics.mean(ndcgs), 4),
+        percentile(latencies, 50),
+        percentile(latencies, 95),
+        percentile(latencies, 99),
+    )
+    logging.info(f"{backend} {mode} {settings}: recall@{k}={result.recall}, nDCG@{k}={result.ndcg}")
+    return result
+
+
+def _candidates(store: Database, vault: str, k: int, options: dict[str, float], query: str) -> list[tuple[Any, str]]:
+    """混合检索的候选: 两路检索各取 depth 个结果后按 RRF 融合"""
+    depth = int(options.get("depth", k))
+    return rrf_fuse(
+        store._background_search_fts(query, vault, depth),
+        store._background_search_vec(query, vault, depth),
+        options.get("rrf_k", 60),
+        options.get("weight_fts", 1.0),
+        options.get("weight_vec", 1.0),
+    )
+
+
+def _fuse(store: Database, vault: str, k: int, options: dict[str, float], query: str) -> list[tuple[Any, str]]:
+    return _candidates(store, vault, k, options, query)[:k]
+
+
+def _fuse_and_rerank(
+    store: Database,
+    vault: str,
+    k: int,
+    options: dict[str, float],
+    rerank: Callable[[str, list[str]], list[float]],
+    query: str,
+) -> list[tuple[Any, str]]:
+    candidates = _candidates(store, vault, k, options, query)
+    max_chars, max_docs = int(options.get("rerank_chars", 0)), int(options.get("rerank_docs", 0))
+    return rerank_candidates(rerank, query, candidates, max_chars, max_docs)[:k]
+
+
+def evaluate(
+    store: Database,
+    vault: str,
+    queries: list[EvalQuery],
+    k: int = 10,
+    sweep: dict[str, list[float]] | None = None,
+    modes: Sequence[str] = ("vec", "hybrid"),
+    backend: str = "",
+    rerank: Callable[[str, list[str]], list[float]] | None = None,
+) -> list[EvalResult]:
+    """
+    评估向量检索和混合检索在不同设置下的召回率、nDCG 和延迟
+
+    没有标注相关分段的查询以精确向量检索的前 k 个结果为基准。sweep 中的向量检索参数 (如 HNSW 的 ef_search、m，
+    量化向量的 rescore_factor) 依次写入数据库，修改 m 会重建索引，评估结束后恢复原来的设置；
+    混合检索参数 (depth、rrf_k、weight_fts、weight_vec) 只在评估中使用。
+    rerank 模式用 rerank 重排序混合检索的候选，rerank_chars 和 rerank_docs 限制交给 rerank 的文本长度和候选数
+    """
+    sweep = sweep or {}
+    backend = backend or type(store).__name__
+    original = store.search_options()
+    unknown = set(sweep) - HYBRID_OPTIONS - RERANK_OPTIONS - set(original)
+    if unknown:
+        raise ValueError(f"{backend} 不支持检索参数: {', '.join(sorted(unknown))}")
+    if "rerank" in modes and rerank is None:
+        raise ValueError("rerank 模式需要 rerank 模块")
+    for query in queries:
+        store.embedding(query.query)  # 预先计算查询向量，避免把向量模型的耗时计入延迟
+    truths = [
+        query.relevant or [str(id) for id, _ in store._exact_search_vec(query.query, vault, k)] for query in queries
+    ]
+
+    results = []
+    try:
+        for vec_settings in _sweep(sweep, set(original)):
+            store.set_search_options(vault, **{name: int(value) for name, value in vec_settings.items()})
+            if "vec" in modes:
+                results.append(
+                    _measure(
+                        backend,
+                        "vec",
+                        vec_settings,
+                        k,
+                        queries,
+                        truths,
+                        lambda q: store._background_search_vec(q, vault, k),
+                    )
+                )
+            if "hybrid" in modes:
+                for hybrid_settings in _sweep(sweep, HYBRID_OPTIONS):
+                    search = partial(_fuse, store, vault, k, hybrid_settings)
+                    results.append(
+                        _measure(backend, "hybrid", vec_settings | hybrid_settings, k, queries, truths, search)
+                    )
+            if "rerank" in modes and rerank is not None:
+                for rerank_settings in _sweep(sweep, HYBRID_OPTIONS | RERANK_OPTIONS):
+                    search = partial(_fuse_and_rerank, store, vault, k, rerank_settings, rerank)
+                    results.append(
+                        _measure(backend, "rerank", vec_settings | rerank_settings, k, queries, truths, search)
+                    )
+    finally:
+        store.set_search_options(vault, **original)
+    return results
+
+
+def format_report(results: list[EvalResult], title: str = "检索评估报告") -> str:
+    """生成 Markdown 格式的评估报告"""
+    lines = [
+        f"# {title}",
+        "",
+        "| 数据库 | 模式 | 设置 | recall@k | nDCG@k | p50 (ms) | p95 (ms) | p99 (ms) |",
+        "| --- | --- | --- | --- | --- | --- | --- | --- |",
+    ]
+    for r in results:
+        settings = ", ".join(f"{name}={value:g}" for name, value in r.settings.items()) or "默认"
+        lines.append(
+            f"| {r.backend} | {r.mode} | {settings} | {r.recall:.4f} | {r.ndcg:.4f} | {r.p50_ms} | {r.p95_ms} | {r.p99_ms} |"
+        )
+    if results:
+        lines += ["", f"k = {results[0].k}，查询数 = {results[0].queries}"]
+    return "\n".join(lines) + "\n"
+
+
+def write_report(results: list[EvalResult], path: Path) -> None:
+    """按扩展名写入报告，.json 为 JSON，其他为 Markdown"""
+    if path.suffix == ".json":
+        path.write_text(json.dumps([r.to_dict() for r in results], ensure_ascii=False, indent=2), encoding="utf-8")
+    else:
+        path.write_text(format_report(results), encoding="utf-8")
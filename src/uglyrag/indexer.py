@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import json
+import logging
+import sqlite3
+import time
+import uuid
+from dataclasses import dataclass, field
+from functools import cache
+from pathlib import Path
+from sqlite3 import Connection
+from threading import Condition, Event, Thread
+from typing import Any, ClassVar
+
+from uglyrag.config import config
+
+# 任务状态
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+@dataclass
+class IndexJob:
+    """后台索引任务的句柄"""
+
+    job_id: str
+    queue: IndexQueue
+
+    def _get(self, column: str) -> Any:
+        return self.queue._get_job_field(self.job_id, column)
+
+    @property
+    def status(self) -> str:
+        return self._get("status")
+
+    @property
+    def chunks(self) -> int:
+        """已写入的分段数量，任务完成后有效"""
+        return self._get("chunks")
+
+    @property
+    def error(self) -> str | None:
+        return self._get("error")
+
+    def done(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    def wait(self, timeout: float | None = None) -> str:
+        """等待任务结束并返回最终状态，超时时返回当前状态"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.queue._condition:
+            while not self.done():
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                # 任务可能由其他进程处理，定期轮询状态
+                self.queue._condition.wait(0.5 if remaining is None else min(remaining, 0.5))
+        return self.status
+
+
+@dataclass
+class IndexQueue:
+    """
+    持久化的后台索引队列。
+
+    build 以后台模式调用时，文档会先写入队列并立即返回任务句柄，由后台线程按提交顺序调用 SearchEngine.build
+    处理。build 按批次提交，因此每个批次提交后即可被搜索到。进程退出时未完成的任务会在下次启动时继续，
+    已提交的批次通过导入日志跳过。
+    多进程服务中只有写入进程处理任务，查询进程把 process_jobs 设为 False 后只提交任务和查询状态。
+    """
+
+    process_jobs: ClassVar[bool] = True
+
+    path: Path
+    conn: Connection = field(init=False)
+    _condition: Condition = field(default_factory=Condition, init=False)
+    _stop: Event = field(default_factory=Event, init=False)
+    _worker: Thread | None = field(default=None, init=False)
+
+    def __post_init__(self) -> None:
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs (seq INTEGER PRIMARY KEY AUTOINCREMENT, job_id TEXT UNIQUE NOT NULL, vault TEXT NOT NULL, docs TEXT NOT NULL, update_exist INTEGER NOT NULL, bulk_load INTEGER NOT NULL, status TEXT NOT NULL, chunks INTEGER NOT NULL DEFAULT 0, error TEXT, created_at DATETIME DEFAULT CURRENT_TIMESTAMP, updated_at DATETIME DEFAULT CURRENT_TIMESTAMP)"
+            )
+            # 上次进程退出时正在处理的任务重新排队，不处理任务的进程不能改动其他进程正在处理的任务
+            if self.process_jobs:
+                self.conn.execute("UPDATE jobs SET status=? WHERE status=?", (PENDING, RUNNING))
+        logging.debug("索引队列已打开: %s", self.path)
+
+    def submit(
+        self, docs: list[tuple[Any, str]], vault: str, update_exist: bool = False, bulk_load: bool = False
+    ) -> IndexJob:
+        """提交文档，返回任务句柄"""
+        job_id = uuid.uuid4().hex
+        payload = json.dumps([(str(source), text) for source, text in docs], ensure_ascii=False)
+        with self._condition:
+            with self.conn:
+                self.conn.execute(
+                    "INSERT INTO jobs (job_id, vault, docs, update_exist, bulk_load, status) VALUES (?, ?, ?, ?, ?, ?)",
+                    (job_id, vault, payload, update_exist, bulk_load, PENDING),
+                )
+            self._condition.notify_all()
+        logging.debug("已提交索引任务 %s, 共 %s 篇文档", job_id, len(docs))
+        self.start()
+        return IndexJob(job_id, self)
+
+    def get(self, job_id: str) -> IndexJob:
+        if self._get_job_field(job_id, "status") is None:
+            raise KeyError(f"No such job: {job_id}")
+        return IndexJob(job_id, self)
+
+    def pending(self) -> int:
+        """尚未完成的任务数量"""
+        with self._condition:
+            row = self.conn.execute("SELECT count(*) FROM jobs WHERE status IN (?, ?)", (PENDING, RUNNING)).fetchone()
+        return row[0]
+
+    def start(self) -> None:
+        """启动后台线程，已启动或当前进程不处理任务时不做任何事情"""
+        if not self.process_jobs:
+            return
+        with self._condition:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._stop.clear()
+            self._worker = Thread(target=self._run, name="uglyrag-indexer", daemon=True)
+            self._worker.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        """在当前任务完成后停止后台线程"""
+        with self._condition:
+            self._stop.set()
+            self._condition.notify_all()
+        if self._worker is not None:
+            self._worker.join(timeout)
+
+    def _get_job_field(self, job_id: str, column: str) -> Any:
+        with self._condition:
+            row = self.conn.execute(f"SELECT {column} FROM jobs WHERE job_id=?", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def _next_job(self) -> tuple[str, str, list[tuple[str, str]], bool, bool] | None:
+        with self._condition:
+            while not self._stop.is_set():
+                row = self.conn.execute(
+                    "SELECT job_id, vault, docs, update_exist, bulk_load FROM jobs WHERE status=? ORDER BY seq LIMIT 1",
+                    (PENDING,),
+                ).fetchone()
+                if row is not None:
+                    job_id, vault, docs, update_exist, bulk_load = row
+                    self._set_status(job_id, RUNNING)
+                    return job_id, vault, [tuple(doc) for doc in json.loads(docs)], bool(update_exist), bool(bulk_load)
+                # 任务可能由其他进程提交，定期检查队列
+                self._condition.wait(1.0)
+        return None
+
+    def _run(self) -> None:
+        from uglyrag.search import SearchEngine
+
+        while (job := self._next_job()) is not None:
+            job_id, vault, docs, update_exist, bulk_load = job
+            try:
+                chunks = SearchEngine.build(docs, vault, update_exist=update_exist, bulk_load=bulk_load)
+            except Exception as e:
+                logging.error(f"索引任务 {job_id} 失败: {e}")
+                with self._condition:
+                    self._set_status(job_id, FAILED, error=str(e))
+                    self._condition.notify_all()
+                continue
+            with self._condition:
+                self._set_status(job_id, DONE, chunks=chunks)
+                # 完成的任务不再需要保留文档内容
+                with self.conn:
+                    self.conn.execute("UPDATE jobs SET docs='[]' WHERE job_id=?", (job_id,))
+                self._condition.notify_all()
+            logging.info(f"索引任务 {job_id} 完成, 写入 {chunks} 个分段")
+
+    def _set_status(self, job_id: str, status: str, chunks: int = 0, error: str | None = None) -> None:
+        with self.conn:
+            self.conn.execute(
+                "UPDATE jobs SET status=?, chunks=?, error=?, updated_at=CURRENT_TIMESTAMP WHERE job_id=?",
+                (status, chunks, error, job_id),
+            )
+
+
+@cache
+def get_index_queue() -> IndexQueue:
+    """获取索引队列实例，队列文件位于 data_dir 下；存在未完成的任务时会启动后台线程继续处理"""
+    queue = IndexQueue(config.data_dir / config.get("queue_name", "INGEST", "queue.db"))
+    if queue.pending():
+        queue.start()
+    return queue
@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+import codecs
+import logging
+import mmap
+import time
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+from uglyrag.config import config
+
+# 按顺序检查的字节顺序标记
+BOMS = [
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+# 检测编码时采样的字节数
+SAMPLE_SIZE = 64 * 1024
+
+
+@dataclass
+class IngestStats:
+    """文件导入的统计信息"""
+
+    files_seen: int = 0
+    files_skipped: int = 0
+    files_ingested: int = 0
+    files_failed: int = 0
+    chunks: int = 0
+    seconds: float = 0.0
+
+    @property
+    def files_per_second(self) -> float:
+        return self.files_ingested / self.seconds if self.seconds else 0.0
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.chunks / self.seconds if self.seconds else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"共 {self.files_seen} 个文件，导入 {self.files_ingested} 个，跳过 {self.files_skipped} 个，"
+            f"失败 {self.files_failed} 个；写入 {self.chunks} 个分段，耗时 {self.seconds:.2f}s "
+            f"({self.files_per_second:.1f} files/s, {self.chunks_per_second:.1f} chunks/s)"
+        )
+
+
+def expand_paths(patterns: Iterable[str | Path], extensions: Iterable[str] | None = None) -> list[Path]:
+    """
+    展开文件路径、目录和 glob 模式。
+
+    目录会递归查找后缀在 extensions 中的文件，glob 模式支持 ``**``，结果去重后按路径排序。
+    """
+    if extensions is None:
+        extensions = config.get("extensions", "INGEST", ".md,.markdown,.txt,.rst").split(",")
+    suffixes = {ext.strip().lower() for ext in extensions if ext.strip()}
+    paths: set[Path] = set()
+    for pattern in patterns:
+        path = Path(pattern).expanduser()
+        if path.is_dir():
+            paths.update(p for p in path.rglob("*") if p.is_file() and p.suffix.lower() in suffixes)
+        elif path.is_file():
+            paths.add(path)
+        else:
+            # 从第一个包含通配符的部分开始按 glob 模式匹配
+            parts = path.parts
+            index = next((i for i, part in enumerate(parts) if any(c in part for c in "*?[")), None)
+            if index is None:
+                logging.warning(f"路径不存在: {path}")
+                continue
+            base = Path(*parts[:index]) if index else Path()
+            paths.update(p for p in base.glob(str(Path(*parts[index:]))) if p.is_file())
+    return sorted(p.resolve() for p in paths)
+
+
+def _is_chinese(text: str, threshold: float = 0.9) -> bool:
+    """
+    GB18030 几乎可以解码任意字节 (如 cp1252 的 "é" 与其后的 ASCII 字母会组成一个汉字)，
+    只有非 ASCII 字符大多是 GB2312 中的常用字符时才认为是中文文本
+    """
+    chars = [c for c in text[:SAMPLE_SIZE] if ord(c) > 0x7F]
+    common = 0
+    for c in chars:
+        try:
+            c.encode("gb2312")
+            common += 1
+        except UnicodeEncodeError:
+            pass
+    return common >= threshold * len(chars)
+
+
+def decode_text(data: bytes | mmap.mmap) -> str:
+    """
+    检测编码并解码。依次检查 BOM、UTF-8 和 GB18030 (仅限中文文本)，然后借助 charset_normalizer (若已安装) 推断，
+    最后回退到 cp1252 和 Latin-1。
+    """
+    head = data[:4]
+    for bom, encoding in BOMS:
+        if head.startswith(bom):
+            return str(data, encoding)
+    try:
+        return str(data, "utf-8")
+    except UnicodeDecodeError:
+        pass
+    try:
+        text = str(data, "gb18030")
+        if _is_chinese(text):
+            return text
+    except UnicodeDecodeError:
+        pass
+    try:
+        from charset_normalizer import from_bytes
+
+        results = from_bytes(data[:SAMPLE_SIZE])
+        best = results.best()
+        if best is not None:
+            # 样本较短时多个编码的评分相同，无法区分，此时优先选择最常见的 cp1252
+            if sum((m.chaos, m.coherence) == (best.chaos, best.coherence) for m in results) == 1:
+                return str(data, best.encoding, errors="replace")
+    except ImportError:
+        pass
+    try:
+        return str(data, "cp1252")
+    except UnicodeDecodeError:
+        return str(data, "latin-1")
+
+
+def read_file(path: Path, mmap_threshold: int | None = None) -> str:
+    """读取文本文件，超过 mmap_threshold 字节的文件通过内存映射解码，避免额外复制一份字节数据"""
+    if mmap_threshold is None:
+        mmap_threshold = int(config.get("mmap_threshold", "INGEST", str(1024 * 1024)))
+    with path.open("rb") as f:
+        size = path.stat().st_size
+        if size == 0:
+            return ""
+        if size < mmap_threshold:
+            return decode_text(f.read())
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return decode_text(mm)
+
+
+def _read(path: Path) -> tuple[Path, str | None]:
+    try:
+        return path, read_file(path)
+    except (OSError, ValueError) as e:
+        logging.error(f"读取文件失败 {path}: {e}")
+        return path, None
+
+
+def build_from_paths(
+    patterns: Iterable[str | Path],
+    vault: str | None = None,
+    workers: int | None = None,
+    force: bool = False,
+    bulk_load: bool = False,
+) -> IngestStats:
+    """
+    从文件导入文档，文件的绝对路径作为来源。
+
+    只有修改时间或大小发生变化的文件会被重新导入 (force 为 True 时全部导入)，文件按组并行读取后交给
+    SearchEngine.build 完成分割、向量化和写入。
+    """
+    from uglyrag.journal import get_journal
+    from uglyrag.search import SearchEngine
+
+    if vault is None:
+        vault = SearchEngine.default_vault
+    if workers is None:
+        workers = int(config.get("workers", "INGEST", "4"))
+    group_size = int(config.get("file_group_size", "INGEST", "64"))
+    journal = get_journal()
+    stats = IngestStats()
+    start = time.perf_counter()
+
+    paths = expand_paths(patterns)
+    stats.files_seen = len(paths)
+    known = journal.get_file_states(vault)
+    changed: list[tuple[Path, tuple[int, int]]] = []
+    for path in paths:
+        stat = path.stat()
+        state = (stat.st_mtime_ns, stat.st_size)
+        if not force and known.get(str(path)) == state:
+            stats.files_skipped += 1
+        else:
+            changed.append((path, state))
+    logging.info(f"发现 {len(paths)} 个文件，其中 {len(changed)} 个需要导入")
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for i in range(0, len(changed), group_size):
+            group = dict(changed[i : i + group_size])
+            docs = [(str(path), text) for path, text in executor.map(_read, group) if text is not None]
+            stats.files_failed += len(group) - len(docs)
+            stats.chunks += SearchEngine.build(docs, vault, update_exist=True, bulk_load=bulk_load)
+            journal.set_file_states(vault, {source: group[Path(source)] for source, _ in docs})
+            stats.files_ingested += len(docs)
+
+    stats.seconds = time.perf_counter() - start
+    logging.info(str(stats))
+    return stats
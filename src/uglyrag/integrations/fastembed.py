@@ -1,30 +1,39 @@
 from __future__ import annotations
 
+from functools import cache
+
 from fastembed import TextEmbedding
 from fastembed.rerank.cross_encoder import TextCrossEncoder
 
+from uglyrag.batching import pairwise
 from uglyrag.config import config
 
 model_dir = str(config.data_dir / "models")
 
-model = TextEmbedding(
-    model_name=config.get("embedding_model", "FastEmbed", "BAAI/bge-small-zh-v1.5"),
-    cache_dir=model_dir,
-)
+
+@cache
+def get_model() -> TextEmbedding:
+    """首次使用时才加载向量模型"""
+    return TextEmbedding(
+        model_name=config.get("embedding_model", "FastEmbed", "BAAI/bge-small-zh-v1.5"),
+        cache_dir=model_dir,
+    )
 
 
-rerank_model = config.get("rerank_model", "FastEmbed")  # "Xenova/ms-marco-MiniLM-L-6-v2"
-if rerank_model:
-    reranker = TextCrossEncoder(
+@cache
+def get_reranker() -> TextCrossEncoder | None:
+    """首次使用时才加载重排序模型，未配置时返回 None"""
+    rerank_model = config.get("rerank_model", "FastEmbed")  # "Xenova/ms-marco-MiniLM-L-6-v2"
+    if not rerank_model:
+        return None
+    return TextCrossEncoder(
         model_name=rerank_model,
         cache_dir=model_dir,
     )
-else:
-    reranker = None
 
 
 def embeddings(docs: list[str]) -> list[list[float]]:
-    return list(model.query_embed(docs))  # type: ignore
+    return list(get_model().query_embed(docs))  # type: ignore
 
 
 def embedding(doc: str) -> list[float]:
@@ -32,7 +41,18 @@ def embedding(doc: str) -> list[float]:
 
 
 def rerank(query: str, documents: list[str]) -> list[float]:
+    reranker = get_reranker()
     if reranker:
         return list(reranker.rerank(query, documents))
     else:
         raise NotImplementedError("No reranker model is specified.")
+
+
+def rerank_pairs(pairs: list[tuple[str, str]]) -> list[float]:
+    """对多个查询的 (query, document) 对一次打分，较早的 FastEmbed 版本不支持时按查询分组调用"""
+    reranker = get_reranker()
+    if not reranker:
+        raise NotImplementedError("No reranker model is specified.")
+    if not hasattr(reranker, "rerank_pairs"):
+        return pairwise(rerank)(pairs)
+    return list(reranker.rerank_pairs(pairs, batch_size=max(len(pairs), 1)))
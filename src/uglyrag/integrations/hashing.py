@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import hashlib
+import math
+import random
+import re
+import time
+from functools import lru_cache
+
+from uglyrag.config import config
+
+TOKEN_PATTERN = re.compile(r"[A-Za-z0-9]+|[\u4e00-\u9fff]+")
+
+
+def tokenize(text: str) -> list[str]:
+    """英文按单词切分并转为小写，中文按相邻两字切分"""
+    tokens: list[str] = []
+    for match in TOKEN_PATTERN.findall(text):
+        if match.isascii():
+            tokens.append(match.lower())
+        elif len(match) == 1:
+            tokens.append(match)
+        else:
+            tokens.extend(match[i : i + 2] for i in range(len(match) - 1))
+    return tokens
+
+
+def _digest(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+# 词的数量有限，缓存词的哈希值；整段文本的哈希不缓存
+_token_digest = lru_cache(maxsize=1 << 16)(_digest)
+
+
+def _normalize(vector: list[float]) -> list[float]:
+    norm = math.sqrt(sum(v * v for v in vector))
+    return [v / norm for v in vector] if norm else [1 / math.sqrt(len(vector))] * len(vector)
+
+
+def hash_embedding(text: str, dims: int) -> list[float]:
+    """
+    词袋哈希向量: 每个词按哈希映射到一个维度和符号，共享词越多的文本向量越接近
+    """
+    vector = [0.0] * dims
+    for token in tokenize(text):
+        digest = _token_digest(token)
+        vector[digest % dims] += 1.0 if digest >> 63 else -1.0
+    return _normalize(vector)
+
+
+def random_embedding(text: str, dims: int) -> list[float]:
+    """以文本的哈希为种子生成的随机单位向量，同一文本的结果相同，不同文本之间没有相关性"""
+    rng = random.Random(_digest(text))
+    return _normalize([rng.gauss(0, 1) for _ in range(dims)])
+
+
+def overlap_scores(query: str, documents: list[str]) -> list[float]:
+    """按查询词在文档中出现的比例打分"""
+    terms = set(tokenize(query))
+    if not terms:
+        return [0.0] * len(documents)
+    return [len(terms & set(tokenize(doc))) / len(terms) for doc in documents]
+
+
+def random_scores(query: str, documents: list[str]) -> list[float]:
+    """以查询和文档的哈希为种子生成的随机分数"""
+    return [random.Random(_digest(f"{query}\0{doc}")).random() for doc in documents]
+
+
+def _options(section: str) -> tuple[int, float]:
+    # 默认值不写回配置文件，作为向量模块加载失败时的后备也不会改动用户的配置
+    dims = int(config.get("dimensions", section) or 1024)
+    latency = float(config.get("latency", section) or 0)
+    return dims, latency
+
+
+def _sleep(latency: float) -> None:
+    # 模拟网络请求或模型推理的耗时 (秒)
+    if latency > 0:
+        time.sleep(latency)
+
+
+def embeddings(docs: list[str]) -> list[list[float]]:
+    dims, latency = _options("Hash")
+    _sleep(latency)
+    return [hash_embedding(doc, dims) for doc in docs]
+
+
+def random_embeddings(docs: list[str]) -> list[list[float]]:
+    dims, latency = _options("Random")
+    _sleep(latency)
+    return [random_embedding(doc, dims) for doc in docs]
+
+
+def rerank(query: str, documents: list[str]) -> list[float]:
+    _sleep(_options("Hash")[1])
+    return overlap_scores(query, documents)
+
+
+def random_rerank(query: str, documents: list[str]) -> list[float]:
+    _sleep(_options("Random")[1])
+    return random_scores(query, documents)
+
+
+def rerank_pairs(pairs: list[tuple[str, str]]) -> list[float]:
+    _sleep(_options("Hash")[1])
+    return [overlap_scores(query, [doc])[0] for query, doc in pairs]
+
+
+def random_rerank_pairs(pairs: list[tuple[str, str]]) -> list[float]:
+    _sleep(_options("Random")[1])
+    return [random_scores(query, [doc])[0] for query, doc in pairs]
@@ -1,74 +1,287 @@
 from __future__ import annotations
 
+import base64
+import gzip
+import json
 import logging
-from typing import Any
+import os
+import random
+import sys
+import threading
+import time
+from array import array
+from collections.abc import Callable
+from email.utils import parsedate_to_datetime
+from typing import Any, TypeVar, cast
 
 import requests
 
+from uglyrag import metrics
 from uglyrag.config import Config
+from uglyrag.integrations.hashing import tokenize
+from uglyrag.ratelimit import RateLimiter
 
 config = Config()
 api_key = config.get("api_key", "JINA")
 if api_key is None:
     raise ValueError("API 密钥未设置, 请修改 config.ini 文件，在 [JINA] 中设置 api_key=你的API密钥")
 
+REQUESTS = metrics.counter("uglyrag_jina_requests_total", "Jina API 请求次数")
+ERRORS = metrics.counter("uglyrag_jina_errors_total", "Jina API 请求失败次数")
+RETRIES = metrics.counter("uglyrag_jina_retries_total", "Jina API 重试次数")
+SPLITS = metrics.counter("uglyrag_jina_splits_total", "Jina API 失败后拆分批次的次数")
+REQUEST_SECONDS = metrics.histogram("uglyrag_jina_request_seconds", "Jina API 请求耗时 (秒)")
+THROTTLE_SECONDS = metrics.histogram("uglyrag_jina_throttle_seconds", "Jina API 请求在客户端限流中等待的时间 (秒)")
+
+# 可以重试的状态码: 限流、超时和服务端错误
+RETRY_STATUS = {408, 429, 500, 502, 503, 504}
+# 请求体达到该字节数时才压缩，太小的请求压缩后节省不了多少
+COMPRESS_MIN_BYTES = 1024
+
+T = TypeVar("T")
+
+
+class JinaError(Exception):
+    """Jina API 请求失败，status 为 HTTP 状态码，网络错误时为 None，retry_after 为服务端建议的等待秒数"""
+
+    def __init__(self, message: str, status: int | None = None, retry_after: float | None = None) -> None:
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def splittable(self) -> bool:
+        """
+        请求体过大或输入无效时，拆小批次可能成功。网络错误和服务端错误已经重试过，
+        拆分只会成倍增加请求数和等待时间，直接抛出
+        """
+        return self.status in (400, 413)
+
+
+def _retry_after(response: requests.Response) -> float | None:
+    """解析 Retry-After 响应头，支持秒数和 HTTP 日期两种格式"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+# 每个字节按位从高到低展开为 8 个 float32: 1 为 1.0，0 为 -1.0
+_BITS = [array("f", [1.0 if byte >> (7 - i) & 1 else -1.0 for i in range(8)]).tobytes() for byte in range(256)]
+
+
+def decode_embedding(value: Any, embedding_type: str) -> list[float]:
+    """
+    解码 Jina API 返回的向量。base64 为小端 float32，直接复制到 array('f') 中，不创建 Python 的 float 对象；
+    binary (int8) 和 ubinary (uint8) 每位对应一个维度，展开为 ±1 的 float32 向量，欧氏距离的排序与汉明距离相同。
+    返回的 array('f') 与 list[float] 一样支持下标、切片、len 和迭代
+    """
+    if embedding_type == "base64":
+        vector = array("f", base64.b64decode(value))
+        if sys.byteorder == "big":
+            vector.byteswap()
+    elif embedding_type in ("binary", "ubinary"):
+        vector = array("f", b"".join(_BITS[byte & 0xFF] for byte in value))
+    else:
+        return cast("list[float]", value)
+    return cast("list[float]", vector)
+
+
+def _count_tokens(texts: list[str]) -> int:
+    """估算 token 数，用于客户端限流，实际用量以响应中的 usage 为准"""
+    return sum(len(tokenize(text)) for text in texts)
+
 
 class JinaAPI:
-    url = "https://api.jina.ai/v1"
+    # 可以在 [JINA] 中设置 url 指向兼容的服务，如 uglyrag mock-jina 启动的本地模拟服务
+    url = (config.get("url", "JINA") or "https://api.jina.ai/v1").rstrip("/")
     headers = {
         "Content-Type": "application/json",
         "Authorization": f"Bearer {api_key}",
     }
+    # 失败后最多重试 max_retries 次，第 n 次重试前随机等待 0 到 backoff * 2^n 秒 (不超过 max_backoff)，
+    # 响应中有 Retry-After 时至少等待该时长
+    max_retries = int(config.get("max_retries", "JINA") or 5)
+    backoff = float(config.get("backoff", "JINA") or 0.5)
+    max_backoff = float(config.get("max_backoff", "JINA") or 30)
+    timeout = float(config.get("timeout", "JINA") or 60)
+    # 按账户的每分钟请求数和 token 数上限在客户端限流，0 (默认) 表示不限制。
+    # 限流只在进程内生效，多进程服务的每个子进程各自限流，需要按进程数分摊上限
+    limiter = RateLimiter(int(config.get("rpm", "JINA") or 0), int(config.get("tpm", "JINA") or 0))
+    # base64 (默认) 的响应约为 float 的 JSON 数组的 1/4 且解码快一个数量级；binary/ubinary 再小 32 倍，但会损失精度
+    embedding_type = config.get("embedding_type", "JINA") or "base64"
+    # 用 gzip 压缩较大的请求体，服务端不支持时 (415) 自动关闭；响应的压缩由 requests 通过 Accept-Encoding 协商
+    compress = (config.get("compress", "JINA") or "true").lower() in ("1", "true", "yes", "on")
+    _sleep: Callable[[float], None] = staticmethod(time.sleep)
+    _local = threading.local()
 
     @classmethod
-    def _request(cls, module: str, data: dict[str, Any], full_url: str | None = None) -> Any:
-        if not data:
-            logging.warning("Data is empty, skipping request.")
-            return None
+    def _session(cls) -> requests.Session:
+        """每个线程复用一个会话，保持长连接"""
+        session = getattr(cls._local, "session", None)
+        if session is None:
+            session = cls._local.session = requests.Session()
+            session.headers.update(cls.headers)
+        return session
 
+    @classmethod
+    def _delay(cls, attempt: int, retry_after: float | None) -> float:
+        delay = random.uniform(0, min(cls.max_backoff, cls.backoff * 2**attempt))
+        if retry_after is not None:
+            # 加上少量随机时间，避免多个线程在同一时刻重试
+            delay = retry_after + random.uniform(0, cls.backoff)
+        return delay
+
+    @classmethod
+    def _post(cls, module: str, full_url: str, body: bytes) -> Any:
+        """发送一次请求，失败时抛出 JinaError"""
+        compressed = cls.compress and len(body) >= COMPRESS_MIN_BYTES
+        headers = {"Content-Encoding": "gzip"} if compressed else None
+        REQUESTS.inc(module=module)
+        start = time.perf_counter()
         try:
-            if full_url is None:
-                full_url = f"{cls.url}/{module}"
-            logging.debug(f"Sending POST request to {full_url} with data: {data}")
-            response = requests.post(full_url, headers=cls.headers, json=data)
-            response.raise_for_status()  # 检查响应状态码
-            logging.debug(f"Received response with status code: {response.status_code}")
-            return response.json()
+            response = cls._session().post(
+                full_url,
+                data=gzip.compress(body, compresslevel=5) if compressed else body,
+                headers=headers,
+                timeout=cls.timeout,
+            )
         except requests.RequestException as e:
-            logging.error(f"Request failed: {e}")
-            return None
+            ERRORS.inc(module=module, status="network")
+            raise JinaError(f"请求 {full_url} 失败: {e}") from e
+        finally:
+            REQUEST_SECONDS.observe(time.perf_counter() - start)
+        if response.status_code == 415 and compressed:
+            logging.warning(f"{full_url} 不支持压缩的请求体，之后的请求不再压缩")
+            cls.compress = False
+            return cls._post(module, full_url, body)
+        if response.status_code >= 400:
+            ERRORS.inc(module=module, status=str(response.status_code))
+            raise JinaError(
+                f"请求 {full_url} 失败: {response.status_code} {response.text[:200]}",
+                response.status_code,
+                _retry_after(response),
+            )
+        logging.debug("Received response with status code: %s", response.status_code)
+        return response.json()
 
     @classmethod
-    def embeddings(cls, texts: list[str]) -> list[list[float]]:
+    def _request(cls, module: str, data: dict[str, Any], full_url: str | None = None, tokens: int = 0) -> Any:
+        """
+        发送请求，网络错误、限流和服务端错误时按指数退避重试，重试次数用完或遇到其他错误时抛出 JinaError。
+        tokens 为预估的 token 数，发送前在客户端限流中等待
+        """
+        if not data:
+            raise ValueError("请求内容为空")
+        if full_url is None:
+            full_url = f"{cls.url}/{module}"
+        # 请求内容可能很大，只在启用 DEBUG 级别时才输出
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug("Sending POST request to %s with data: %s", full_url, data)
+        body = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        attempt = 0
+        while True:
+            if cls.limiter.enabled:
+                THROTTLE_SECONDS.observe(cls.limiter.acquire(tokens))
+            try:
+                result = cls._post(module, full_url, body)
+            except JinaError as e:
+                if attempt == cls.max_retries or (e.status is not None and e.status not in RETRY_STATUS):
+                    logging.error(f"{e}")
+                    raise
+                if e.status == 429 and e.retry_after is not None:
+                    # 其他线程的请求也一起推迟，避免继续触发限流
+                    cls.limiter.backoff(e.retry_after)
+                delay = cls._delay(attempt, e.retry_after)
+                attempt += 1
+                RETRIES.inc(module=module, status=str(e.status or "network"))
+                logging.warning(f"{e}，{delay:.2f} 秒后第 {attempt} 次重试")
+                cls._sleep(delay)
+                continue
+            usage = result.get("usage", {}).get("total_tokens") if isinstance(result, dict) else None
+            if isinstance(usage, int):
+                cls.limiter.settle(tokens, usage)
+            return result
+
+    @classmethod
+    def _split(cls, module: str, items: list[T], call: Callable[[list[T]], list[Any]]) -> list[Any]:
+        """调用 call 处理 items，因批次过大或输入无效失败时拆成两半分别重试，直到单个文本仍然失败"""
+        try:
+            return call(items)
+        except JinaError as e:
+            if len(items) <= 1 or not e.splittable:
+                raise
+            SPLITS.inc(module=module)
+            half = len(items) // 2
+            logging.warning(f"{len(items)} 个文本的批次请求失败，拆分为 {half} 和 {len(items) - half} 个重试")
+            return cls._split(module, items[:half], call) + cls._split(module, items[half:], call)
+
+    @classmethod
+    def _embeddings(cls, texts: list[str]) -> list[list[float]]:
         data = {
-            "model": "jina-embeddings-v3",
+            "model": config.get("embedding_model", "JINA") or "jina-embeddings-v3",
             "task": "text-matching",
             "late_chunking": False,
-            "dimensions": 1024,
-            "embedding_type": "float",
+            # jina-embeddings-v3 支持 Matryoshka 表示，可以直接输出较低维度的向量
+            "dimensions": int(config.get("dimensions", "JINA") or 1024),
+            "embedding_type": cls.embedding_type,
         }
         data["input"] = texts
-        res = cls._request("embeddings", data)
-        return [object["embedding"] for object in res["data"]]
+        res = cls._request("embeddings", data, tokens=_count_tokens(texts))
+        # 按 index 排序，不依赖响应中的顺序
+        return [
+            decode_embedding(object["embedding"], cls.embedding_type)
+            for object in sorted(res["data"], key=lambda object: object.get("index", 0))
+        ]
+
+    @classmethod
+    def embeddings(cls, texts: list[str]) -> list[list[float]]:
+        if not texts:
+            return []
+        return cls._split("embeddings", texts, cls._embeddings)
 
     @classmethod
     def embedding(cls, text: str) -> list[float]:
         return cls.embeddings([text])[0]
 
     @classmethod
-    def rerank(cls, query: str, documents: list[str]) -> list[float]:
-        if not documents or not query:
-            return []
+    def _rerank(cls, query: str, documents: list[str]) -> list[float]:
         data = {
             "model": "jina-reranker-v2-base-multilingual",
             "query": query,
             "documents": documents,
             "top_n": len(documents),
+            "return_documents": False,  # 只需要分数，不需要返回文档内容
         }
-        res = cls._request("rerank", data)["results"]
+        # 每个文档都与查询拼接后计算
+        tokens = _count_tokens(documents) + len(tokenize(query)) * len(documents)
+        res = cls._request("rerank", data, tokens=tokens)["results"]
         result = [0.0] * len(documents)
         for item in res:
             index = item.get("index")
             if index is not None and 0 <= index < len(documents):
                 result[index] = item["relevance_score"]
         return result
+
+    @classmethod
+    def rerank(cls, query: str, documents: list[str]) -> list[float]:
+        if not documents or not query:
+            return []
+        # 各个文档的分数相互独立，拆分后的结果可以直接拼接
+        return cls._split("rerank", documents, lambda docs: cls._rerank(query, docs))
+
+
+def _reset_after_fork() -> None:
+    # 子进程不能与父进程共用连接
+    JinaAPI._local = threading.local()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
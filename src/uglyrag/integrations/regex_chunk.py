@@ -7,6 +7,7 @@
 from __future__ import annotations
 
 import re
+from functools import cache
 
 # Define variables for magic numbers
 MAX_HEADING_LENGTH = 6
@@ -128,11 +129,13 @@ FALLBACK_REMAINING_PATTERN = get_sentence_pattern(MAX_STANDALONE_LINE_LENGTH)
 FULL_PATTERN = f"({FRONTMATTER_PATTERN}|{HORIZONTAL_RULE_PATTERN}|{HEADING_PATTERN}|{CITATION_PATTERN}|{TABLE_PATTERN}|{BLOCK_QUOTES_PATTERN}|{LIST_PATTERN}|{CODE_BLOCK_PATTERN}|{LATEX_PATTERN}|{STANDALONE_LINE_PATTERN}|{PARAGRAPH_PATTERN}|{QUOTED_TEXT_PATTERN}|{SENTENCE_PATTERN}?|{HTML_TAG_PATTERN}|{FALLBACK_REMAINING_PATTERN})"
 
 
-# 使用 re 进行编译
-regex = re.compile(FULL_PATTERN, re.DOTALL | re.MULTILINE | re.UNICODE)
+@cache
+def get_regex() -> re.Pattern[str]:
+    # 使用 re 进行编译，编译耗时较长，推迟到首次分割时进行
+    return re.compile(FULL_PATTERN, re.DOTALL | re.MULTILINE | re.UNICODE)
 
 
 def split_text(text: str) -> list[str]:
     # Apply the regex
-    chunks = regex.findall(text)
+    chunks = get_regex().findall(text)
     return [chunk.strip() for chunk in chunks if chunk.strip()]
@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import sqlite3
+from array import array
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+from functools import cache
+from pathlib import Path
+from sqlite3 import Connection
+from threading import Lock
+from typing import Any
+
+from uglyrag.config import config
+
+# 批次所处的阶段，按顺序推进
+CHUNKED = "chunked"
+EMBEDDED = "embedded"
+COMMITTED = "committed"
+
+
+@dataclass
+class Batch:
+    """导入任务中的一个批次，keys 为批次内各分段的 (source, part_id)"""
+
+    job_id: str
+    batch_no: int
+    stage: str
+    keys: list[tuple[str, str]]
+
+    @property
+    def sources(self) -> list[str]:
+        return list(dict.fromkeys(source for source, _ in self.keys))
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class IngestJournal:
+    """
+    导入日志，持久化记录每个导入任务的批次划分以及各批次的进度 (已分割、已向量化、已提交)。
+
+    导入中断后，使用相同的输入重新调用 build 时可以跳过已提交的批次，
+    已向量化但未提交的批次直接复用记录下的向量，无需重新请求向量模型。
+    """
+
+    path: Path
+    conn: Connection = field(init=False)
+    _lock: Lock = field(default_factory=Lock)
+
+    def __post_init__(self) -> None:
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL")
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs (job_id TEXT PRIMARY KEY, vault TEXT NOT NULL, status TEXT NOT NULL, created_at DATETIME DEFAULT CURRENT_TIMESTAMP, updated_at DATETIME DEFAULT CURRENT_TIMESTAMP)"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS batches (job_id TEXT NOT NULL, batch_no INTEGER NOT NULL, stage TEXT NOT NULL, keys TEXT NOT NULL, PRIMARY KEY (job_id, batch_no))"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (job_id TEXT NOT NULL, batch_no INTEGER NOT NULL, content_hash TEXT NOT NULL, vector BLOB NOT NULL, PRIMARY KEY (job_id, batch_no, content_hash))"
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS files (vault TEXT NOT NULL, path TEXT NOT NULL, mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL, PRIMARY KEY (vault, path))"
+            )
+        logging.debug("导入日志已打开: %s", self.path)
+
+    @staticmethod
+    def job_id(vault: str, docs: Iterable[tuple[Any, str]], update_exist: bool = False) -> str:
+        """根据 vault、导入参数和文档内容生成任务 ID，相同的输入会得到相同的 ID"""
+        digest = hashlib.sha256(f"{vault}\0{update_exist}".encode())
+        for source, text in docs:
+            digest.update(f"\0{source}\0{content_hash(text or '')}".encode())
+        return digest.hexdigest()
+
+    def get_batches(self, job_id: str) -> list[Batch] | None:
+        """获取未完成任务的批次，任务不存在或已完成时返回 None"""
+        with self._lock:
+            row = self.conn.execute("SELECT status FROM jobs WHERE job_id=?", (job_id,)).fetchone()
+            if row is None or row[0] != "running":
+                return None
+            rows = self.conn.execute(
+                "SELECT batch_no, stage, keys FROM batches WHERE job_id=? ORDER BY batch_no", (job_id,)
+            ).fetchall()
+        return [
+            Batch(job_id, batch_no, stage, [tuple(key) for key in json.loads(keys)]) for batch_no, stage, keys in rows
+        ]
+
+    def start_job(self, job_id: str, vault: str, data: list[tuple[str, str, str]], batch_size: int) -> list[Batch]:
+        """
+        记录新的导入任务并划分批次。分段先按来源分组 (保持各来源首次出现的顺序)，同一来源的分段总是位于同一个批次中，
+        以便恢复时可以按来源整体清理未提交完成的批次，即使同一来源在 data 中出现多次也不会删除已提交的分段。
+        """
+        groups: dict[str, list[tuple[str, str]]] = {}
+        for source, part_id, _ in data:
+            groups.setdefault(source, []).append((source, part_id))
+        batches: list[Batch] = []
+        keys: list[tuple[str, str]] = []
+        for i, group in enumerate(groups.values()):
+            keys.extend(group)
+            if len(keys) >= batch_size or i == len(groups) - 1:
+                batches.append(Batch(job_id, len(batches), CHUNKED, keys))
+                keys = []
+        with self._lock, self.conn:
+            self._delete_job(job_id)
+            self.conn.execute("INSERT INTO jobs (job_id, vault, status) VALUES (?, ?, 'running')", (job_id, vault))
+            self.conn.executemany(
+                "INSERT INTO batches (job_id, batch_no, stage, keys) VALUES (?, ?, ?, ?)",
+                [
+                    (job_id, batch.batch_no, batch.stage, json.dumps(batch.keys, ensure_ascii=False))
+                    for batch in batches
+                ],
+            )
+        logging.debug("导入任务 %s 已记录, 共 %s 个批次", job_id[:12], len(batches))
+        return batches
+
+    def mark_embedded(self, batch: Batch, embeddings: dict[str, list[float]]) -> None:
+        """记录批次的向量，内容以哈希值为键"""
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (job_id, batch_no, content_hash, vector) VALUES (?, ?, ?, ?)",
+                [
+                    (batch.job_id, batch.batch_no, content_hash(content), array("f", vector).tobytes())
+                    for content, vector in embeddings.items()
+                ],
+            )
+            self._set_stage(batch, EMBEDDED)
+
+    def load_embeddings(self, batch: Batch, contents: Iterable[str]) -> dict[str, list[float]]:
+        """读取批次已记录的向量"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT content_hash, vector FROM embeddings WHERE job_id=? AND batch_no=?",
+                (batch.job_id, batch.batch_no),
+            ).fetchall()
+        vectors = {key: array("f", value).tolist() for key, value in rows}
+        return {content: vectors[key] for content in contents if (key := content_hash(content)) in vectors}
+
+    def mark_committed(self, batch: Batch) -> None:
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM embeddings WHERE job_id=? AND batch_no=?", (batch.job_id, batch.batch_no))
+            self._set_stage(batch, COMMITTED)
+
+    def finish_job(self, job_id: str) -> None:
+        """任务完成后只保留任务记录，清理批次信息"""
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM batches WHERE job_id=?", (job_id,))
+            self.conn.execute("DELETE FROM embeddings WHERE job_id=?", (job_id,))
+            self.conn.execute("UPDATE jobs SET status='done', updated_at=CURRENT_TIMESTAMP WHERE job_id=?", (job_id,))
+        logging.debug("导入任务 %s 已完成", job_id[:12])
+
+    def get_file_states(self, vault: str) -> dict[str, tuple[int, int]]:
+        """获取已导入文件的 (mtime_ns, size)，用于跳过未修改的文件"""
+        with self._lock:
+            rows = self.conn.execute("SELECT path, mtime_ns, size FROM files WHERE vault=?", (vault,)).fetchall()
+        return {path: (mtime_ns, size) for path, mtime_ns, size in rows}
+
+    def set_file_states(self, vault: str, states: dict[str, tuple[int, int]]) -> None:
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO files (vault, path, mtime_ns, size) VALUES (?, ?, ?, ?)",
+                [(vault, path, mtime_ns, size) for path, (mtime_ns, size) in states.items()],
+            )
+
+    def reset(self) -> None:
+        """清空所有任务记录，数据库被重置时调用"""
+        with self._lock, self.conn:
+            for table in ("jobs", "batches", "embeddings", "files"):
+                self.conn.execute(f"DELETE FROM {table}")
+
+    def _set_stage(self, batch: Batch, stage: str) -> None:
+        self.conn.execute(
+            "UPDATE batches SET stage=? WHERE job_id=? AND batch_no=?", (stage, batch.job_id, batch.batch_no)
+        )
+        self.conn.execute("UPDATE jobs SET updated_at=CURRENT_TIMESTAMP WHERE job_id=?", (batch.job_id,))
+        batch.stage = stage
+
+    def _delete_job(self, job_id: str) -> None:
+        for table in ("jobs", "batches", "embeddings"):
+            self.conn.execute(f"DELETE FROM {table} WHERE job_id=?", (job_id,))
+
+
+@cache
+def get_journal() -> IngestJournal:
+    """获取导入日志实例，日志文件位于 data_dir 下"""
+    return IngestJournal(config.data_dir / config.get("journal_name", "INGEST", "journal.db"))
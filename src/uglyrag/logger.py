@@ -1,8 +1,14 @@
 from __future__ import annotations
 
+import atexit
+import copy
 import logging
+import os
+import queue
+import weakref
 from datetime import datetime
-from logging import FileHandler, Formatter, StreamHandler
+from logging import Formatter, Handler, LogRecord, StreamHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
 
 # 缓存格式化器
@@ -13,7 +19,7 @@ def create_formatter() -> Formatter:
     return formatter
 
 
-def configure_logger(logger: StreamHandler | FileHandler, level_str: str) -> None:
+def configure_logger(logger: Handler, level_str: str) -> None:
     levels = {
         "DEBUG": logging.DEBUG,
         "INFO": logging.INFO,
@@ -25,22 +31,120 @@ def configure_logger(logger: StreamHandler | FileHandler, level_str: str) -> Non
     logger.setLevel(log_level)
 
 
+class AsyncHandler(QueueHandler):
+    """
+    将日志记录放入队列，由后台线程中的 QueueListener 格式化并写入文件，调用方不需要等待磁盘写入。
+    消息和异常信息在调用方线程中确定，时间、级别等格式化仍由后台线程完成。
+    """
+
+    def __init__(self, handler: Handler) -> None:
+        super().__init__(queue.SimpleQueue())
+        self.setLevel(handler.level)
+        self.listener = QueueListener(self.queue, handler, respect_handler_level=True)
+        self.listener.start()
+        _handlers.add(self)
+
+    def prepare(self, record: LogRecord) -> LogRecord:
+        # 参数在记录日志之后可能被修改，与 QueueHandler 一样先合并消息并清除 args 和 exc_info
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = record.exc_text or formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def stop(self) -> None:
+        """停止后台线程，队列中剩余的日志会在停止前全部写入"""
+        if self.listener._thread is not None:
+            self.listener.stop()
+            for handler in self.listener.handlers:
+                handler.close()
+
+    def close(self) -> None:
+        self.stop()
+        super().close()
+
+
+_handlers: weakref.WeakSet[AsyncHandler] = weakref.WeakSet()
+
+
+@atexit.register
+def _stop_all() -> None:
+    # 只注册一次退出钩子，不持有处理器的强引用，被替换的处理器可以被回收
+    for handler in list(_handlers):
+        handler.stop()
+
+
+def _per_process_handler(handler: Handler) -> Handler:
+    """
+    多个进程轮转同一个日志文件时会互相覆盖，子进程改为写入文件名中带有进程号的日志文件，各自轮转
+    """
+    if not isinstance(handler, RotatingFileHandler):
+        return handler
+    path = Path(handler.baseFilename)
+    child = RotatingFileHandler(
+        path.with_name(f"{path.stem}.{os.getpid()}{path.suffix}"),
+        mode="a",
+        maxBytes=handler.maxBytes,
+        backupCount=handler.backupCount,
+        encoding=handler.encoding,
+    )
+    child.setLevel(handler.level)
+    child.setFormatter(handler.formatter)
+    return child
+
+
+def _restart_after_fork() -> None:
+    # fork 出的子进程中没有后台线程，重新启动未停止的处理器的线程。
+    # 父进程的线程可能正阻塞在队列上，队列的状态不能继续使用；队列中尚未写入的日志由父进程写入。
+    # 父进程的文件处理器继续由父进程使用，子进程中不关闭，只替换为子进程自己的日志文件
+    for handler in list(_handlers):
+        if handler.listener._thread is not None:
+            handler.queue = handler.listener.queue = queue.SimpleQueue()
+            handler.listener.handlers = tuple(_per_process_handler(h) for h in handler.listener.handlers)
+            handler.listener._thread = None
+            handler.listener.start()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def _update_root_level(logger: logging.Logger) -> None:
+    # 根日志记录器的级别取各处理器的最低级别，低于该级别的日志在调用处就被丢弃
+    levels = [handler.level for handler in logger.handlers if handler.level != logging.NOTSET]
+    logger.setLevel(min(levels) if levels else logging.WARNING)
+
+
 def configure_basic_logging(log_level: str = "INFO") -> None:
     logger = logging.getLogger()
-    logger.setLevel(logging.DEBUG)
 
     for handler in logger.handlers[:]:
         logger.removeHandler(handler)
+        if isinstance(handler, AsyncHandler):
+            handler.close()
 
     stream_handler = StreamHandler()
     configure_logger(stream_handler, log_level)
     stream_handler.setFormatter(create_formatter())
 
     logger.addHandler(stream_handler)
+    _update_root_level(logger)
     logging.debug("基本日志配置完成")
 
 
-def configure_file_logging(data_dir: Path, log_file_name: str = "") -> None:
+def configure_file_logging(
+    data_dir: Path,
+    log_file_name: str = "",
+    log_level: str = "DEBUG",
+    max_bytes: int = 10 * 1024 * 1024,
+    backup_count: int = 5,
+) -> None:
+    """
+    配置写入 data_dir/logs 的日志文件。文件超过 max_bytes 字节时轮转，保留 backup_count 个旧文件；
+    写入由后台线程完成。fork 出的子进程写入文件名中带有进程号的日志文件 (如 2024-01-01.1234.log)
+    """
     logs_dir = data_dir / "logs"
     logs_dir.mkdir(parents=True, exist_ok=True)
 
@@ -49,12 +153,14 @@ def configure_file_logging(data_dir: Path, log_file_name: str = "") -> None:
     log_file = logs_dir / log_file_name
 
     logger = logging.getLogger()
-    logger.setLevel(logging.DEBUG)
 
-    file_handler = FileHandler(log_file, mode="a", encoding="utf-8")
-    file_handler.setLevel(logging.DEBUG)
+    file_handler = RotatingFileHandler(
+        log_file, mode="a", maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+    )
+    configure_logger(file_handler, log_level)
     file_handler.setFormatter(create_formatter())
 
-    logger.addHandler(file_handler)
+    logger.addHandler(AsyncHandler(file_handler))
+    _update_root_level(logger)
 
-    logging.debug(f"日志文件已配置为: {log_file}")
+    logging.debug("日志文件已配置为: %s", log_file)
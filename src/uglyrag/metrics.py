@@ -0,0 +1,252 @@
+from __future__ import annotations
+
+import bisect
+import time
+from collections.abc import Callable
+from threading import Lock
+from typing import Any
+
+# 耗时直方图默认的桶边界 (秒)
+DEFAULT_BOUNDS: tuple[float, ...] = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# 批量大小直方图的桶边界
+SIZE_BOUNDS: tuple[float, ...] = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+
+def _format_labels(labels: tuple[tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class Counter:
+    """
+    只增不减的计数器，可以按标签分别计数
+    """
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str = "") -> None:
+        self.name = name
+        self.help = help
+        self._lock = Lock()
+        self._values: dict[tuple[tuple[str, str], ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def total(self) -> float:
+        return sum(self._values.values())
+
+    def snapshot(self) -> Any:
+        with self._lock:
+            if set(self._values) <= {()}:
+                return self._values.get((), 0)
+            return {_format_labels(key): value for key, value in self._values.items()}
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            values = dict(self._values) or {(): 0}
+        return [f"{self.name}{_format_labels(key)} {value}" for key, value in values.items()]
+
+
+class Gauge:
+    """
+    在读取时调用函数取值的指标，用于队列长度、缓存命中率等当前状态
+    """
+
+    type = "gauge"
+
+    def __init__(self, name: str, help: str = "", function: Callable[[], float] = lambda: 0) -> None:
+        self.name = name
+        self.help = help
+        self.function = function
+
+    def snapshot(self) -> float:
+        try:
+            return self.function()
+        except Exception:
+            return float("nan")
+
+    def samples(self) -> list[str]:
+        return [f"{self.name} {self.snapshot()}"]
+
+
+class Histogram:
+    """
+    按固定边界分桶的直方图，分位数按桶的上界估计
+    """
+
+    type = "histogram"
+
+    def __init__(self, name: str = "", help: str = "", bounds: tuple[float, ...] = DEFAULT_BOUNDS) -> None:
+        self.name = name
+        self.help = help
+        self.bounds = bounds
+        self._lock = Lock()
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.buckets[index] += 1
+            self.count += 1
+            self.total += value
+            self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "count": self.count,
+                "sum": round(self.total, 6),
+                "mean": round(self.total / self.count, 6) if self.count else 0.0,
+                "max": round(self.max, 6),
+                "p50": self.quantile(0.5),
+                "p95": self.quantile(0.95),
+                "p99": self.quantile(0.99),
+                "buckets": {str(bound): count for bound, count in zip((*self.bounds, "+Inf"), self.buckets)},
+            }
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            buckets, count, total = list(self.buckets), self.count, self.total
+        lines = []
+        cumulative = 0
+        for bound, bucket in zip((*self.bounds, "+Inf"), buckets):
+            cumulative += bucket
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines += [f"{self.name}_sum {total}", f"{self.name}_count {count}"]
+        return lines
+
+
+Metric = Counter | Gauge | Histogram
+
+
+class MetricsRegistry:
+    """
+    指标注册表，可以导出为字典快照或 Prometheus 文本格式。同名指标只注册一次，重复注册返回已有的指标
+    """
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._metrics: dict[str, Metric] = {}
+
+    def _register(self, metric: Metric) -> Any:
+        with self._lock:
+            existing = self._metrics.setdefault(metric.name, metric)
+        if type(existing) is not type(metric):
+            raise ValueError(f"指标 {metric.name} 已注册为 {existing.type}")
+        return existing
+
+    def counter(self, name: str, help: str = "") -> Counter:
+        return self._register(Counter(name, help))
+
+    def gauge(self, name: str, help: str, function: Callable[[], float]) -> Gauge:
+        gauge = self._register(Gauge(name, help, function))
+        gauge.function = function
+        return gauge
+
+    def histogram(self, name: str, help: str = "", bounds: tuple[float, ...] = DEFAULT_BOUNDS) -> Histogram:
+        return self._register(Histogram(name, help, bounds))
+
+    def snapshot(self) -> dict[str, Any]:
+        """所有指标当前值的字典"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+    def to_prometheus(self) -> str:
+        """Prometheus 文本格式 (0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            if metric.help:
+                lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines += metric.samples()
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def counter(name: str, help: str = "") -> Counter:
+    return registry.counter(name, help)
+
+
+def gauge(name: str, help: str, function: Callable[[], float]) -> Gauge:
+    return registry.gauge(name, help, function)
+
+
+def histogram(name: str, help: str = "", bounds: tuple[float, ...] = DEFAULT_BOUNDS) -> Histogram:
+    return registry.histogram(name, help, bounds)
+
+
+def snapshot() -> dict[str, Any]:
+    return registry.snapshot()
+
+
+def to_prometheus() -> str:
+    return registry.to_prometheus()
+
+
+def hit_ratio(hits: Counter, misses: Counter) -> Callable[[], float]:
+    """由命中和未命中计数计算命中率的函数，用作 Gauge 的取值函数"""
+
+    def ratio() -> float:
+        total = hits.total() + misses.total()
+        return hits.total() / total if total else 0.0
+
+    return ratio
+
+
+class TimedLock:
+    """
+    记录等待时间的互斥锁，接口与 threading.Lock 相同。没有竞争时记录为 0
+    """
+
+    def __init__(self, wait_histogram: Histogram) -> None:
+        self._lock = Lock()
+        self._wait = wait_histogram
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        if self._lock.acquire(blocking=False):
+            self._wait.observe(0.0)
+            return True
+        if not blocking:
+            return False
+        start = time.perf_counter()
+        acquired = self._lock.acquire(timeout=timeout)
+        self._wait.observe(time.perf_counter() - start)
+        return acquired
+
+    def release(self) -> None:
+        self._lock.release()
+
+    def locked(self) -> bool:
+        return self._lock.locked()
+
+    def __enter__(self) -> bool:
+        return self.acquire()
+
+    def __exit__(self, *args: object) -> None:
+        self.release()
@@ -0,0 +1,245 @@
+from __future__ import annotations
+
+import base64
+import gzip
+import json
+import logging
+import math
+import random
+import sys
+import threading
+import time
+import zlib
+from array import array
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+from uglyrag.integrations.hashing import hash_embedding, overlap_scores, tokenize
+
+EMBEDDING_TYPES = ("float", "base64", "binary", "ubinary")
+
+
+def encode_embedding(vector: list[float], embedding_type: str) -> Any:
+    """按 Jina API 的 embedding_type 编码向量: base64 为小端 float32，binary/ubinary 为按符号打包的位 (int8/uint8)"""
+    if embedding_type == "base64":
+        data = array("f", vector)
+        if sys.byteorder == "big":
+            data.byteswap()
+        return base64.b64encode(data.tobytes()).decode("ascii")
+    if embedding_type in ("binary", "ubinary"):
+        packed = [sum(1 << (7 - j) for j, v in enumerate(vector[i : i + 8]) if v > 0) for i in range(0, len(vector), 8)]
+        return packed if embedding_type == "ubinary" else [b - 256 if b > 127 else b for b in packed]
+    return vector
+
+
+class MockJinaHandler(BaseHTTPRequestHandler):
+    """
+    处理 /v1/embeddings 和 /v1/rerank 请求，请求和响应的格式与 Jina API 相同
+    """
+
+    protocol_version = "HTTP/1.1"  # 支持长连接，便于测量连接复用
+    server: MockJinaServer
+
+    def setup(self) -> None:
+        super().setup()
+        self.server.record("connections")
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logging.debug("mock-jina: " + format, *args)
+
+    def _send(self, status: int, body: dict[str, Any], headers: dict[str, str] | None = None) -> None:
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        # 客户端支持时压缩较大的响应
+        if len(payload) >= 1024 and "gzip" in self.headers.get("Accept-Encoding", ""):
+            payload = gzip.compress(payload)
+            self.send_header("Content-Encoding", "gzip")
+        self.server.record("bytes_out", len(payload))
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+        self.server.record(f"{self.path} {status}")
+
+    def _error(self, status: int, detail: str, headers: dict[str, str] | None = None) -> None:
+        self._send(status, {"detail": detail}, headers)
+
+    def do_POST(self) -> None:  # noqa: N802
+        server = self.server
+        handlers = {"/v1/embeddings": self._embeddings, "/v1/rerank": self._rerank}
+        length = int(self.headers.get("Content-Length") or 0)
+        if server.max_bytes and length > server.max_bytes:
+            # 不读取请求体，响应后关闭连接
+            self.close_connection = True
+            return self._error(413, f"请求体 {length} 字节，超过上限 {server.max_bytes} 字节")
+        body = self.rfile.read(length)
+        server.record("bytes_in", length)
+        if self.path not in handlers:
+            return self._error(404, f"未知的接口: {self.path}")
+        encoding = self.headers.get("Content-Encoding", "identity").lower()
+        if encoding == "gzip" and server.gzip_requests:
+            try:
+                body = gzip.decompress(body)
+            except (OSError, EOFError, zlib.error):
+                return self._error(400, "请求体不是有效的 gzip 数据")
+        elif encoding != "identity":
+            return self._error(415, f"不支持的 Content-Encoding: {encoding}")
+        if server.api_key and self.headers.get("Authorization") != f"Bearer {server.api_key}":
+            return self._error(401, "API 密钥无效")
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return self._error(400, "请求体不是有效的 JSON")
+        if not isinstance(data, dict):
+            return self._error(400, "请求体必须是 JSON 对象")
+        texts = data.get("input", []) if self.path == "/v1/embeddings" else data.get("documents", [])
+        texts = [texts] if isinstance(texts, str) else texts
+        if not isinstance(texts, list) or not texts:
+            return self._error(400, "input 或 documents 不能为空")
+        if len(texts) > server.max_items:
+            return self._error(413, f"一次请求最多 {server.max_items} 个文本")
+        tokens = sum(len(tokenize(str(text))) for text in texts) + len(tokenize(str(data.get("query", ""))))
+        retry_after = server.acquire(tokens)
+        if retry_after:
+            return self._error(429, "超过速率限制", {"Retry-After": str(retry_after)})
+        if server.error_rate and server.rng.random() < server.error_rate:
+            return self._error(server.error_status, "注入的错误")
+        delay = server.latency + server.latency_per_item * len(texts)
+        if delay > 0:
+            time.sleep(delay)
+        handlers[self.path](data, texts, tokens)
+
+    def _embeddings(self, data: dict[str, Any], texts: list[str], tokens: int) -> None:
+        dims = int(data.get("dimensions") or self.server.dims)
+        embedding_type = data.get("embedding_type") or "float"
+        if embedding_type not in EMBEDDING_TYPES:
+            return self._error(400, f"不支持的 embedding_type: {embedding_type}")
+        self._send(
+            200,
+            {
+                "model": data.get("model", ""),
+                "object": "list",
+                "usage": {"total_tokens": tokens, "prompt_tokens": tokens},
+                "data": [
+                    {
+                        "object": "embedding",
+                        "index": i,
+                        "embedding": encode_embedding(hash_embedding(str(text), dims), embedding_type),
+                    }
+                    for i, text in enumerate(texts)
+                ],
+            },
+        )
+
+    def _rerank(self, data: dict[str, Any], texts: list[str], tokens: int) -> None:
+        query = str(data.get("query", ""))
+        if not query:
+            return self._error(400, "query 不能为空")
+        ranked = sorted(enumerate(overlap_scores(query, [str(t) for t in texts])), key=lambda x: x[1], reverse=True)
+        results = []
+        for index, score in ranked[: int(data.get("top_n") or len(texts))]:
+            result: dict[str, Any] = {"index": index, "relevance_score": score}
+            if data.get("return_documents", True):
+                result["document"] = {"text": texts[index]}
+            results.append(result)
+        self._send(200, {"model": data.get("model", ""), "usage": {"total_tokens": tokens}, "results": results})
+
+
+class MockJinaServer(ThreadingHTTPServer):
+    """
+    本地的 Jina API 模拟服务，向量和重排序分数由 uglyrag.integrations.hashing 计算，不依赖网络。
+
+    - latency / latency_per_item: 每个请求和每个文本附加的耗时 (秒)
+    - rpm / tpm: 每分钟的请求数和 token 数上限，超过时返回 429 和 Retry-After，0 表示不限制
+    - error_rate / error_status: 按比例随机返回的错误状态码
+    - max_bytes / max_items: 请求体的字节数和文本数上限，超过时返回 413
+    - api_key: 设置后校验 Authorization 请求头
+    - gzip_requests: 是否接受 gzip 压缩的请求体，为 False 时返回 415
+
+    embeddings 支持 float、base64、binary 和 ubinary 四种 embedding_type，客户端支持时压缩较大的响应。
+    stats 按 "路径 状态码" 统计响应次数，connections 为建立的连接数，bytes_in / bytes_out 为请求体和响应体的字节数
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        dims: int = 1024,
+        latency: float = 0.0,
+        latency_per_item: float = 0.0,
+        rpm: int = 0,
+        tpm: int = 0,
+        error_rate: float = 0.0,
+        error_status: int = 500,
+        max_bytes: int = 0,
+        max_items: int = 2048,
+        api_key: str = "",
+        gzip_requests: bool = True,
+        seed: int | None = None,
+    ) -> None:
+        super().__init__((host, port), MockJinaHandler)
+        self.dims = dims
+        self.latency = latency
+        self.latency_per_item = latency_per_item
+        self.rpm = rpm
+        self.tpm = tpm
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.max_bytes = max_bytes
+        self.max_items = max_items
+        self.api_key = api_key
+        self.gzip_requests = gzip_requests
+        self.rng = random.Random(seed)
+        self.stats: Counter[str] = Counter()
+        self._window: deque[tuple[float, int]] = deque()  # 最近一分钟内的请求时间和 token 数
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host!s}:{port}/v1"
+
+    def record(self, key: str, amount: int = 1) -> None:
+        with self._lock:
+            self.stats[key] += amount
+
+    def acquire(self, tokens: int) -> int:
+        """按一分钟的滑动窗口限流，允许时返回 0，否则返回建议的重试等待秒数"""
+        if not self.rpm and not self.tpm:
+            return 0
+        with self._lock:
+            now = time.monotonic()
+            while self._window and now - self._window[0][0] >= 60:
+                self._window.popleft()
+            used = sum(t for _, t in self._window)
+            if (self.rpm and len(self._window) >= self.rpm) or (self.tpm and used + tokens > self.tpm):
+                oldest = self._window[0][0] if self._window else now
+                return max(1, math.ceil(60 - (now - oldest)))
+            self._window.append((now, tokens))
+            return 0
+
+    def start(self) -> MockJinaServer:
+        """在后台线程中运行服务"""
+        self._thread = threading.Thread(target=self.serve_forever, name="mock-jina", daemon=True)
+        self._thread.start()
+        logging.info(f"Jina 模拟服务已启动: {self.url}")
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self) -> MockJinaServer:
+        return self.start()
+
+    def __exit__(self, *exc: object) -> None:
+        self.stop()
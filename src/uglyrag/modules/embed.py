@@ -17,7 +17,25 @@ def get_embeddings_module() -> Callable[[list[str]], list[list[float]]] | None:
         from uglyrag.integrations.jina import JinaAPI
 
         embeddings = JinaAPI.embeddings
+    elif _embedding_module == "Hash":
+        from uglyrag.integrations.hashing import embeddings
+    elif _embedding_module == "Random":
+        from uglyrag.integrations.hashing import random_embeddings as embeddings
     else:
         print(f"get_embeddings_module: raising ImportError for {_embedding_module}")
         raise ImportError(f"No such embedding module: {_embedding_module}")
     return embeddings
+
+
+def get_embedding_info(module: str | None = None) -> dict[str, str]:
+    """向量模块 (默认为当前配置的模块) 和模型名称，新建存储库时记录到元数据中"""
+    _embedding_module = module or config.get("embedding", "MODULES", "JINA")
+    models = {
+        "FastEmbed": lambda: config.get("embedding_model", "FastEmbed", "BAAI/bge-small-zh-v1.5"),
+        "JINA": lambda: config.get("embedding_model", "JINA", "jina-embeddings-v3"),
+        # 哈希和随机向量的维度不同时向量不可比较，把维度作为模型名称的一部分
+        "Hash": lambda: f"hash-{config.get('dimensions', 'Hash') or 1024}",
+        "Random": lambda: f"random-{config.get('dimensions', 'Random') or 1024}",
+    }
+    model = models[_embedding_module]() if _embedding_module in models else ""
+    return {"embedding_module": _embedding_module, "embedding_model": model}
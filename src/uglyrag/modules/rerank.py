@@ -1,21 +1,52 @@
 from __future__ import annotations
 
+import logging
 from collections.abc import Callable
 
+from uglyrag.batching import RerankScheduler
 from uglyrag.config import config
 
+Rerank = Callable[[str, list[str]], list[float]]
+ScorePairs = Callable[[list[tuple[str, str]]], list[float]]
 
-def get_rerank_module() -> Callable[[str, list[str]], list[float]] | None:
+
+def _load_rerank_module() -> tuple[Rerank, ScorePairs | None]:
     _rerank_module = config.get("rerank", "MODULES")
-    rerank: Callable[[str, list[str]], list[float]] | None = None
     if not _rerank_module:
         raise ImportError("未配置 rerank 模块")
     elif _rerank_module == "JINA":
         from uglyrag.integrations.jina import JinaAPI
 
-        rerank = JinaAPI.rerank
+        # Jina 的接口每次只接受一个查询，合并多个查询没有收益
+        return JinaAPI.rerank, None
     elif _rerank_module == "FastEmbed":
-        from uglyrag.integrations.fastembed import rerank
+        from uglyrag.integrations.fastembed import rerank, rerank_pairs
+
+        return rerank, rerank_pairs
+    elif _rerank_module == "Hash":
+        from uglyrag.integrations.hashing import rerank, rerank_pairs
+
+        return rerank, rerank_pairs
+    elif _rerank_module == "Random":
+        from uglyrag.integrations.hashing import random_rerank, random_rerank_pairs
+
+        return random_rerank, random_rerank_pairs
     else:
         raise ImportError(f"No such rerank module: {_rerank_module}")
-    return rerank
+
+
+def get_rerank_module() -> Rerank | None:
+    """
+    获取配置的 rerank 模块。[SEARCH] 中的 rerank_batch_size 大于 0 时，并发查询的 (query, document) 对
+    在 rerank_batch_wait_ms 毫秒内合并为一次调用
+    """
+    rerank, score_pairs = _load_rerank_module()
+    # 默认不合并，未配置时不写入默认值
+    batch_size = int(config.get("rerank_batch_size", "SEARCH") or 0)
+    if batch_size <= 0:
+        return rerank
+    if score_pairs is None:
+        logging.warning("当前的 rerank 模块不支持跨查询合并，忽略 rerank_batch_size")
+        return rerank
+    batch_wait = float(config.get("rerank_batch_wait_ms", "SEARCH") or 2) / 1000
+    return RerankScheduler(score_pairs, batch_size, batch_wait)
@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import asyncio
+import gc
+import logging
+import os
+import signal
+import socket
+import time
+from collections.abc import Callable
+from threading import Event
+from types import FrameType
+
+from uglyrag.config import config
+from uglyrag.db_manager import DatabaseManager
+from uglyrag.indexer import IndexQueue, get_index_queue
+from uglyrag.search import SearchEngine
+from uglyrag.server import SearchServer
+
+WORKER = "worker"
+WRITER = "writer"
+
+
+def _fork(target: Callable[[], None]) -> int:
+    """在子进程中运行 target，子进程不会返回到调用方"""
+    pid = os.fork()
+    if pid:
+        return pid
+    code = 0
+    try:
+        target()
+    except BaseException as e:
+        logging.exception(f"子进程 {os.getpid()} 异常退出: {e}")
+        code = 1
+    finally:
+        logging.shutdown()
+        os._exit(code)
+
+
+def _reset_after_fork() -> None:
+    """丢弃从主进程继承的数据库和索引队列，子进程重新打开各自的连接"""
+    DatabaseManager.get_database.cache_clear()
+    DatabaseManager._check_vault_dict.clear()
+    get_index_queue.cache_clear()
+
+
+def _prepare(vault: str) -> None:
+    """
+    以可写模式打开数据库并创建存储库，只读的查询进程不能新建存储库。
+    开启查询连接池时 SQLite 数据库会切换到 WAL 模式 (持久的设置)，查询进程读取时不阻塞写入进程
+    """
+    _reset_after_fork()
+    DatabaseManager.configure_readers(1)
+    if not DatabaseManager._is_vault_valid(vault):
+        raise RuntimeError(f"无法打开存储库 {vault}")
+
+
+async def _serve_until_terminated(server: SearchServer) -> None:
+    loop = asyncio.get_running_loop()
+    stopped = asyncio.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stopped.set)
+    await server.start()
+    try:
+        await stopped.wait()
+    finally:
+        await server.stop()
+
+
+def _wait_for_signal() -> None:
+    stopped = Event()
+
+    def handler(signum: int, frame: FrameType | None) -> None:
+        stopped.set()
+
+    signal.signal(signal.SIGTERM, handler)
+    signal.signal(signal.SIGINT, handler)
+    while not stopped.wait(1.0):
+        pass
+
+
+def serve_prefork(
+    host: str = "127.0.0.1",
+    port: int = 8000,
+    processes: int = 0,
+    workers: int = 8,
+    read_connections: int = 0,
+    max_batch: int = 32,
+    batch_wait: float = 0.005,
+    writer: bool = True,
+    vault: str | None = None,
+) -> None:
+    """
+    多进程运行 HTTP 服务，直到收到 SIGTERM 或 SIGINT。
+
+    主进程先加载各个模块的模型并创建监听套接字，再创建 processes 个查询进程 (0 表示 CPU 核数)，
+    子进程通过写时复制共享已加载的模型，并在同一个套接字上接受连接。查询进程以只读模式打开数据库，
+    POST /build 提交的任务由单独的写入进程处理。writer 为 False 时不创建写入进程，POST /build 返回 503，
+    SQLite 数据库以 immutable 模式打开，跳过文件锁和变更检测。
+
+    DuckDB 的数据库文件同一时间只能由一个进程以可写模式打开，且此时其他进程不能打开，因此不会创建写入进程。
+    各个子进程的运行时指标相互独立，GET /metrics 返回处理该请求的子进程的指标。
+    异常退出的子进程会被重新创建
+    """
+    if not hasattr(os, "fork"):
+        raise RuntimeError("当前平台不支持 fork，请使用单进程模式")
+    processes = processes or os.cpu_count() or 1
+    vault = vault or SearchEngine.default_vault
+    if writer and config.get("db_type").lower() == "duckdb":
+        logging.warning("DuckDB 不支持与只读进程同时写入，不创建写入进程，POST /build 返回 503")
+        writer = False
+
+    # 在主进程中加载模型，数据库在子进程中打开，不在进程之间共享连接
+    SearchEngine.load_modules()
+    pid = _fork(lambda: _prepare(vault))
+    if os.waitpid(pid, 0)[1] != 0:
+        raise RuntimeError(f"无法打开存储库 {vault}")
+    sock = socket.create_server((host, port), backlog=1024)
+    logging.info(f"UglyRAG 服务已启动: http://{host}:{sock.getsockname()[1]}，查询进程数: {processes}")
+    # 已加载的对象不再被垃圾回收扫描，避免子进程写入这些对象所在的内存页
+    gc.freeze()
+
+    def run_worker() -> None:
+        _reset_after_fork()
+        DatabaseManager.configure_readers(read_connections, read_only=True, immutable=not writer)
+        IndexQueue.process_jobs = False
+        server = SearchServer(host, port, workers, max_batch, batch_wait, sock=sock, accept_builds=writer)
+        asyncio.run(_serve_until_terminated(server))
+
+    def run_writer() -> None:
+        _reset_after_fork()
+        sock.close()
+        queue = get_index_queue()
+        queue.start()
+        _wait_for_signal()
+        queue.stop()
+
+    targets = {WORKER: run_worker, WRITER: run_writer}
+    stopping = False
+
+    def stop(signum: int, frame: FrameType | None) -> None:
+        nonlocal stopping
+        stopping = True
+
+    handlers = {signum: signal.signal(signum, stop) for signum in (signal.SIGTERM, signal.SIGINT)}
+    children = {_fork(targets[WORKER]): WORKER for _ in range(processes)}
+    if writer:
+        children[_fork(targets[WRITER])] = WRITER
+    try:
+        while not stopping:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                time.sleep(0.2)
+                continue
+            role = children.pop(pid, None)
+            if role is None:
+                continue
+            logging.warning(f"{role} 进程 {pid} 已退出 (状态 {status})，重新创建")
+            time.sleep(1.0)  # 避免子进程启动即失败时反复创建
+            children[_fork(targets[role])] = role
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in children:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        sock.close()
+        for signum, handler in handlers.items():
+            signal.signal(signum, handler)
+        gc.unfreeze()
+        logging.info("UglyRAG 服务已停止")
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import json
+import logging
+import random
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from dataclasses import dataclass, field
+from logging import Formatter
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+from uglyrag import tracing
+from uglyrag.logger import AsyncHandler
+from uglyrag.tracing import Span
+
+
+@dataclass
+class LoggedQuery:
+    """
+    查询日志中的一条记录，stages 为调用线程中记录的各阶段耗时 (毫秒)
+    """
+
+    query: str
+    vault: str
+    top_n: int = 5
+    timestamp: float = 0.0
+    ms: float = 0.0
+    results: int = 0
+    error: str = ""
+    stages: dict[str, float] = field(default_factory=dict)
+
+    def to_json(self) -> str:
+        record: dict[str, object] = {
+            "t": round(self.timestamp, 3),
+            "q": self.query,
+            "v": self.vault,
+            "n": self.top_n,
+            "ms": self.ms,
+            "r": self.results,
+        }
+        if self.error:
+            record["e"] = self.error
+        if self.stages:
+            record["s"] = self.stages
+        return json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, line: str) -> LoggedQuery:
+        record = json.loads(line)
+        return cls(
+            record["q"],
+            record["v"],
+            record.get("n", 5),
+            record.get("t", 0.0),
+            record.get("ms", 0.0),
+            record.get("r", 0),
+            record.get("e", ""),
+            record.get("s", {}),
+        )
+
+
+class QueryLog:
+    """
+    按比例抽样记录 SearchEngine.search 的调用，每行一个紧凑的 JSON，由后台线程写入并按大小轮转
+    """
+
+    def __init__(
+        self, path: Path, sample_rate: float, max_bytes: int = 10 * 1024 * 1024, backup_count: int = 3
+    ) -> None:
+        self.path = path
+        self.sample_rate = sample_rate
+        path.parent.mkdir(parents=True, exist_ok=True)
+        file_handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+        file_handler.setFormatter(Formatter("%(message)s"))
+        self.handler = AsyncHandler(file_handler)
+        self.logger = logging.Logger(f"uglyrag.querylog.{path}")
+        self.logger.addHandler(self.handler)
+        self._local = threading.local()
+
+    def __call__(self, span: Span) -> None:
+        # 作为追踪钩子，收集当前线程中正在记录的查询的各阶段耗时
+        stages = getattr(self._local, "stages", None)
+        if stages is not None and span.name != "search":
+            stages[span.name] = round(stages.get(span.name, 0.0) + span.duration * 1000, 3)
+
+    @contextmanager
+    def capture(self, query: str, vault: str, top_n: int) -> Iterator[LoggedQuery]:
+        record = LoggedQuery(query, vault, top_n, time.time())
+        self._local.stages = record.stages
+        start = time.perf_counter()
+        try:
+            yield record
+        except Exception as e:
+            record.error = type(e).__name__
+            raise
+        finally:
+            record.ms = round((time.perf_counter() - start) * 1000, 3)
+            self._local.stages = None
+            self.logger.info(record.to_json())
+
+    def close(self) -> None:
+        self.handler.close()
+
+
+_query_log: QueryLog | None = None
+
+
+def configure(path: Path, sample_rate: float, max_bytes: int = 10 * 1024 * 1024, backup_count: int = 3) -> None:
+    """开启查询日志，sample_rate 为 0 时关闭"""
+    global _query_log
+    if _query_log is not None:
+        tracing.remove_hook(_query_log)
+        _query_log.close()
+        _query_log = None
+    if sample_rate > 0:
+        _query_log = QueryLog(path, sample_rate, max_bytes, backup_count)
+        tracing.add_hook(_query_log)
+        logging.debug("查询日志已开启，抽样比例 %s，写入 %s", sample_rate, path)
+
+
+def capture(query: str, vault: str, top_n: int) -> AbstractContextManager[LoggedQuery | None]:
+    """抽样命中时记录上下文中的查询，未开启查询日志或未命中时不做任何事"""
+    if _query_log is None or random.random() >= _query_log.sample_rate:
+        return nullcontext()
+    return _query_log.capture(query, vault, top_n)
+
+
+def read_log(paths: Iterable[Path]) -> list[LoggedQuery]:
+    """读取查询日志，跳过无法解析的行"""
+    queries = []
+    for path in paths:
+        with path.open(encoding="utf-8") as f:
+            for line in f:
+                try:
+                    queries.append(LoggedQuery.from_json(line))
+                except (ValueError, KeyError):
+                    logging.debug("跳过无法解析的查询日志: %s", line)
+    return queries
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections.abc import Callable
+
+
+class TokenBucket:
+    """
+    令牌桶: 最多积累 capacity 个令牌，每秒补充 rate 个。
+
+    acquire 先预占令牌 (余额可以为负)，再在锁外等待到余额补足，并发的调用方按到达顺序依次放行。
+    单次请求超过 capacity 时按 capacity 计算，避免永远等不到
+    """
+
+    def __init__(
+        self,
+        capacity: float,
+        rate: float,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        if capacity <= 0 or rate <= 0:
+            raise ValueError("capacity 和 rate 必须大于 0")
+        self.capacity = capacity
+        self.rate = rate
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float = 1) -> float:
+        """预占令牌，返回需要等待的秒数"""
+        with self._lock:
+            self._refill()
+            self._tokens -= min(amount, self.capacity)
+            return max(0.0, -self._tokens / self.rate)
+
+    def acquire(self, amount: float = 1) -> float:
+        """等待到可以使用 amount 个令牌，返回等待的秒数"""
+        wait = self.reserve(amount)
+        if wait > 0:
+            self.sleep(wait)
+        return wait
+
+    def consume(self, amount: float) -> None:
+        """不等待直接扣除令牌 (可以为负数，表示退还)，用于按实际用量修正预估"""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens - amount)
+
+    def drain(self, seconds: float) -> None:
+        """服务端要求等待 seconds 秒时清空令牌，之后的请求都顺延"""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, 0.0) - seconds * self.rate
+
+
+class RateLimiter:
+    """
+    按每分钟请求数 (rpm) 和 token 数 (tpm) 限流，0 表示不限制。
+
+    突发量为每分钟上限的 burst 倍 (0 < burst <= 1)，补充速率相应降低，任意一分钟内的用量都不超过上限。
+    限流只在当前进程内生效，多个进程共用一个账户时需要各自设置分摊后的上限
+    """
+
+    def __init__(
+        self,
+        rpm: int = 0,
+        tpm: int = 0,
+        burst: float = 0.1,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        if not 0 < burst <= 1:
+            raise ValueError(f"burst 必须在 (0, 1] 之间: {burst}")
+        self.sleep = sleep
+        self.requests = self._bucket(rpm, burst, clock, sleep)
+        self.tokens = self._bucket(tpm, burst, clock, sleep)
+
+    @staticmethod
+    def _bucket(
+        limit: int, burst: float, clock: Callable[[], float], sleep: Callable[[float], None]
+    ) -> TokenBucket | None:
+        if limit <= 0:
+            return None
+        capacity = max(1.0, limit * burst)
+        return TokenBucket(capacity, (limit - capacity) / 60 or limit / 60, clock, sleep)
+
+    @property
+    def enabled(self) -> bool:
+        return self.requests is not None or self.tokens is not None
+
+    def acquire(self, tokens: float = 0) -> float:
+        """等待到可以发出一个包含 tokens 个 token 的请求，返回等待的秒数"""
+        wait = 0.0
+        if self.requests is not None:
+            wait = self.requests.reserve(1)
+        if self.tokens is not None and tokens:
+            wait = max(wait, self.tokens.reserve(tokens))
+        if wait > 0:
+            self.sleep(wait)
+        return wait
+
+    def settle(self, estimated: float, actual: float) -> None:
+        """按服务端返回的实际 token 用量修正预估的用量"""
+        if self.tokens is not None and actual != estimated:
+            self.tokens.consume(actual - estimated)
+
+    def backoff(self, seconds: float) -> None:
+        """收到 429 时，之后的请求至少推迟 seconds 秒"""
+        for bucket in (self.requests, self.tokens):
+            if bucket is not None:
+                bucket.drain(seconds)
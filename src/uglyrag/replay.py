@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import logging
+import random
+import threading
+import time
+from collections.abc import Callable, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Any
+
+from uglyrag.querylog import LoggedQuery
+from uglyrag.utils import percentile
+
+
+@dataclass
+class ReplayReport:
+    """
+    一档目标 QPS 的回放结果，延迟从计划发出的时间算起，包含在线程池中排队的时间
+    """
+
+    target_qps: float
+    concurrency: int
+    sent: int = 0
+    completed: int = 0
+    errors: int = 0
+    seconds: float = 0.0
+    p50_ms: float = 0.0
+    p95_ms: float = 0.0
+    p99_ms: float = 0.0
+    max_ms: float = 0.0
+
+    @property
+    def achieved_qps(self) -> float:
+        return self.completed / self.seconds if self.seconds else 0.0
+
+    @property
+    def saturated(self) -> bool:
+        """实际吞吐量低于目标的 90% 时视为已饱和"""
+        return self.achieved_qps < self.target_qps * 0.9
+
+    def to_dict(self) -> dict[str, Any]:
+        return {**asdict(self), "achieved_qps": round(self.achieved_qps, 2), "saturated": self.saturated}
+
+    def __str__(self) -> str:
+        return (
+            f"目标 {self.target_qps:g} QPS，并发 {self.concurrency}：发出 {self.sent} 个查询，完成 {self.completed} 个，"
+            f"失败 {self.errors} 个，实际 {self.achieved_qps:.1f} QPS；延迟 p50 {self.p50_ms}ms, p95 {self.p95_ms}ms, "
+            f"p99 {self.p99_ms}ms, 最大 {self.max_ms}ms" + ("，已饱和" if self.saturated else "")
+        )
+
+
+def replay(
+    queries: Sequence[LoggedQuery],
+    search: Callable[[str, str, int], Any],
+    qps: float,
+    concurrency: int = 8,
+    duration: float = 0.0,
+    arrival: str = "poisson",
+    vault: str | None = None,
+    seed: int | None = None,
+) -> ReplayReport:
+    """
+    按目标 QPS 开环回放查询：到达时间事先按 poisson (指数分布间隔) 或 uniform (固定间隔) 生成，
+    不等待前一个查询完成，查询在 concurrency 个线程中执行，线程都忙时在队列中等待。
+    duration 为 0 时每个查询回放一次，否则循环回放直到达到时长
+    """
+    if qps <= 0 or not queries:
+        raise ValueError("目标 QPS 必须大于 0，且查询不能为空")
+    if arrival not in ("poisson", "uniform"):
+        raise ValueError(f"不支持的到达方式: {arrival}")
+    rng = random.Random(seed)
+    count = int(duration * qps) if duration else len(queries)
+    report = ReplayReport(qps, concurrency)
+    latencies: list[float] = []
+    lock = threading.Lock()
+
+    def run(query: LoggedQuery, scheduled: float) -> None:
+        try:
+            search(query.query, vault or query.vault, query.top_n)
+            with lock:
+                latencies.append((time.perf_counter() - scheduled) * 1000)
+                report.completed += 1
+        except Exception as e:
+            logging.debug("回放查询失败: %s", e)
+            with lock:
+                report.errors += 1
+
+    start = time.perf_counter()
+    scheduled = start
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for i in range(count):
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(run, queries[i % len(queries)], scheduled)
+            report.sent += 1
+            scheduled += rng.expovariate(qps) if arrival == "poisson" else 1 / qps
+    report.seconds = round(time.perf_counter() - start, 3)
+    report.p50_ms = percentile(latencies, 50)
+    report.p95_ms = percentile(latencies, 95)
+    report.p99_ms = percentile(latencies, 99)
+    report.max_ms = round(max(latencies), 3) if latencies else 0.0
+    logging.info(str(report))
+    return report
+
+
+def find_saturation(reports: Sequence[ReplayReport]) -> float | None:
+    """逐档提高 QPS 时首个饱和的目标 QPS，全部未饱和时返回 None"""
+    for report in sorted(reports, key=lambda r: r.target_qps):
+        if report.saturated:
+            return report.target_qps
+    return None
@@ -1,12 +1,26 @@
 from __future__ import annotations
 
 import logging
-from collections import defaultdict
-from collections.abc import Callable
-from typing import Any
+import time
+from collections import Counter, defaultdict, deque
+from collections.abc import Callable, Iterable
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Any, Literal, overload
 
+from uglyrag import metrics, querylog
 from uglyrag.config import config
+from uglyrag.database import MaintenanceReport
 from uglyrag.db_manager import DatabaseManager
+from uglyrag.indexer import IndexJob, get_index_queue
+from uglyrag.ingest import IngestStats, build_from_paths
+from uglyrag.integrations.hashing import tokenize
+from uglyrag.journal import COMMITTED, EMBEDDED, get_journal
+from uglyrag.tracing import profile, span
+from uglyrag.utils import resolve_module
+
+QUERIES = metrics.counter("uglyrag_queries_total", "查询次数")
+QUERY_SECONDS = metrics.histogram("uglyrag_query_seconds", "查询耗时 (秒)")
 
 
 def merge_results(results: list[list[tuple[str, str]]]) -> dict[str, str]:
@@ -17,6 +31,93 @@ def merge_results(results: list[list[tuple[str, str]]]) -> dict[str, str]:
     return results_dict
 
 
+def rrf_fuse(
+    fts_results: list[tuple[str, str]],
+    vec_results: list[tuple[str, str]],
+    k: float = 60,
+    weight_fts: float = 1.0,
+    weight_vec: float = 1.0,
+) -> list[tuple[str, str]]:
+    """按 Reciprocal Rank Fusion 融合全文检索和向量检索的结果"""
+    result_dict = merge_results([fts_results, vec_results])
+    rank_dict: dict[str, float] = {}
+
+    # Process FTS results
+    for rank, (id, _) in enumerate(fts_results):
+        if id not in rank_dict:
+            rank_dict[id] = 0.0
+        rank_dict[id] += 1 / (k + rank + 1) * weight_fts
+
+    # Process vector results
+    for rank, (id, _) in enumerate(vec_results):
+        if id not in rank_dict:
+            rank_dict[id] = 0.0
+        rank_dict[id] += 1 / (k + rank + 1) * weight_vec
+
+    # Sort by RRF score
+    sorted_results = sorted(rank_dict.items(), key=lambda x: x[1], reverse=True)
+    return [(i, result_dict[i]) for i, _ in sorted_results]
+
+
+def rerank_window(text: str, query: str, max_chars: int) -> str:
+    """
+    截取 text 中包含最多不同查询词的 max_chars 个字符，命中的词位于窗口中间；没有命中时截取开头。
+    查询词按空格切分，并按 tokenize 切分 (中文为相邻两字)，不依赖分词模块
+    """
+    if max_chars <= 0 or len(text) <= max_chars:
+        return text
+    lowered = text.lower()
+    terms = {term for term in tokenize(query) + query.lower().split() if term}
+    hits: list[tuple[int, int, str]] = []
+    for term in terms:
+        start = lowered.find(term)
+        # 每个词最多取前 32 次出现，避免长文本中的高频词拖慢截取
+        for _ in range(32):
+            if start < 0:
+                break
+            hits.append((start, start + len(term), term))
+            start = lowered.find(term, start + 1)
+    if not hits:
+        return text[:max_chars]
+    hits.sort()
+    # 滑动窗口: 找出跨度不超过 max_chars 且包含最多不同查询词的一段命中
+    window: Counter[str] = Counter()
+    best, best_span = 0, (hits[0][0], hits[0][1])
+    left = 0
+    for _, end, term in hits:
+        window[term] += 1
+        while end - hits[left][0] > max_chars:
+            window[hits[left][2]] -= 1
+            if not window[hits[left][2]]:
+                del window[hits[left][2]]
+            left += 1
+        if len(window) > best:
+            best, best_span = len(window), (hits[left][0], end)
+    slack = max_chars - (best_span[1] - best_span[0])
+    start = min(max(0, best_span[0] - slack // 2), len(text) - max_chars)
+    return text[start : start + max_chars]
+
+
+def rerank_candidates(
+    rerank: Callable[[str, list[str]], list[float]],
+    query: str,
+    candidates: list[tuple[str, str]],
+    max_chars: int = 0,
+    max_docs: int = 0,
+) -> list[tuple[str, str]]:
+    """
+    重排序候选结果。max_docs 大于 0 时只重排前 max_docs 个候选，其余按原顺序排在后面；
+    max_chars 大于 0 时每个候选只把命中查询词的 max_chars 个字符交给 rerank，返回的仍是完整内容
+    """
+    if max_docs > 0:
+        candidates, rest = candidates[:max_docs], candidates[max_docs:]
+    else:
+        rest = []
+    scores = rerank(query, [rerank_window(content, query, max_chars) for _, content in candidates])
+    ranked = sorted(zip(candidates, scores), key=lambda x: x[1], reverse=True)
+    return [candidate for candidate, _ in ranked] + rest
+
+
 class SearchEngine:
     rerank: Callable[[str, list[str]], list[float]] | None = None
     split: Callable[[str], list[tuple[str, str]]] = lambda x: [("1", x)]
@@ -26,6 +127,35 @@ class SearchEngine:
     _weight_fts: float = float(config.get("weight_fts", "RRF", "1.0"))
     _weight_vec: float = float(config.get("weight_vec", "RRF", "1.0"))
     _rrf_k: int = int(config.get("k", "RRF", "60"))
+    _batch_size: int = int(config.get("batch_size", "INGEST", "256"))
+    # 交给 rerank 的每个候选的最大字符数和候选数，0 表示不限制，未配置时不写入默认值
+    _rerank_max_chars: int = int(config.get("rerank_max_chars", "SEARCH") or 0)
+    _rerank_max_docs: int = int(config.get("rerank_max_docs", "SEARCH") or 0)
+
+    @overload
+    @classmethod
+    def build(
+        cls,
+        docs: list[tuple[Any, str]],
+        vault: str | None = None,
+        reset_db: bool = False,
+        update_exist: bool = False,
+        bulk_load: bool = False,
+        background: Literal[False] = False,
+    ) -> int: ...
+
+    @overload
+    @classmethod
+    def build(
+        cls,
+        docs: list[tuple[Any, str]],
+        vault: str | None = None,
+        reset_db: bool = False,
+        update_exist: bool = False,
+        bulk_load: bool = False,
+        *,
+        background: Literal[True],
+    ) -> IndexJob: ...
 
     @classmethod
     def build(
@@ -34,73 +164,197 @@ class SearchEngine:
         vault: str | None = None,
         reset_db: bool = False,
         update_exist: bool = False,
-    ) -> None:
-        """构建索引"""
+        bulk_load: bool = False,
+        background: bool = False,
+    ) -> int | IndexJob:
+        """
+        构建索引，初次导入大量文档时可以开启 bulk_load 以提高写入速度，返回本次写入的分段数量
+
+        文档按批次向量化和写入，进度记录在导入日志中。导入中断后使用相同的参数重新调用，
+        会跳过已经提交的批次，从最后一个提交的批次之后继续。
+
+        background 为 True 时文档写入持久化的索引队列后立即返回任务句柄，由后台线程完成索引，
+        可以通过句柄查询状态或等待完成。
+        """
+        if background:
+            queue = get_index_queue()
+            if reset_db:
+                cls._reset_db()
+            return queue.submit(docs, vault or cls.default_vault, update_exist, bulk_load)
+        journal = get_journal()
         if reset_db:
-            DatabaseManager.reset()
+            cls._reset_db()
         if not docs:
-            return  # 如果 docs 为空，直接返回
+            return 0  # 如果 docs 为空，直接返回
         if vault is None:
             vault = cls.default_vault
+        job_id = journal.job_id(vault, docs, update_exist)
+        batches = journal.get_batches(job_id)
+        resumed = batches is not None
+        if batches is None:
+            data = cls._split_docs(docs, vault, update_exist)
+            batches = journal.start_job(job_id, vault, data, cls._batch_size)
+        else:
+            pending = {source for batch in batches if batch.stage != COMMITTED for source in batch.sources}
+            logging.info(f"恢复导入任务 {job_id[:12]}，剩余 {sum(b.stage != COMMITTED for b in batches)} 个批次")
+            data = cls._split_docs([doc for doc in docs if str(doc[0]) in pending], vault, True, check_exist=False)
+        # 同一来源出现多次时 (source, part_id) 可能重复，按出现的顺序依次取出各自的内容
+        contents: defaultdict[tuple[str, str], deque[str]] = defaultdict(deque)
+        for source, part_id, content in data:
+            contents[(source, part_id)].append(content)
+        chunks = 0
+
+        with DatabaseManager.bulk_load(vault) if bulk_load else nullcontext():
+            for batch in batches:
+                if batch.stage == COMMITTED:
+                    continue
+                if resumed:
+                    # 上次中断时该批次可能已经部分写入，按来源清理后重新写入
+                    for source in batch.sources:
+                        DatabaseManager.is_source_valid(source, vault, rm_if_exist=True)
+                batch_data = [
+                    (source, part_id, contents[(source, part_id)].popleft()) for source, part_id in batch.keys
+                ]
+                if batch.stage == EMBEDDED:
+                    embeddings = journal.load_embeddings(batch, (content for _, _, content in batch_data))
+                else:
+                    embeddings = DatabaseManager.embed_documents(batch_data)
+                    journal.mark_embedded(batch, embeddings)
+                DatabaseManager.add_documents(batch_data, vault, embeddings)
+                journal.mark_committed(batch)
+                chunks += len(batch_data)
+                logging.debug("导入任务 %s 第 %s/%s 批已提交", job_id[:12], batch.batch_no + 1, len(batches))
+        journal.finish_job(job_id)
+        return chunks
+
+    @staticmethod
+    def _reset_db() -> None:
+        """清空数据库和导入日志。后台索引任务尚未完成时拒绝执行，避免删除任务正在写入的表"""
+        if get_index_queue.cache_info().currsize and get_index_queue().pending():
+            raise RuntimeError("后台索引任务尚未完成，不能重置数据库")
+        DatabaseManager.reset()
+        get_journal().reset()
+
+    @classmethod
+    def build_from_paths(
+        cls,
+        patterns: Iterable[str | Path],
+        vault: str | None = None,
+        workers: int | None = None,
+        force: bool = False,
+        bulk_load: bool = False,
+    ) -> IngestStats:
+        """从文件、目录或 glob 模式导入文档，未修改的文件会被跳过"""
+        return build_from_paths(patterns, vault, workers=workers, force=force, bulk_load=bulk_load)
+
+    @classmethod
+    def warmup(cls, vault: str | None = None) -> None:
+        """
+        预先导入各个模块、加载模型并打开存储库。模块默认在首次使用时才加载，服务可以在启动时调用，避免首个请求承担加载开销
+        """
+        cls.load_modules()
+        DatabaseManager.warmup(vault or cls.default_vault)
+
+    @classmethod
+    def load_modules(cls) -> None:
+        """
+        导入各个模块并加载模型，不打开数据库。多进程服务在创建子进程之前调用，子进程共享已加载的模型
+        """
+        for target, attribute_name in (
+            (DatabaseManager, "segment"),
+            (DatabaseManager, "embeddings"),
+            (cls, "rerank"),
+            (cls, "split"),
+        ):
+            resolve_module(target, attribute_name)
+        try:
+            DatabaseManager.segment("warmup")
+            DatabaseManager.embeddings(["warmup"])
+        except Exception as e:
+            logging.warning(f"预热模块失败: {e}")
+        if cls.rerank is not None:
+            try:
+                cls.rerank("warmup", ["warmup"])
+            except Exception as e:
+                logging.warning(f"预热 rerank 模块失败: {e}")
+
+    @classmethod
+    def maintain(cls, vault: str | None = None, online: bool = True) -> MaintenanceReport:
+        """维护存储库：合并全文索引、压缩向量索引、更新统计信息并回收空间"""
+        return DatabaseManager.maintain(vault or cls.default_vault, online)
+
+    @classmethod
+    def _split_docs(
+        cls, docs: list[tuple[Any, str]], vault: str, update_exist: bool, check_exist: bool = True
+    ) -> list[tuple[str, str, str]]:
+        """分割文档，check_exist 为 True 时会按 update_exist 处理已经存在的来源"""
         data: list[tuple[str, str, str]] = []
         for source, text in docs:
             source = str(source)
             if not source or not text:
                 continue  # 跳过空字符串
             if (
-                DatabaseManager.is_source_valid(source, vault, rm_if_exist=update_exist) and not update_exist
+                check_exist
+                and DatabaseManager.is_source_valid(source, vault, rm_if_exist=update_exist)
+                and not update_exist
             ):  # 如果已经存在，且不允许更新，则跳过
                 continue
             try:
-                data.extend((source, pard_id, content) for pard_id, content in cls.split(text))
+                with span("split", vault, chars=len(text)):
+                    data.extend((source, pard_id, content) for pard_id, content in cls.split(text))
             except Exception as e:
                 logging.error(f"分割文档失败: {e}")
                 continue  # 继续处理下一个文档
-        DatabaseManager.add_documents(data, vault)
+        return data
 
     @classmethod
     def _calculate_rrf(
         cls, fts_results: list[tuple[str, str]], vec_results: list[tuple[str, str]]
     ) -> list[tuple[str, str]]:
-        result_dict = merge_results([fts_results, vec_results])
-        rank_dict = {}
-
-        # Process FTS results
-        for rank, (id, _) in enumerate(fts_results):
-            if id not in rank_dict:
-                rank_dict[id] = 0.0
-            rank_dict[id] += 1 / (cls._rrf_k + rank + 1) * cls._weight_fts
-
-        # Process vector results
-        for rank, (id, _) in enumerate(vec_results):
-            if id not in rank_dict:
-                rank_dict[id] = 0.0
-            rank_dict[id] += 1 / (cls._rrf_k + rank + 1) * cls._weight_vec
-
-        # Sort by RRF score
-        sorted_results = sorted(rank_dict.items(), key=lambda x: x[1], reverse=True)
-        return [(i, result_dict[i]) for i, _ in sorted_results]
+        return rrf_fuse(fts_results, vec_results, cls._rrf_k, cls._weight_fts, cls._weight_vec)
 
     @classmethod
     def _rerank(cls, query: str, results: dict[str, str]) -> list[tuple[str, str]]:
-        if not results or cls.rerank is None:
+        rerank = resolve_module(cls, "rerank")
+        if not results or rerank is None:
             return []
-        scores = cls.rerank(query, [content for _, content in results.items()])
-        sorted_results = sorted(
-            ((key, value, score) for (key, value), score in zip(results.items(), scores)),
-            key=lambda x: x[2],
-            reverse=True,
-        )
-        return [(key, value) for key, value, _ in sorted_results]
+        return rerank_candidates(rerank, query, list(results.items()), cls._rerank_max_chars, cls._rerank_max_docs)
 
     @classmethod
     def search(cls, query: str, vault: str | None = None, top_n: int = 5) -> list[tuple[str, str]]:
         if vault is None:
             vault = cls.default_vault
-        results = DatabaseManager.search(query, vault, top_n)
-        if cls.rerank is None:
-            logging.warning("使用混合搜索返回结果")
-            fts_results, vec_results = results[:2]
-            return cls._calculate_rrf(fts_results, vec_results)[:top_n]
-        else:
-            return cls._rerank(query, merge_results(results))[:top_n]
+        QUERIES.inc()
+        start = time.perf_counter()
+        with (
+            profile("search"),
+            querylog.capture(query, vault, top_n) as record,
+            span("search", vault, top_n=top_n) as s,
+        ):
+            results = DatabaseManager.search(query, vault, top_n)
+            if resolve_module(cls, "rerank") is None:
+                logging.debug("使用混合搜索返回结果")
+                fts_results, vec_results = results[:2]
+                with span("search.rrf", vault, candidates=len(fts_results) + len(vec_results)):
+                    ranked = cls._calculate_rrf(fts_results, vec_results)[:top_n]
+            else:
+                candidates = merge_results(results)
+                if 0 < cls._rerank_max_docs < len(candidates):
+                    # 候选过多时按 RRF 融合的顺序，只重排靠前的候选
+                    candidates = dict(cls._calculate_rrf(results[0], results[1]))
+                with span("search.rerank", vault, candidates=len(candidates)):
+                    ranked = cls._rerank(query, candidates)[:top_n]
+            s.set(results=len(ranked))
+            if record is not None:
+                record.results = len(ranked)
+        QUERY_SECONDS.observe(time.perf_counter() - start)
+        return ranked
+
+
+# 查询日志默认关闭，未配置时不写入默认值
+querylog.configure(
+    config.data_dir / "query_log" / "queries.jsonl",
+    float(config.get("sample_rate", "QUERY_LOG") or 0),
+    max_bytes=int(config.get("max_bytes", "QUERY_LOG") or 10 * 1024 * 1024),
+    backup_count=int(config.get("backup_count", "QUERY_LOG") or 3),
+)
@@ -0,0 +1,284 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from urllib.parse import urlsplit
+
+from uglyrag import metrics
+from uglyrag.batching import MicroBatcher
+from uglyrag.database.base import is_valid_vault_name
+from uglyrag.db_manager import DatabaseManager
+from uglyrag.indexer import IndexJob, get_index_queue
+from uglyrag.search import SearchEngine
+
+REQUESTS = metrics.counter("uglyrag_http_requests_total", "HTTP 请求次数")
+REQUEST_SECONDS = metrics.histogram("uglyrag_http_request_seconds", "HTTP 请求的处理时间 (秒)")
+SEARCH_SECONDS = metrics.histogram("uglyrag_http_search_seconds", "HTTP 搜索请求的处理时间 (秒)")
+
+PATHS = {"/health", "/metrics", "/search", "/build"}
+MAX_TOP_N = 100
+STATUS_TEXT = {
+    200: "OK",
+    202: "Accepted",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, detail: str) -> None:
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+
+
+def _embed_queries(queries: list[str]) -> list[list[float]]:
+    """一次调用向量模型计算一批查询的向量，写入查询缓存后各个查询的向量检索直接命中缓存"""
+    embeddings = DatabaseManager._call_embeddings(queries)
+    DatabaseManager.cache_query_embeddings(dict(zip(queries, embeddings)))
+    return embeddings
+
+
+class SearchServer:
+    """
+    基于 asyncio 的 HTTP 服务:
+
+    - POST /search {"query": ..., "vault": ..., "top_n": 5}
+    - POST /build {"docs": [[source, content], ...], "vault": ..., "update_exist": false}，写入后台索引队列
+    - GET /build/<job_id> 查询导入任务的状态
+    - GET /health 和 GET /metrics (Prometheus 文本格式)
+
+    并发请求的查询在 batch_wait 秒内合并为一次向量模型调用，检索在 workers 个线程中执行，
+    数据库的查询连接池由 DatabaseManager.configure_readers 设置。传入 sock 时使用已经监听的套接字，
+    多进程服务的各个子进程共享同一个套接字。accept_builds 为 False 时没有进程处理导入任务，POST /build 返回 503
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 8000,
+        workers: int = 8,
+        max_batch: int = 32,
+        batch_wait: float = 0.005,
+        max_body: int = 64 * 1024 * 1024,
+        sock: socket.socket | None = None,
+        accept_builds: bool = True,
+    ) -> None:
+        self.host = host
+        self.accept_builds = accept_builds
+        self.port = port
+        self.max_body = max_body
+        self.sock = sock
+        self.embedder: MicroBatcher[str, list[float]] = MicroBatcher(
+            _embed_queries, max_batch, batch_wait, name="query_embedding"
+        )
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="search")
+        self._server: asyncio.Server | None = None
+        self._connections: set[asyncio.Task[None]] = set()
+
+    async def start(self) -> None:
+        if self.sock is not None:
+            self._server = await asyncio.start_server(self._handle, sock=self.sock)
+        else:
+            self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logging.info(f"UglyRAG 服务已启动: http://{self.host}:{self.port}")
+
+    async def serve_forever(self) -> None:
+        if self._server is None:
+            await self.start()
+        assert self._server is not None
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        # 关闭空闲的长连接
+        for task in self._connections:
+            task.cancel()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        self.embedder.close()
+        self._executor.shutdown(wait=True)
+
+    async def search(self, query: str, vault: str, top_n: int) -> list[tuple[str, str]]:
+        if not DatabaseManager.has_query_embedding(query):
+            await self.embedder.asubmit(query)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, SearchEngine.search, query, vault, top_n)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        assert task is not None
+        self._connections.add(task)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, version = request_line.decode("latin-1").split()
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length") or 0)
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                start = time.perf_counter()
+                path = urlsplit(target).path
+                if length > self.max_body:
+                    # 不读取过大的请求体，响应后关闭连接
+                    status, content_type, body = self._error(HTTPError(413, f"请求体超过 {self.max_body} 字节"))
+                    keep_alive = False
+                else:
+                    payload = await reader.readexactly(length) if length else b""
+                    status, content_type, body = await self._dispatch(method, path, payload)
+                # 未知的路径合并统计，避免标签数量无限增长
+                route = "/build/<job_id>" if path.startswith("/build/") else path if path in PATHS else "other"
+                REQUESTS.inc(path=route, status=str(status))
+                REQUEST_SECONDS.observe(time.perf_counter() - start)
+                writer.write(
+                    (
+                        f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                        f"Content-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+                        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                    ).encode("latin-1")
+                    + body
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError) as e:
+            logging.debug("HTTP 连接异常: %s", e)
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    @staticmethod
+    def _json(data: Any, status: int = 200) -> tuple[int, str, bytes]:
+        return status, "application/json; charset=utf-8", json.dumps(data, ensure_ascii=False).encode("utf-8")
+
+    def _error(self, e: HTTPError) -> tuple[int, str, bytes]:
+        return self._json({"error": e.detail}, e.status)
+
+    async def _dispatch(self, method: str, path: str, payload: bytes) -> tuple[int, str, bytes]:
+        routes = {
+            ("GET", "/health"): self._health,
+            ("GET", "/metrics"): self._metrics,
+            ("POST", "/search"): self._search,
+            ("POST", "/build"): self._build,
+        }
+        try:
+            if path.startswith("/build/") and method == "GET":
+                return await self._job(path.removeprefix("/build/"))
+            if (method, path) not in routes:
+                if path in PATHS:
+                    raise HTTPError(405, f"不支持的请求方法: {method}")
+                raise HTTPError(404, f"未知的路径: {path}")
+            return await routes[(method, path)](payload)
+        except HTTPError as e:
+            return self._error(e)
+        except Exception as e:
+            logging.exception(f"处理请求 {method} {path} 失败: {e}")
+            return self._error(HTTPError(500, str(e)))
+
+    @staticmethod
+    def _load(payload: bytes) -> dict[str, Any]:
+        try:
+            data = json.loads(payload or b"{}")
+        except ValueError as e:
+            raise HTTPError(400, "请求体不是有效的 JSON") from e
+        if not isinstance(data, dict):
+            raise HTTPError(400, "请求体必须是 JSON 对象")
+        return data
+
+    async def _health(self, payload: bytes) -> tuple[int, str, bytes]:
+        return self._json({"status": "ok"})
+
+    async def _metrics(self, payload: bytes) -> tuple[int, str, bytes]:
+        return 200, "text/plain; version=0.0.4; charset=utf-8", metrics.to_prometheus().encode("utf-8")
+
+    @staticmethod
+    def _vault(data: dict[str, Any]) -> str:
+        """请求中的存储库名称，名称会作为表名拼接到 SQL 中，必须是合法的标识符"""
+        vault = data.get("vault") or SearchEngine.default_vault
+        if not isinstance(vault, str) or not is_valid_vault_name(vault):
+            raise HTTPError(400, "vault 只能包含字母、数字和下划线，且不能以数字开头")
+        return vault
+
+    @staticmethod
+    def _top_n(data: dict[str, Any]) -> int:
+        top_n = data.get("top_n", 5)
+        if isinstance(top_n, bool) or not isinstance(top_n, int) or not 0 < top_n <= MAX_TOP_N:
+            raise HTTPError(400, f"top_n 必须是 1 到 {MAX_TOP_N} 之间的整数")
+        return top_n
+
+    async def _search(self, payload: bytes) -> tuple[int, str, bytes]:
+        data = self._load(payload)
+        query = data.get("query")
+        if not isinstance(query, str) or not query.strip():
+            raise HTTPError(400, "query 不能为空")
+        vault = self._vault(data)
+        top_n = self._top_n(data)
+        loop = asyncio.get_running_loop()
+        # 查询不会创建存储库
+        if not await loop.run_in_executor(self._executor, DatabaseManager.vault_exists, vault):
+            raise HTTPError(404, f"存储库不存在: {vault}")
+        start = time.perf_counter()
+        results = await self.search(query, vault, top_n)
+        SEARCH_SECONDS.observe(time.perf_counter() - start)
+        return self._json({"results": [{"id": id, "content": content} for id, content in results]})
+
+    async def _build(self, payload: bytes) -> tuple[int, str, bytes]:
+        if not self.accept_builds:
+            # 没有写入进程时任务会一直停留在队列中
+            raise HTTPError(503, "服务没有写入进程，不接受导入任务")
+        data = self._load(payload)
+        docs = data.get("docs")
+        if not isinstance(docs, list) or not all(isinstance(doc, list) and len(doc) == 2 for doc in docs):
+            raise HTTPError(400, "docs 必须是 [source, content] 的列表")
+        vault = self._vault(data)
+        loop = asyncio.get_running_loop()
+        job = await loop.run_in_executor(
+            self._executor,
+            lambda: SearchEngine.build(
+                [(source, content) for source, content in docs],
+                vault,
+                update_exist=bool(data.get("update_exist", False)),
+                background=True,
+            ),
+        )
+        return self._json({"job_id": job.job_id, "status": job.status}, 202)
+
+    async def _job(self, job_id: str) -> tuple[int, str, bytes]:
+        def lookup() -> dict[str, Any] | None:
+            job = IndexJob(job_id, get_index_queue())
+            status = job.status
+            if status is None:
+                return None
+            return {"job_id": job_id, "status": status, "chunks": job.chunks, "error": job.error}
+
+        # 查询任务状态需要读取队列数据库，在线程池中执行，数据库被锁住时不会阻塞事件循环
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(self._executor, lookup)
+        if result is None:
+            raise HTTPError(404, f"未知的导入任务: {job_id}")
+        return self._json(result)
+
+
+async def serve(server: SearchServer) -> None:
+    """运行服务直到被中断"""
+    try:
+        await server.serve_forever()
+    finally:
+        await server.stop()
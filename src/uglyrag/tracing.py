@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+import cProfile
+import logging
+import random
+import time
+from collections.abc import Callable, Iterator
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from threading import Lock
+from types import TracebackType
+from typing import Any
+
+from uglyrag.metrics import Histogram
+
+SpanHook = Callable[["Span"], None]
+
+# 注册的钩子列表只整体替换、不原地修改，读取时不需要加锁
+_hooks: tuple[SpanHook, ...] = ()
+_profiler: Profiler | None = None
+
+
+@dataclass
+class Span:
+    """
+    一个阶段的耗时记录，退出上下文时交给所有注册的钩子
+    """
+
+    name: str
+    vault: str = ""
+    sizes: dict[str, int] = field(default_factory=dict)
+    start: float = 0.0
+    duration: float = 0.0  # 秒
+    error: str = ""  # 阶段中抛出的异常类型
+
+    def set(self, **sizes: int) -> None:
+        """记录阶段处理的数据量，如结果数量、文本长度"""
+        self.sizes.update(sizes)
+
+    def __enter__(self) -> Span:
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(
+        self, exc_type: type[BaseException] | None, exc_val: BaseException | None, exc_tb: TracebackType | None
+    ) -> None:
+        self.duration = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.error = exc_type.__name__
+        for hook in _hooks:
+            try:
+                hook(self)
+            except Exception as e:
+                logging.debug("追踪钩子执行失败: %s", e)
+
+
+class _NullSpan(Span):
+    """没有注册钩子时使用的空记录，不计时也不保存数据"""
+
+    def set(self, **sizes: int) -> None:
+        return
+
+    def __enter__(self) -> Span:
+        return self
+
+    def __exit__(
+        self, exc_type: type[BaseException] | None, exc_val: BaseException | None, exc_tb: TracebackType | None
+    ) -> None:
+        return
+
+
+_NULL_SPAN = _NullSpan("")
+
+
+def span(name: str, vault: str = "", **sizes: int) -> Span:
+    """
+    记录一个阶段的耗时，用法为 ``with span("search.fts", vault) as s: ...; s.set(results=n)``。
+    没有注册钩子时返回共享的空记录，开销只有一次判断
+    """
+    if not _hooks:
+        return _NULL_SPAN
+    return Span(name, vault, sizes)
+
+
+def add_hook(hook: SpanHook) -> None:
+    """注册钩子，每个阶段结束时以 Span 为参数调用"""
+    global _hooks
+    _hooks = (*_hooks, hook)
+
+
+def remove_hook(hook: SpanHook) -> None:
+    global _hooks
+    _hooks = tuple(h for h in _hooks if h is not hook)
+
+
+class SpanCollector:
+    """
+    内置的钩子，按阶段名称汇总耗时 (秒) 直方图和处理的数据量
+    """
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._histograms: dict[str, Histogram] = {}
+        self._sizes: dict[str, dict[str, int]] = {}
+        self._errors: dict[str, int] = {}
+
+    def __call__(self, span: Span) -> None:
+        with self._lock:
+            if span.name not in self._histograms:
+                self._histograms[span.name] = Histogram()
+                self._sizes[span.name] = {}
+                self._errors[span.name] = 0
+            self._histograms[span.name].observe(span.duration)
+            sizes = self._sizes[span.name]
+            for key, value in span.sizes.items():
+                sizes[key] = sizes.get(key, 0) + value
+            if span.error:
+                self._errors[span.name] += 1
+
+    def snapshot(self) -> dict[str, dict[str, Any]]:
+        """各阶段的次数、耗时分位数、直方图、累计数据量和出错次数"""
+        with self._lock:
+            return {
+                name: {**histogram.snapshot(), "sizes": dict(self._sizes[name]), "errors": self._errors[name]}
+                for name, histogram in self._histograms.items()
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._sizes.clear()
+            self._errors.clear()
+
+    def __str__(self) -> str:
+        return "\n".join(
+            f"{name}: 次数 {stats['count']}, 平均 {stats['mean'] * 1000:.3f}ms, p95 {stats['p95'] * 1000:.3f}ms, "
+            f"最大 {stats['max'] * 1000:.3f}ms"
+            for name, stats in self.snapshot().items()
+        )
+
+
+class Profiler:
+    """
+    按比例抽样对查询做性能剖析，结果写入 output_dir。engine 为 cprofile 时写入 .prof 文件，可以用 pstats
+    或 snakeviz 查看；为 pyinstrument 时写入 .html 文件，未安装 pyinstrument 时使用 cProfile。
+    剖析只覆盖调用线程，在线程池中执行的数据库查询需要结合 Span 的耗时来看。同一时间只剖析一个查询
+    """
+
+    def __init__(self, output_dir: Path, sample_rate: float = 0.01, engine: str = "cprofile") -> None:
+        self.output_dir = output_dir
+        self.sample_rate = sample_rate
+        self.engine = engine
+        self._running = Lock()
+        if engine == "pyinstrument":
+            try:
+                import pyinstrument  # noqa: F401
+            except ImportError:
+                logging.warning("未安装 pyinstrument，将使用 cProfile")
+                self.engine = "cprofile"
+
+    @contextmanager
+    def profile(self, name: str) -> Iterator[None]:
+        if random.random() >= self.sample_rate or not self._running.acquire(blocking=False):
+            yield
+            return
+        try:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            path = self.output_dir / f"{name}-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}"
+            if self.engine == "pyinstrument":
+                from pyinstrument import Profiler as Instrument
+
+                instrument = Instrument()
+                instrument.start()
+                try:
+                    yield
+                finally:
+                    instrument.stop()
+                    path.with_suffix(".html").write_text(instrument.output_html(), encoding="utf-8")
+            else:
+                profiler = cProfile.Profile()
+                profiler.enable()
+                try:
+                    yield
+                finally:
+                    profiler.disable()
+                    profiler.dump_stats(path.with_suffix(".prof"))
+            logging.debug("性能剖析结果已写入: %s", path)
+        finally:
+            self._running.release()
+
+
+def set_profiler(profiler: Profiler | None) -> None:
+    """设置抽样剖析器，None 表示关闭剖析"""
+    global _profiler
+    _profiler = profiler
+
+
+def profile(name: str) -> AbstractContextManager[None]:
+    """在抽样命中时剖析上下文中的代码，没有设置剖析器时不做任何事"""
+    if _profiler is None:
+        return nullcontext()
+    return _profiler.profile(name)
@@ -1,7 +1,15 @@
 from __future__ import annotations
 
 import logging
+import math
+import statistics
+from collections import OrderedDict
 from collections.abc import Callable
+from threading import Lock, RLock
+from typing import Any, TypeVar
+
+K = TypeVar("K")
+V = TypeVar("V")
 
 
 def load_module(
@@ -14,3 +22,119 @@ def load_module(
     except Exception as e:
         logging.debug(e)
         logging.warning(warning_message)
+
+
+class LazyModule:
+    """
+    延迟加载的模块函数。
+
+    首次调用 (或调用 load) 时才执行 function 导入对应的集成模块，并把 target 上的属性替换为真正的函数，
+    之后的调用不再经过这一层。导入失败时给出警告并恢复为属性原来的值。
+    """
+
+    def __init__(
+        self, function: Callable[[], Callable | None], attribute_name: str, target: object, warning_message: str
+    ) -> None:
+        self.function = function
+        self.attribute_name = attribute_name
+        self.target = target
+        self.warning_message = warning_message
+        self.fallback = getattr(target, attribute_name, None)
+        self._attribute: Callable | None = None
+        self._loaded = False
+        self._lock = Lock()
+
+    def load(self) -> Callable | None:
+        if self._loaded:
+            return self._attribute
+        with self._lock:
+            if not self._loaded:
+                attribute = None
+                try:
+                    attribute = self.function()
+                except Exception as e:
+                    logging.debug(e)
+                    logging.warning(self.warning_message)
+                self._attribute = attribute if attribute is not None else self.fallback
+                # 只替换仍指向自身的属性，避免覆盖用户在加载前设置的自定义函数
+                if self.target.__dict__.get(self.attribute_name) is self:
+                    setattr(self.target, self.attribute_name, self._attribute)
+                self._loaded = True
+        return self._attribute
+
+    def __call__(self, *args: Any, **kwargs: Any) -> Any:
+        attribute = self.load()
+        if attribute is None:
+            raise ImportError(self.warning_message)
+        return attribute(*args, **kwargs)
+
+
+def lazy_load_module(
+    function: Callable[[], Callable | None], attribute_name: str, target: object, warning_message: str
+) -> None:
+    """
+    与 load_module 相同，但推迟到首次使用时才导入模块
+    """
+    setattr(target, attribute_name, LazyModule(function, attribute_name, target, warning_message))
+
+
+def resolve_module(target: object, attribute_name: str) -> Any:
+    """
+    获取 target 上的模块函数，延迟加载的模块在此时导入
+    """
+    attribute = getattr(target, attribute_name)
+    if isinstance(attribute, LazyModule):
+        return attribute.load()
+    return attribute
+
+
+def truncate_embedding(vector: list[float], dims: int) -> list[float]:
+    """
+    截断向量并重新归一化，适用于以 Matryoshka 方式训练的向量模型
+    """
+    if dims <= 0 or dims >= len(vector):
+        return vector
+    truncated = vector[:dims]
+    norm = math.sqrt(sum(v * v for v in truncated))
+    return [v / norm for v in truncated] if norm else truncated
+
+
+def percentile(latencies: list[float], p: int) -> float:
+    """
+    延迟的第 p 百分位数 (1 <= p <= 99)，保留 3 位小数，少于两个样本时返回唯一的样本或 0
+    """
+    if len(latencies) < 2:
+        return round(latencies[0], 3) if latencies else 0.0
+    return round(statistics.quantiles(latencies, n=100, method="inclusive")[p - 1], 3)
+
+
+class LRUCache(OrderedDict[K, V]):
+    """
+    容量有限的字典，超过 maxsize 项时淘汰最久未使用的项，maxsize 为 0 表示不限制。
+    写入和 get 会把该项移到最近使用的位置 (下标访问不会，以便安全地遍历)，可以在多个线程中使用
+    """
+
+    def __init__(self, maxsize: int = 0) -> None:
+        super().__init__()
+        self.maxsize = maxsize
+        self._lock = RLock()
+
+    def __setitem__(self, key: K, value: V) -> None:
+        with self._lock:
+            super().__setitem__(key, value)
+            self.move_to_end(key)
+            while self.maxsize and len(self) > self.maxsize:
+                self.popitem(last=False)
+
+    def get(self, key: K, default: Any = None) -> Any:
+        with self._lock:
+            if key not in self:
+                return default
+            self.move_to_end(key)
+            return self[key]
+
+    def copy(self) -> LRUCache[K, V]:
+        with self._lock:
+            cache: LRUCache[K, V] = LRUCache(self.maxsize)
+            cache.update(self)
+            return cache
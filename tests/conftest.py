@@ -15,10 +15,13 @@ JINA_TEST_API_KEY = "jina_d2ea2a2b72cd4cd4bad16b96b3e340aeZ1Ae5BHHSXXbHqDUUe0-Tl
 @pytest.fixture
 def config(tmp_path):
     config = Config()
+    original = config.config, config.config_path, config._changed
     config.config = MagicMock(spec=configparser.ConfigParser)
     config.config_path = tmp_path / "test_config.ini"
     config._changed = False  # 假设配置已更改，需要保存
-    return config
+    yield config
+    # 恢复单例的状态，避免影响其他测试
+    config.config, config.config_path, config._changed = original
 
 
 @pytest.fixture
@@ -5,7 +5,7 @@ from unittest.mock import MagicMock, patch
 
 import pytest
 
-from uglyrag.database.base import Database
+from uglyrag.database.base import ConnectionPool, Database
 
 
 class ConcreteDatabase(Database):
@@ -21,6 +21,9 @@ class ConcreteDatabase(Database):
     def insert_data(self, data: list[tuple[str, str, str]], vault: str) -> None:
         pass
 
+    def has_vault(self, vault: str) -> bool:
+        return True
+
     def _check_vault(self, vault: str) -> bool:
         return True
 
@@ -30,6 +33,9 @@ class ConcreteDatabase(Database):
     def _background_search_vec(self, query: str, vault: str, top_n: int = 5) -> list[tuple[str, str]]:
         return []
 
+    def _exact_search_vec(self, query: str, vault: str, top_n: int = 5) -> list[tuple[str, str]]:
+        return []
+
 
 @pytest.fixture
 def db():
@@ -87,3 +93,27 @@ def test_background_search_fts(db):
 
 def test_background_search_vec(db):
     assert db._background_search_vec("query", "vault") == []
+
+
+def test_connection_pool():
+    class Conn:
+        closed = False
+
+        def close(self):
+            self.closed = True
+
+    created = []
+    pool = ConnectionPool(lambda: created.append(Conn()) or created[-1], 2)
+    with pool.connection() as first, pool.connection() as second:
+        assert first is not second
+    with pool.connection() as conn:
+        assert conn in (first, second)
+    assert len(created) == 2
+    # reset 后正在使用的连接在归还时关闭
+    with pool.connection() as conn:
+        pool.reset()
+    assert all(c.closed for c in created)
+    with pool.connection() as conn:
+        assert conn not in created[:2]
+    with pytest.raises(ValueError):
+        ConnectionPool(Conn, 0)
@@ -67,3 +67,117 @@ def test_duckdb_background_search_fts(duckdb, reset_database):
 def test_duckdb_background_search_vec(duckdb, reset_database):
     results = duckdb._background_search_vec("query", "vault")
     assert isinstance(results, list)
+
+
+@pytest.fixture
+def deferred_duckdb():
+    def segment(x):
+        return x.split()
+
+    def embedding(x):
+        return [0.1, 0.2, 0.3]
+
+    db = DuckDBDatabase(
+        Path("/tmp/test_deferred.ddb"), segment, embedding, fts_rebuild="deferred", fts_rebuild_on_query=False
+    )
+    db.reset()
+    db._check_vault("vault")
+    db.insert_data([("source", "1", "hello world")], "vault")
+    db.rebuild_index("vault", force=True)
+    return db
+
+
+def test_duckdb_invalid_rebuild_mode():
+    with pytest.raises(ValueError):
+        DuckDBDatabase(Path("/tmp/test.ddb"), lambda x: x.split(), lambda x: [0.1], fts_rebuild="never")
+
+
+def test_duckdb_deferred_rebuild_marks_dirty(deferred_duckdb):
+    deferred_duckdb.insert_data([("source2", "1", "hello again")], "vault")
+    deferred_duckdb.rebuild_index("vault")
+    state = deferred_duckdb._get_fts_state("vault")
+    assert state.dirty
+    deferred_duckdb.rebuild_index("vault", force=True)
+    assert not deferred_duckdb._get_fts_state("vault").dirty
+
+
+def test_duckdb_deferred_rebuild_threshold(deferred_duckdb):
+    deferred_duckdb.fts_rebuild_threshold = 2
+    deferred_duckdb.insert_data([("source2", "1", "a b"), ("source2", "2", "c d")], "vault")
+    deferred_duckdb.rebuild_index("vault")
+    assert not deferred_duckdb._get_fts_state("vault").dirty
+
+
+def test_duckdb_deferred_search_merges_delta(deferred_duckdb):
+    deferred_duckdb.insert_data([("source2", "1", "unindexed words")], "vault")
+    deferred_duckdb.rebuild_index("vault")
+    results = deferred_duckdb._background_search_fts("unindexed", "vault")
+    assert [content for _, content in results] == ["unindexed words"]
+
+
+def test_duckdb_deferred_rebuild_on_query(deferred_duckdb):
+    deferred_duckdb.fts_rebuild_on_query = True
+    deferred_duckdb.insert_data([("source2", "1", "fresh words")], "vault")
+    deferred_duckdb.rebuild_index("vault")
+    deferred_duckdb._background_search_fts("fresh", "vault")
+    assert not deferred_duckdb._get_fts_state("vault").dirty
+
+
+def test_duckdb_fts_state_survives_restart(deferred_duckdb):
+    deferred_duckdb.insert_data([("source2", "1", "pending words")], "vault")
+    deferred_duckdb._fts_states.clear()
+    state = deferred_duckdb._get_fts_state("vault")
+    assert state.indexed
+    assert state.pending == 1
+
+
+def test_duckdb_maintain(duckdb, reset_database):
+    report = duckdb.maintain("vault")
+    assert "HNSW compact" in report.steps
+    assert "CHECKPOINT" in report.steps
+    assert report.bytes_after > 0
+
+
+def test_duckdb_vault_dims(duckdb):
+    duckdb.reset()
+    assert duckdb._check_vault("small", dims=2)
+    assert duckdb.vault_dims("small") == 2
+    duckdb.insert_data([("source", "1", "content")], "small")
+    assert len(duckdb._background_search_vec("content", "small")) == 1
+
+
+def test_duckdb_search_options(duckdb, reset_database):
+    assert duckdb.search_options() == {"m": 16, "ef_construction": 128, "ef_search": 64}
+    duckdb.set_search_options("vault", m=8, ef_search=32)
+    assert duckdb.search_options() == {"m": 8, "ef_construction": 128, "ef_search": 32}
+    assert duckdb.conn.execute("SELECT current_setting('hnsw_ef_search')").fetchone()[0] == 32
+    assert duckdb._exact_search_vec("content", "vault", 1)[0][1] == "content"
+    with pytest.raises(ValueError):
+        duckdb.set_search_options("vault", rescore_factor=2)
+
+
+def test_duckdb_read_connections(tmp_path):
+    db = DuckDBDatabase(tmp_path / "pool.ddb", str.split, lambda x: [0.1, 0.2, 0.3], read_connections=2)
+    db._check_vault("vault")
+    db.insert_data([("source", "1", "content")], "vault")
+    assert db._background_search_fts("content", "vault")[0][1] == "content"
+    assert db._background_search_vec("content", "vault")[0][1] == "content"
+    db.set_search_options("vault", ef_search=16)
+    setting = "SELECT value FROM duckdb_settings() WHERE name = 'hnsw_ef_search'"
+    with db._reader() as conn:
+        assert conn is not db.conn
+        assert conn.execute(setting).fetchone()[0] == "16"
+
+
+def test_duckdb_read_only(tmp_path):
+    db = DuckDBDatabase(tmp_path / "ro.ddb", str.split, lambda x: [0.1, 0.2, 0.3])
+    db._check_vault("vault")
+    db.insert_data([("source", "1", "content")], "vault")
+    db.conn.close()
+    reader = DuckDBDatabase(tmp_path / "ro.ddb", str.split, lambda x: [0.1, 0.2, 0.3], read_only=True)
+    assert reader._check_vault("vault")
+    assert not reader._check_vault("missing")
+    assert reader._background_search_fts("content", "vault")[0][1] == "content"
+    assert reader._background_search_vec("content", "vault")[0][1] == "content"
+    with pytest.raises(PermissionError):
+        reader.insert_data([("source", "2", "content")], "vault")
@@ -1,10 +1,13 @@
 from __future__ import annotations
 
+import threading
+from array import array
 from pathlib import Path
 
 import pytest
+from sqlite_vec import serialize_float32
 
-from uglyrag.database._sqlite import SQLiteDatebase
+from uglyrag.database._sqlite import SQLiteDatebase, serialize_embedding
 
 
 @pytest.fixture
@@ -66,3 +69,255 @@ def test_sqlite_background_search_fts(sqlite, reset_database):
 def test_sqlite_background_search_vec(sqlite, reset_database):
     results = sqlite._background_search_vec("query", "vault")
     assert isinstance(results, list)
+
+
+def test_sqlite_bulk_load(sqlite):
+    sqlite.reset()
+    sqlite._check_vault("vault")
+    with sqlite.bulk_load("vault"):
+        assert sqlite.conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        sqlite.insert_data([("source", "1", "bulk content"), ("source", "2", "more content")], "vault")
+    assert sqlite.conn.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+    assert sqlite.conn.execute("SELECT count(*) FROM vault_vec").fetchone()[0] == 2
+    assert [content for _, content in sqlite._background_search_fts("bulk", "vault")] == ["bulk content"]
+
+
+def test_sqlite_bulk_load_restores_triggers(sqlite):
+    sqlite.reset()
+    sqlite._check_vault("vault")
+    with sqlite.bulk_load("vault"):
+        pass
+    sqlite.insert_data([("source", "1", "after bulk")], "vault")
+    assert sqlite.conn.execute("SELECT count(*) FROM vault_fts").fetchone()[0] == 1
+
+
+def test_sqlite_maintain_online(sqlite, reset_database):
+    report = sqlite.maintain("vault")
+    assert report.online
+    assert any(step.startswith("FTS5 merge") for step in report.steps)
+    assert "ANALYZE" in report.steps
+    assert [content for _, content in sqlite._background_search_fts("content", "vault")] == ["content"]
+
+
+def test_sqlite_maintain_offline_compacts_vectors(sqlite, reset_database):
+    sqlite.insert_data([(f"s{i}", "1", f"content {i}") for i in range(100)], "vault")
+    sqlite.conn.execute("DELETE FROM vault WHERE source != 'source'")
+    sqlite.conn.commit()
+    report = sqlite.maintain("vault", online=False)
+    assert "VACUUM" in report.steps
+    assert any(step.startswith("重建向量表") for step in report.steps)
+    assert sqlite.conn.execute("SELECT count(*) FROM vault_vec").fetchone()[0] == 1
+    assert len(sqlite._background_search_vec("query", "vault")) == 1
+
+
+def test_sqlite_fts_external_content(sqlite, reset_database):
+    sql = sqlite.conn.execute("SELECT sql FROM sqlite_master WHERE name='vault_fts'").fetchone()[0]
+    assert "content='vault_fts_content'" in sql
+    sqlite.conn.execute("UPDATE vault SET content='changed text' WHERE source='source'")
+    sqlite.conn.commit()
+    assert sqlite._background_search_fts("content", "vault") == []
+    assert [content for _, content in sqlite._background_search_fts("changed", "vault")] == ["changed text"]
+    sqlite.del_source("source", "vault")
+    assert sqlite._background_search_fts("changed", "vault") == []
+
+
+def test_sqlite_migrate_fts(sqlite):
+    sqlite.reset()
+    sqlite.conn.execute(
+        "CREATE TABLE vault (id INTEGER PRIMARY KEY AUTOINCREMENT, content TEXT NOT NULL, part_id TEXT, source TEXT, created_at DATETIME DEFAULT CURRENT_TIMESTAMP)"
+    )
+    sqlite.conn.execute("CREATE VIRTUAL TABLE vault_fts USING fts5(indexed_content)")
+    sqlite.conn.execute("CREATE VIRTUAL TABLE vault_vec USING vec0(embedding FLOAT[3])")
+    sqlite.conn.execute("INSERT INTO vault (source, part_id, content) VALUES ('source', '1', 'old content')")
+    sqlite.conn.execute("INSERT INTO vault_fts(rowid, indexed_content) VALUES (1, 'old content')")
+    sqlite.conn.commit()
+    assert sqlite._check_vault("vault")
+    assert sqlite._is_external_fts("vault")
+    assert [content for _, content in sqlite._background_search_fts("old", "vault")] == ["old content"]
+    sqlite.insert_data([("source", "2", "new content")], "vault")
+    assert len(sqlite._background_search_fts("content", "vault")) == 2
+
+
+@pytest.mark.parametrize("quantization", ["int8", "binary"])
+def test_sqlite_quantized_vectors(quantization):
+    def embedding(x):
+        return [(ord(c) % 7 - 3) / 3 for c in (x * 8)[:8]]
+
+    db = SQLiteDatebase(Path("/tmp/test_quantized.db"), str.split, embedding, vec_quantization=quantization)
+    db.reset()
+    db._check_vault("vault")
+    assert db._get_quantization("vault") == quantization
+    db.insert_data([("a", "1", "alpha"), ("b", "1", "beta"), ("c", "1", "gamma")], "vault")
+    with db.bulk_load("vault"):
+        db.insert_data([("d", "1", "delta")], "vault")
+    assert db.conn.execute("SELECT count(*) FROM vault_vec_full").fetchone()[0] == 4
+    assert db._background_search_vec("beta", "vault", top_n=1) == [(2, "beta")]
+    db.conn.execute("UPDATE vault SET content='delta' WHERE source='a'")
+    db.del_source("b", "vault")
+    assert db.conn.execute("SELECT count(*) FROM vault_vec_full").fetchone()[0] == 3
+    assert [content for _, content in db._background_search_vec("delta", "vault", top_n=2)] == ["delta", "delta"]
+    db._rebuild_vec("vault")
+    assert db.conn.execute("SELECT count(*) FROM vault_vec").fetchone()[0] == 3
+
+
+def test_sqlite_invalid_quantization():
+    with pytest.raises(ValueError):
+        SQLiteDatebase(Path("/tmp/test_quantized.db"), str.split, lambda x: [0.1] * 8, vec_quantization="int4")
+
+
+def test_sqlite_vault_dims(sqlite):
+    sqlite.reset()
+    assert sqlite._check_vault("small", dims=2)
+    assert sqlite.get_metadata("small")["dims"] == "2"
+    sqlite.insert_data([("source", "1", "content")], "small")
+    assert sqlite.conn.execute("SELECT vec_length(embedding) FROM small_vec").fetchone()[0] == 2
+    assert len(sqlite._background_search_vec("content", "small")) == 1
+    # 已存在的存储库沿用创建时记录的维度
+    sqlite._vault_dims.clear()
+    assert sqlite._check_vault("small", dims=3)
+    assert sqlite.vault_dims("small") == 2
+    with pytest.raises(ValueError):
+        sqlite._create_vault("large", sqlite.conn, dims=4)
+
+
+def test_sqlite_array_embeddings(tmp_path):
+    vector = [0.1, 0.2, 0.3, 0.4]
+    assert serialize_embedding(array("f", vector)) == serialize_float32(vector)
+    db = SQLiteDatebase(tmp_path / "array.db", str.split, lambda x: array("f", vector))
+    assert db._check_vault("vault", dims=2)
+    db.insert_data([("source", "1", "content")], "vault")
+    assert db._background_search_vec("content", "vault") == [(1, "content")]
+
+
+def test_sqlite_metadata_avoids_probe(caplog):
+    calls = []
+
+    def embedding(x):
+        calls.append(x)
+        return [0.1, 0.2, 0.3]
+
+    info = {"embedding_module": "Test", "embedding_model": "test-model"}
+    db = SQLiteDatebase(Path("/tmp/test_meta.db"), str.split, embedding, embedding_info=info)
+    db.reset()
+    assert calls == []
+    db._check_vault("vault")
+    metadata = db.get_metadata("vault")
+    assert metadata["embedding_model"] == "test-model"
+    assert metadata["dims"] == "3"
+    assert {"schema_version", "created_at"} <= metadata.keys()
+    db.conn.close()
+
+    calls.clear()
+    info = {"embedding_module": "Test", "embedding_model": "other-model"}
+    db = SQLiteDatebase(Path("/tmp/test_meta.db"), str.split, embedding, embedding_info=info)
+    assert db._check_vault("vault")
+    assert db.vault_dims("vault") == 3
+    assert calls == []
+    assert "other-model" in caplog.text
+
+
+def test_sqlite_metadata_for_legacy_vault(sqlite, reset_database):
+    sqlite.conn.execute("DELETE FROM _uglyrag_meta")
+    sqlite.conn.commit()
+    sqlite._vault_dims.clear()
+    assert sqlite._check_vault("vault")
+    assert sqlite.get_metadata("vault") == {"dims": "3"}
+
+
+def test_sqlite_segment_change_rebuilds_fts(tmp_path):
+    path = tmp_path / "segment.db"
+    db = SQLiteDatebase(path, str.split, lambda x: [0.1, 0.2, 0.3], segment_info={"segment": "split"})
+    db._check_vault("vault")
+    db.insert_data([("source", "1", "hello world")], "vault")
+    db.conn.commit()
+    assert db.get_metadata("vault")["segment"] == "split"
+    db.conn.close()
+
+    # 分词函数改变后重建全文索引，删除时按新的分词结果移除词条不会破坏索引
+    def reverse(text):
+        return [word[::-1] for word in text.split()]
+
+    db = SQLiteDatebase(path, reverse, lambda x: [0.1, 0.2, 0.3], segment_info={"segment": "reverse"})
+    assert db._check_vault("vault")
+    assert db.get_metadata("vault")["segment"] == "reverse"
+    assert db._background_search_fts("hello", "vault") == [(1, "hello world")]
+    assert db.del_source("source", "vault")
+    db.conn.execute("INSERT INTO vault_fts(vault_fts) VALUES('integrity-check')")
+    db.conn.close()
+
+    # 只读模式下不能重建，拒绝打开存储库
+    db = SQLiteDatebase(path, str.split, lambda x: [0.1, 0.2, 0.3], segment_info={"segment": "split"}, read_only=True)
+    assert not db._check_vault("vault")
+
+
+def test_sqlite_read_connections(tmp_path):
+    db = SQLiteDatebase(tmp_path / "pool.db", str.split, lambda x: [0.1, 0.2, 0.3], read_connections=2)
+    db._check_vault("vault")
+    db.insert_data([("source", "1", "content")], "vault")
+    with db:
+        pass  # 提交写入
+    assert db.conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert db._background_search_fts("content", "vault") == [(1, "content")]
+    assert db._background_search_vec("content", "vault") == [(1, "content")]
+    with db._reader() as conn:
+        assert conn is not db.conn
+
+
+def test_sqlite_shared_connection_search_waits_for_writes(tmp_path):
+    # 查询与写入共用一个连接时，查询要等写入的批次提交后才能执行，不会读到未提交的数据
+    db = SQLiteDatebase(tmp_path / "shared.db", str.split, lambda x: [0.1, 0.2, 0.3])
+    db._check_vault("vault")
+    results = []
+    with db:
+        db.insert_data([("source", "1", "content")], "vault")
+        thread = threading.Thread(target=lambda: results.append(db._background_search_fts("content", "vault")))
+        thread.start()
+        thread.join(0.2)
+        assert thread.is_alive()
+    thread.join()
+    assert results == [[(1, "content")]]
+
+
+@pytest.mark.parametrize("immutable", [False, True])
+def test_sqlite_read_only(tmp_path, immutable):
+    db = SQLiteDatebase(tmp_path / "ro.db", str.split, lambda x: [0.1, 0.2, 0.3])
+    db._check_vault("vault")
+    db.insert_data([("source", "1", "content")], "vault")
+    with db:
+        pass  # 提交写入
+    reader = SQLiteDatebase(
+        tmp_path / "ro.db", str.split, lambda x: [0.1, 0.2, 0.3], read_only=True, immutable=immutable
+    )
+    assert reader._check_vault("vault")
+    assert not reader._check_vault("missing")
+    assert reader._background_search_fts("content", "vault") == [(1, "content")]
+    assert reader._background_search_vec("content", "vault") == [(1, "content")]
+    with pytest.raises(PermissionError):
+        reader.insert_data([("source", "2", "content")], "vault")
+    with pytest.raises(PermissionError):
+        reader.del_source("source", "vault")
+
+
+def test_sqlite_vault_names(tmp_path):
+    db = SQLiteDatebase(tmp_path / "names.db", str.split, lambda x: [0.1, 0.2])
+    assert not db.has_vault("vault")
+    for name in ("vault' OR '1'='1", "x; DROP TABLE y", "1vault", "vault_fts", "_uglyrag_meta"):
+        assert not db._check_vault(name)
+    assert not db.has_vault("vault")
+    assert db._check_vault("vault") and db.has_vault("vault")
+
+
+def test_sqlite_incremental_vacuum(tmp_path):
+    db = SQLiteDatebase(tmp_path / "vacuum.db", str.split, lambda x: [0.1, 0.2], maintenance_step_pages=16)
+    db.conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    db.conn.execute("VACUUM")
+    db.conn.execute("CREATE TABLE filler (data BLOB)")
+    db.conn.executemany("INSERT INTO filler VALUES (?)", [(b"x" * 4000,) for _ in range(500)])
+    db.conn.commit()
+    db.conn.execute("DROP TABLE filler")
+    db.conn.commit()
+    assert db.conn.execute("PRAGMA freelist_count").fetchone()[0] > 400
+    steps = db._incremental_vacuum()
+    # 每步只回收 16 页，需要多步才能回收全部空闲页
+    assert steps > 20
+    assert db.conn.execute("PRAGMA freelist_count").fetchone()[0] == 0
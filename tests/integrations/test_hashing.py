@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import math
+
+import pytest
+
+from uglyrag.config import config
+from uglyrag.integrations import hashing
+from uglyrag.integrations.hashing import hash_embedding, overlap_scores, random_embedding, random_scores, tokenize
+
+
+def dot(a, b):
+    return sum(x * y for x, y in zip(a, b))
+
+
+def test_tokenize():
+    assert tokenize("Hello 向量检索, RAG!") == ["hello", "向量", "量检", "检索", "rag"]
+
+
+def test_hash_embedding():
+    vector = hash_embedding("向量检索 vector search", 64)
+    assert len(vector) == 64
+    assert math.isclose(sum(v * v for v in vector), 1.0)
+    assert vector == hash_embedding("向量检索 vector search", 64)
+    # 共享词越多的文本越接近
+    similar = hash_embedding("向量检索 vector", 64)
+    different = hash_embedding("分词模型 token", 64)
+    assert dot(vector, similar) > dot(vector, different)
+    assert len(hash_embedding("", 8)) == 8
+
+
+def test_random_embedding():
+    vector = random_embedding("text", 32)
+    assert len(vector) == 32
+    assert math.isclose(sum(v * v for v in vector), 1.0)
+    assert vector == random_embedding("text", 32)
+    assert vector != random_embedding("other", 32)
+
+
+def test_scores():
+    assert overlap_scores("vector search", ["vector index", "search vector", "other"]) == [0.5, 1.0, 0.0]
+    assert overlap_scores("", ["doc"]) == [0.0]
+    scores = random_scores("query", ["a", "b"])
+    assert scores == random_scores("query", ["a", "b"])
+    assert all(0 <= score < 1 for score in scores)
+
+
+@pytest.mark.parametrize("function, section", [(hashing.embeddings, "Hash"), (hashing.random_embeddings, "Random")])
+def test_configured_dims(monkeypatch, function, section):
+    options = {(section, "dimensions"): "16"}
+    monkeypatch.setattr(
+        config, "get", lambda option, section="DEFAULT", default="": options.get((section, option), default)
+    )
+    assert [len(vector) for vector in function(["a", "b", "c"])] == [16, 16, 16]
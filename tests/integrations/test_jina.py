@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import threading
+from array import array
+
+import pytest
+
+from uglyrag.integrations.hashing import hash_embedding
+from uglyrag.integrations.jina import JinaAPI, JinaError, decode_embedding
+from uglyrag.mock_jina import MockJinaServer, encode_embedding
+from uglyrag.ratelimit import RateLimiter
+
+
+@pytest.fixture
+def server(monkeypatch):
+    with MockJinaServer(dims=8, seed=0) as server:
+        monkeypatch.setattr(JinaAPI, "url", server.url)
+        monkeypatch.setattr(JinaAPI, "limiter", RateLimiter())
+        monkeypatch.setattr(JinaAPI, "max_retries", 3)
+        monkeypatch.setattr(JinaAPI, "_local", threading.local())
+        monkeypatch.setattr(JinaAPI, "embedding_type", "base64")
+        monkeypatch.setattr(JinaAPI, "compress", True)
+        yield server
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps: list[float] = []
+    monkeypatch.setattr(JinaAPI, "_sleep", sleeps.append)
+    return sleeps
+
+
+def test_session_reuse(server):
+    for _ in range(3):
+        JinaAPI.embeddings(["text"])
+    assert JinaAPI.embeddings([]) == []
+    assert server.stats["connections"] == 1
+
+
+def test_retry_server_errors(server, sleeps):
+    server.error_rate = 0.5
+    texts = [f"文本 {i}" for i in range(20)]
+    assert len([JinaAPI.embedding(text) for text in texts]) == 20
+    assert server.stats["/v1/embeddings 500"] == len(sleeps) > 0
+    assert all(0 <= delay <= JinaAPI.max_backoff for delay in sleeps)
+
+
+def test_retry_after(server, sleeps):
+    server.rpm = 1
+    JinaAPI.embeddings(["a"])
+    with pytest.raises(JinaError) as e:
+        JinaAPI.embeddings(["b"])
+    # 限流时不拆分批次，按 Retry-After 等待后重试
+    assert e.value.status == 429
+    assert server.stats["/v1/embeddings 429"] == JinaAPI.max_retries + 1
+    assert all(delay >= 1 for delay in sleeps)
+
+
+def test_split_failed_batch(server, sleeps):
+    server.max_items = 3
+    texts = [f"text {i}" for i in range(10)]
+    vectors = JinaAPI.embeddings(texts)
+    assert vectors == [JinaAPI.embedding(text) for text in texts]
+    assert server.stats["/v1/embeddings 413"] > 0
+    assert not sleeps  # 413 不重试，直接拆分
+    server.max_items = 1
+    assert JinaAPI.rerank("text", ["text", "other", "text 1"]) == [1.0, 0.0, 1.0]
+
+
+def test_no_split_after_server_errors(server, sleeps):
+    server.error_rate = 1.0
+    with pytest.raises(JinaError) as e:
+        JinaAPI.embeddings([f"text {i}" for i in range(8)])
+    # 服务端错误重试后直接抛出，不拆分批次
+    assert e.value.status == 500
+    assert server.stats["/v1/embeddings 500"] == JinaAPI.max_retries + 1
+
+
+def test_no_retry_on_auth_error(server, sleeps):
+    server.api_key = "secret"
+    with pytest.raises(JinaError) as e:
+        JinaAPI.embeddings(["a", "b"])
+    assert e.value.status == 401
+    assert server.stats["/v1/embeddings 401"] == 1
+    assert not sleeps
+
+
+def test_client_rate_limit(server, sleeps, monkeypatch):
+    waits: list[float] = []
+    monkeypatch.setattr(JinaAPI, "limiter", RateLimiter(rpm=60, sleep=waits.append))
+    for _ in range(10):
+        JinaAPI.embeddings(["a"])
+    # 突发 6 个请求后，每个请求按补充速率排队等待
+    assert len(waits) == 4 and waits == sorted(waits)
+
+
+@pytest.mark.parametrize("embedding_type", ["float", "base64", "binary", "ubinary"])
+def test_decode_embedding(embedding_type):
+    vector = hash_embedding("向量检索", 16)
+    decoded = decode_embedding(encode_embedding(vector, embedding_type), embedding_type)
+    if embedding_type in ("float", "base64"):
+        assert decoded == pytest.approx(vector, abs=1e-6)
+    else:
+        # 每位展开为 ±1，保留各个维度的符号
+        assert isinstance(decoded, array)
+        assert list(decoded) == [1.0 if v > 0 else -1.0 for v in vector]
+
+
+def test_embedding_types(server, monkeypatch):
+    # 哈希向量的取值很少，压缩后不能反映真实模型的输出，只比较未压缩的响应大小
+    monkeypatch.setattr(JinaAPI, "headers", {**JinaAPI.headers, "Accept-Encoding": "identity"})
+    # 词数足够多时哈希向量的各个维度基本都不为 0
+    texts = [" ".join(f"{prefix}{i}" for i in range(5000)) for prefix in ("a", "b")]
+    responses = {}
+    for embedding_type in ("float", "base64", "ubinary"):
+        monkeypatch.setattr(JinaAPI, "embedding_type", embedding_type)
+        before = server.stats["bytes_out"]
+        vectors = JinaAPI.embeddings(texts)
+        responses[embedding_type] = server.stats["bytes_out"] - before
+        assert [len(v) for v in vectors] == [1024, 1024]
+    assert isinstance(vectors[0], array)
+    assert responses["ubinary"] < responses["base64"] < responses["float"]
+
+
+def test_request_compression(server, monkeypatch):
+    texts = ["vector search " * 200]
+    JinaAPI.embeddings(texts)
+    compressed = server.stats["bytes_in"]
+    monkeypatch.setattr(JinaAPI, "compress", False)
+    JinaAPI.embeddings(texts)
+    assert compressed < server.stats["bytes_in"] - compressed
+
+
+def test_compression_unsupported(server, sleeps):
+    server.gzip_requests = False
+    assert len(JinaAPI.embeddings(["vector search " * 200])) == 1
+    # 收到 415 后改为不压缩的请求，不计入重试
+    assert server.stats["/v1/embeddings 415"] == 1
+    assert not JinaAPI.compress and not sleeps
@@ -19,7 +19,7 @@ def test_no_module_configured(mock_config):
         get_embeddings_module()
 
 
-@pytest.mark.parametrize("module_name", ["FastEmbed", "JINA"])
+@pytest.mark.parametrize("module_name", ["FastEmbed", "JINA", "Hash", "Random"])
 def test_valid_modules(mock_config, module_name):
     mock_config.embedding_module = module_name
     embeddings = get_embeddings_module()
@@ -2,6 +2,8 @@ from __future__ import annotations
 
 import pytest
 
+from uglyrag.batching import RerankScheduler
+from uglyrag.config import config
 from uglyrag.modules.rerank import get_rerank_module
 
 
@@ -17,7 +19,7 @@ def test_no_module_configured(mock_config):
         get_rerank_module()
 
 
-@pytest.mark.parametrize("module_name", ["JINA"])
+@pytest.mark.parametrize("module_name", ["JINA", "Hash", "Random"])
 def test_valid_modules(mock_config, module_name):
     mock_config.rerank_module = module_name
     rerank = get_rerank_module()
@@ -26,3 +28,21 @@ def test_valid_modules(mock_config, module_name):
     result = rerank("query", ["doc1", "doc2"])
     assert isinstance(result, list), "Result should be a list"
     assert all(isinstance(score, float) for score in result), "Each score in result should be a float"
+
+
+@pytest.mark.parametrize("module_name", ["Hash", "Random"])
+def test_batched_rerank(mock_config, monkeypatch, module_name):
+    mock_config.rerank_module = module_name
+    rerank = get_rerank_module()
+    get = config.get
+    monkeypatch.setattr(
+        config,
+        "get",
+        lambda option, section="DEFAULT", default="": "8"
+        if option == "rerank_batch_size"
+        else get(option, section, default),
+    )
+    batched = get_rerank_module()
+    assert isinstance(batched, RerankScheduler)
+    assert batched("query doc", ["doc1", "query doc2"]) == rerank("query doc", ["doc1", "query doc2"])
+    batched.close()
@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from uglyrag.batching import MicroBatcher, RerankScheduler, pairwise
+
+
+def test_concurrent_submits_are_batched():
+    batches = []
+
+    def double(items):
+        batches.append(list(items))
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(double, max_batch=4, max_wait=0.05)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(batcher, range(8)))
+    batcher.close()
+    assert results == [i * 2 for i in range(8)]
+    assert sorted(i for batch in batches for i in batch) == list(range(8))
+    assert all(len(batch) <= 4 for batch in batches)
+    assert len(batches) < 8
+
+
+def test_errors_are_propagated():
+    def fail(items):
+        raise RuntimeError("batch failed")
+
+    batcher = MicroBatcher(fail, max_wait=0)
+    with pytest.raises(RuntimeError, match="batch failed"):
+        batcher(1)
+    batcher.func = lambda items: []
+    with pytest.raises(ValueError):
+        batcher(1)
+    batcher.close()
+    with pytest.raises(RuntimeError):
+        batcher.submit(1)
+
+
+def test_asubmit():
+    calls = []
+    event = threading.Event()
+
+    def embed(items):
+        calls.append(len(items))
+        event.set()
+        return [len(item) for item in items]
+
+    batcher = MicroBatcher(embed, max_wait=0.05)
+
+    async def main():
+        return await asyncio.gather(*(batcher.asubmit(text) for text in ["a", "bb", "ccc"]))
+
+    assert asyncio.run(main()) == [1, 2, 3]
+    assert calls == [3]
+    batcher.close()
+
+
+def test_rerank_scheduler_batches_pairs_across_queries():
+    batches = []
+
+    def score_pairs(pairs):
+        batches.append(list(pairs))
+        return [float(len(query) + len(doc)) for query, doc in pairs]
+
+    scheduler = RerankScheduler(score_pairs, max_batch=64, max_wait=0.05)
+    queries = {"q": ["a", "bb"], "qq": ["ccc"], "qqq": ["d", "ee", "fff"]}
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        results = dict(zip(queries, executor.map(scheduler, queries, queries.values())))
+    scheduler.close()
+    assert results == {"q": [2.0, 3.0], "qq": [5.0], "qqq": [4.0, 5.0, 6.0]}
+    assert len(batches) == 1 and len(batches[0]) == 6
+    # 同一查询的文档在批次中相邻且保持顺序
+    assert batches[0].index(("qqq", "ee")) == batches[0].index(("qqq", "d")) + 1
+
+
+def test_pairwise():
+    calls = []
+
+    def rerank(query, documents):
+        calls.append(query)
+        return [float(len(document)) for document in documents]
+
+    assert pairwise(rerank)([("a", "x"), ("b", "yy"), ("a", "zzz")]) == [1.0, 2.0, 3.0]
+    assert calls == ["a", "b"]
+
+
+def test_batcher_after_fork():
+    batcher = MicroBatcher(lambda items: [item * 2 for item in items], max_wait=0)
+    assert batcher(1) == 2
+    pid = os.fork()
+    if pid == 0:
+        # 父进程的后台线程不会被复制到子进程
+        os._exit(0 if batcher(2) == 4 else 1)
+    assert os.waitpid(pid, 0)[1] == 0
+    batcher.close()
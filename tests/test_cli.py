@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import json
+from unittest.mock import patch
+
+import pytest
+
+from uglyrag.cli import build_parser, main
+from uglyrag.database import MaintenanceReport
+from uglyrag.ingest import IngestStats
+
+
+def test_parser_requires_command():
+    with pytest.raises(SystemExit):
+        build_parser().parse_args([])
+
+
+def test_ingest():
+    with patch("uglyrag.SearchEngine.build_from_paths", return_value=IngestStats(files_ingested=1)) as mock_build:
+        assert main(["ingest", "docs", "*.md", "--vault", "Test", "--workers", "2"]) == 0
+        mock_build.assert_called_once_with(["docs", "*.md"], "Test", workers=2, force=False, bulk_load=False)
+
+
+def test_ingest_failed_files():
+    with patch("uglyrag.SearchEngine.build_from_paths", return_value=IngestStats(files_failed=1)):
+        assert main(["ingest", "docs"]) == 1
+
+
+def test_maintain():
+    with patch("uglyrag.SearchEngine.maintain", return_value=MaintenanceReport("Core", False)) as mock_maintain:
+        assert main(["maintain", "--offline"]) == 0
+        mock_maintain.assert_called_once_with(None, online=False)
+
+
+def test_eval(tmp_path):
+    queries = tmp_path / "queries.txt"
+    queries.write_text("query\n", encoding="utf-8")
+    with (
+        patch("uglyrag.db_manager.DatabaseManager.open_database") as mock_open,
+        patch("uglyrag.evaluation.evaluate", return_value=[]) as mock_evaluate,
+    ):
+        assert main(["eval", str(queries), "--db", "a.ddb", "--sweep", "ef_search=16,64", "--mode", "vec"]) == 0
+    mock_open.assert_called_once()
+    args = mock_evaluate.call_args.args
+    assert args[1:] == ("Core", args[2], 10, {"ef_search": [16.0, 64.0]}, ["vec"])
+    assert mock_evaluate.call_args.kwargs == {"backend": "a.ddb"}
+
+
+def test_replay(tmp_path):
+    log = tmp_path / "queries.jsonl"
+    log.write_text('{"q":"query","v":"Core","n":5}\n', encoding="utf-8")
+    output = tmp_path / "replay.json"
+    with patch("uglyrag.SearchEngine.search") as mock_search:
+        assert main(["replay", str(log), "--qps", "50,100", "--output", str(output)]) == 0
+    assert mock_search.call_count == 2
+    mock_search.assert_called_with("query", "Core", 5)
+    assert [step["target_qps"] for step in json.loads(output.read_text())["steps"]] == [50, 100]
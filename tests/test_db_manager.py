@@ -1,12 +1,18 @@
 from __future__ import annotations
 
 import asyncio
+from contextlib import nullcontext
 from pathlib import Path
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 
-from uglyrag.db_manager import DatabaseManager
+from uglyrag import metrics
+from uglyrag.database import MaintenanceReport
+from uglyrag.database._sqlite import SQLiteDatebase
+from uglyrag.db_manager import DatabaseManager, no_segment
+from uglyrag.integrations import hashing
+from uglyrag.utils import LRUCache
 
 
 @pytest.fixture(autouse=True)
@@ -26,7 +32,8 @@ def mock_database():
 @pytest.fixture
 def mock_config():
     with patch("uglyrag.db_manager.config") as mock_config:
-        mock_config.get.side_effect = lambda key: "sqlite" if key == "db_type" else "test.db"
+        options = {"db_type": "sqlite", "db_name": "test.db"}
+        mock_config.get.side_effect = lambda key, section="DEFAULT", default="": options.get(key, default)
         mock_config.data_dir = Path("/mock/path")
         yield mock_config
 
@@ -49,7 +56,8 @@ def test_reset(mock_database):
 
 def test_search(mock_database):
     with patch.object(DatabaseManager, "get_database", return_value=mock_database.return_value):
-        with patch("uglyrag.db_manager.asyncio.run") as mock_run:
+        # 关闭传入的协程，避免出现协程未被等待的警告
+        with patch("uglyrag.db_manager.asyncio.run", side_effect=lambda coro: coro.close()) as mock_run:
             DatabaseManager.search("query", "vault")
             mock_run.assert_called_once()
 
@@ -63,6 +71,35 @@ def test_add_documents(mock_database):
             mock_database.return_value.rebuild_index.assert_called_once_with("vault")
 
 
+@pytest.mark.parametrize("bulk", [False, True])
+@pytest.mark.parametrize("quantization", ["none", "int8"])
+def test_add_documents_larger_than_cache(tmp_path, bulk, quantization):
+    # 批次超过导入缓存的容量时，写入仍然使用本批次算好的向量，只调用一次向量模型
+    embeddings = MagicMock(side_effect=lambda texts: [[1.0, float(len(t)), 0.0, 0.0] for t in texts])
+    store = SQLiteDatebase(
+        tmp_path / "cache.db", str.split, DatabaseManager._get_embedding, vec_quantization=quantization
+    )
+    data = [("source", str(i), "x" * i) for i in range(1, 6)]
+    with (
+        patch.object(DatabaseManager, "get_database", return_value=store),
+        patch.object(DatabaseManager, "embeddings", embeddings),
+        patch.object(DatabaseManager, "_embeddings_dict", LRUCache(2)),
+        patch.object(DatabaseManager, "_query_embeddings", LRUCache(2)),
+    ):
+        assert DatabaseManager._is_vault_valid("vault")
+        embeddings.reset_mock()  # 新建存储库时调用一次向量模型获取维度
+        with DatabaseManager.bulk_load("vault") if bulk else nullcontext():
+            DatabaseManager.add_documents(data, "vault")
+        assert embeddings.call_count == 1
+        assert len(embeddings.call_args.args[0]) == 5
+        assert DatabaseManager._pinned_embeddings == {}
+        # 已经算好的向量 (如导入日志中记录的) 直接写入，不再调用向量模型
+        more = [("other", str(i), "y" * i) for i in range(1, 6)]
+        DatabaseManager.add_documents(more, "vault", {c: [0.0, 1.0, 0.0, 0.0] for _, _, c in more})
+        assert embeddings.call_count == 1
+    assert store.conn.execute("SELECT count(*) FROM vault_vec").fetchone()[0] == 10
+
+
 def test_is_source_valid(mock_database):
     with patch.object(DatabaseManager, "get_database", return_value=mock_database.return_value):
         mock_database.return_value.check_source.return_value = True
@@ -76,21 +113,93 @@ def test_get_embedding():
     assert embedding is not None
 
 
+def test_embedding_metrics():
+    before = metrics.snapshot()
+    embeddings = MagicMock(side_effect=lambda texts: [[1.0, 0.0] for _ in texts])
+    with (
+        patch.object(DatabaseManager, "embeddings", embeddings),
+        patch.dict(DatabaseManager._embeddings_dict, clear=True),
+    ):
+        DatabaseManager.embed_documents([("s", "1", "a"), ("s", "2", "b"), ("s", "3", "a")])
+        DatabaseManager._get_embedding("b")
+    after = metrics.snapshot()
+    assert after["uglyrag_embedding_calls_total"] - before["uglyrag_embedding_calls_total"] == 1
+    assert after["uglyrag_embedding_cache_misses_total"] - before["uglyrag_embedding_cache_misses_total"] == 2
+    assert after["uglyrag_embedding_cache_hits_total"] - before["uglyrag_embedding_cache_hits_total"] == 2
+    assert after["uglyrag_embedding_batch_size"]["count"] - before["uglyrag_embedding_batch_size"]["count"] == 1
+
+
+def test_embedding_caches_are_bounded():
+    embeddings = MagicMock(side_effect=lambda texts: [[float(len(t))] for t in texts])
+    with (
+        patch.object(DatabaseManager, "embeddings", embeddings),
+        patch.object(DatabaseManager, "_embeddings_dict", LRUCache(2)),
+        patch.object(DatabaseManager, "_query_embeddings", LRUCache(2)),
+    ):
+        # 批次大于导入缓存的容量时仍然返回全部向量
+        data = [("s", str(i), "x" * i) for i in range(1, 5)]
+        assert DatabaseManager.embed_documents(data) == {"x" * i: [float(i)] for i in range(1, 5)}
+        assert len(DatabaseManager._embeddings_dict) == 2
+        # 查询向量写入单独的查询缓存，不会挤占导入缓存
+        for query in ("q1", "q22", "q333"):
+            DatabaseManager._get_embedding(query)
+        assert list(DatabaseManager._query_embeddings) == ["q22", "q333"]
+        assert list(DatabaseManager._embeddings_dict) == ["xxx", "xxxx"]
+        assert DatabaseManager.has_query_embedding("q333") and not DatabaseManager.has_query_embedding("q1")
+
+
+def test_embedding_info_records_fallback():
+    def get(opt, sec, default=None):
+        return "JINA" if opt == "embedding" else None
+
+    with patch("uglyrag.db_manager.config.get", side_effect=get):
+        # 配置的向量模块未能加载而退回哈希向量时，元数据记录实际使用的 Hash
+        with patch.object(DatabaseManager, "embeddings", staticmethod(hashing.embeddings)):
+            assert DatabaseManager._embedding_info() == {"embedding_module": "Hash", "embedding_model": "hash-1024"}
+        with patch.object(DatabaseManager, "embeddings", MagicMock()):
+            assert DatabaseManager._embedding_info()["embedding_module"] == "JINA"
+
+
+def test_segment_info():
+    with patch.object(DatabaseManager, "segment", staticmethod(no_segment)):
+        assert DatabaseManager._segment_info() == {"segment": "uglyrag.db_manager.no_segment"}
+
+
 def test_is_vault_valid(mock_database):
     with patch.object(DatabaseManager, "get_database") as mock_get_database:
         mock_db_instance = mock_get_database.return_value.__enter__.return_value
-        DatabaseManager._is_vault_valid("vault")
-        mock_db_instance._check_vault.assert_called_once_with("vault")
+        with patch.object(DatabaseManager, "_get_vault_dims", return_value=256):
+            DatabaseManager._is_vault_valid("vault")
+        mock_db_instance._check_vault.assert_called_once_with("vault", 256)
 
 
 @pytest.mark.asyncio
 async def test_async_search(mock_database):
     with patch.object(DatabaseManager, "get_database", return_value=mock_database.return_value):
-        with patch("uglyrag.db_manager.asyncio.gather", new_callable=AsyncMock) as mock_gather:
-            with patch.object(DatabaseManager, "_is_vault_valid", return_value=True):
-                with patch.object(DatabaseManager, "_run_in_executor", new_callable=AsyncMock) as mock_run:
-                    mock_run.side_effect = [[], []]  # 模拟两次调用的返回值
-                    result = await DatabaseManager._async_search("query", "vault")
-                    assert result is not None
-                    mock_gather.assert_awaited_once()
-                    assert mock_run.call_count == 2
+        with patch.object(DatabaseManager, "_is_vault_valid", return_value=True):
+            with patch.object(DatabaseManager, "_run_in_executor", new_callable=AsyncMock) as mock_run:
+                mock_run.side_effect = [[("1", "fts")], [("2", "vec")]]  # 模拟两次调用的返回值
+                result = await DatabaseManager._async_search("query", "vault")
+                assert result == [[("1", "fts")], [("2", "vec")]]
+                assert mock_run.await_count == 2
+
+
+def test_maintain(mock_database):
+    store = mock_database.return_value
+    store.sample_contents.return_value = ["content"]
+    store.maintain.return_value = MaintenanceReport("vault", True)
+    with patch.object(DatabaseManager, "get_database", return_value=store):
+        with patch.object(DatabaseManager, "_is_vault_valid", return_value=True):
+            with patch.object(DatabaseManager, "_get_embedding"):
+                report = DatabaseManager.maintain("vault")
+    store.maintain.assert_called_once_with("vault", True)
+    assert report.latency_before_ms is not None
+    assert report.latency_after_ms is not None
+
+
+def test_get_vault_dims():
+    options = {"dims.small": "256", "dims": "512"}
+    with patch("uglyrag.db_manager.config") as mock_config:
+        mock_config.get.side_effect = lambda key, section="DEFAULT", default="": options.get(key, default)
+        assert DatabaseManager._get_vault_dims("small") == 256
+        assert DatabaseManager._get_vault_dims("other") == 512
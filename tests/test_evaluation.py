@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import json
+import math
+import os
+import random
+
+import pytest
+
+from uglyrag.database._sqlite import SQLiteDatebase
+from uglyrag.evaluation import EvalQuery, evaluate, format_report, load_queries, ndcg_at_k, recall_at_k, write_report
+
+
+def embedding(text):
+    rng = random.Random(text)
+    vector = [rng.gauss(0, 1) for _ in range(16)]
+    norm = math.sqrt(sum(v * v for v in vector))
+    return [v / norm for v in vector]
+
+
+@pytest.fixture
+def store(tmp_path):
+    db = SQLiteDatebase(tmp_path / "eval.db", str.split, embedding, vec_quantization="binary")
+    db._check_vault("vault")
+    db.insert_data([("source", str(i), f"chunk {i} word{i % 7}") for i in range(200)], "vault")
+    return db
+
+
+def test_recall_and_ndcg():
+    assert recall_at_k(["1", "2", "3"], ["1", "3", "4"], 3) == pytest.approx(2 / 3)
+    assert recall_at_k(["1"], [], 3) == 0.0
+    assert ndcg_at_k(["1", "2"], ["1", "2"], 2) == 1.0
+    assert ndcg_at_k(["2", "1"], ["1"], 2) == pytest.approx(1 / math.log2(3))
+
+
+def test_load_queries(tmp_path):
+    path = tmp_path / "queries.jsonl"
+    path.write_text('plain query\n\n{"query": "labelled", "relevant": [1, 2]}\n', encoding="utf-8")
+    assert load_queries(path) == [EvalQuery("plain query"), EvalQuery("labelled", ["1", "2"])]
+
+
+def test_evaluate_sweep(store):
+    queries = [EvalQuery(f"chunk {i}") for i in range(0, 200, 20)]
+    results = evaluate(store, "vault", queries, k=5, sweep={"rescore_factor": [1, 40], "rrf_k": [10, 60]})
+    assert [(r.mode, r.settings) for r in results] == [
+        ("vec", {"rescore_factor": 1}),
+        ("hybrid", {"rescore_factor": 1, "rrf_k": 10}),
+        ("hybrid", {"rescore_factor": 1, "rrf_k": 60}),
+        ("vec", {"rescore_factor": 40}),
+        ("hybrid", {"rescore_factor": 40, "rrf_k": 10}),
+        ("hybrid", {"rescore_factor": 40, "rrf_k": 60}),
+    ]
+    # 候选数覆盖全部数据时重新排序等价于精确检索
+    assert results[3].recall == 1.0
+    assert results[3].ndcg == 1.0
+    assert results[0].recall <= results[3].recall
+    # 评估结束后恢复原来的设置
+    assert store.vec_rescore_factor == 4
+
+
+def test_evaluate_unknown_option(store):
+    with pytest.raises(ValueError):
+        evaluate(store, "vault", [EvalQuery("chunk")], sweep={"ef_search": [16]})
+
+
+def test_write_report(store, tmp_path):
+    results = evaluate(store, "vault", [EvalQuery("chunk 1")], k=3, modes=["vec"])
+    assert "| SQLiteDatebase | vec | 默认 |" in format_report(results)
+    write_report(results, tmp_path / "report.json")
+    assert json.loads((tmp_path / "report.json").read_text())[0]["k"] == 3
+
+
+def test_evaluate_rerank(store):
+    def rerank(query, documents):
+        # 按文档与查询相同的前缀长度打分
+        return [float(len(os.path.commonprefix([query, doc]))) for doc in documents]
+
+    queries = [EvalQuery(f"chunk {i} word{i % 7}", [str(i + 1)]) for i in range(0, 200, 40)]
+    results = evaluate(store, "vault", queries, k=3, sweep={"rerank_docs": [0, 1]}, modes=["rerank"], rerank=rerank)
+    assert [(r.mode, r.settings) for r in results] == [("rerank", {"rerank_docs": 0}), ("rerank", {"rerank_docs": 1})]
+    with pytest.raises(ValueError):
+        evaluate(store, "vault", queries, modes=["rerank"])
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import sqlite3
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from uglyrag.indexer import DONE, FAILED, PENDING, RUNNING, IndexQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = IndexQueue(tmp_path / "queue.db")
+    yield queue
+    queue.stop(timeout=5)
+
+
+def test_submit_and_wait(queue):
+    with patch("uglyrag.search.SearchEngine.build", return_value=3) as mock_build:
+        job = queue.submit([(1, "text")], "vault", update_exist=True)
+        assert job.wait(timeout=5) == DONE
+    mock_build.assert_called_once_with([("1", "text")], "vault", update_exist=True, bulk_load=False)
+    assert job.chunks == 3
+    assert job.error is None
+    assert queue.pending() == 0
+
+
+def test_failed_job(queue):
+    # build 是同步调用，显式使用 MagicMock
+    with patch("uglyrag.search.SearchEngine.build", new=MagicMock(side_effect=RuntimeError("boom"))):
+        job = queue.submit([("a", "text")], "vault")
+        assert job.wait(timeout=5) == FAILED
+    assert job.error == "boom"
+
+
+def test_jobs_run_in_order(queue):
+    calls = []
+    with patch("uglyrag.search.SearchEngine.build", side_effect=lambda docs, *_, **__: calls.append(docs) or 1):
+        jobs = [queue.submit([(str(i), "text")], "vault") for i in range(3)]
+        for job in jobs:
+            job.wait(timeout=5)
+    assert calls == [[("0", "text")], [("1", "text")], [("2", "text")]]
+
+
+def test_wait_timeout(queue):
+    queue.stop(timeout=5)
+    with patch.object(queue, "start"):
+        job = queue.submit([("a", "text")], "vault")
+    assert job.wait(timeout=0.1) == PENDING
+
+
+def test_running_jobs_are_requeued(tmp_path):
+    queue = IndexQueue(tmp_path / "queue.db")
+    with patch.object(queue, "start"):
+        job = queue.submit([("a", "text")], "vault")
+    queue._set_status(job.job_id, RUNNING)
+
+    reopened = IndexQueue(tmp_path / "queue.db")
+    assert reopened.get(job.job_id).status == PENDING
+
+
+def test_get_unknown_job(queue):
+    with pytest.raises(KeyError):
+        queue.get("missing")
+
+
+def test_done_job_drops_documents(queue, tmp_path):
+    with patch("uglyrag.search.SearchEngine.build", return_value=1):
+        job = queue.submit([("a", "text")], "vault")
+        job.wait(timeout=5)
+    conn = sqlite3.connect(tmp_path / "queue.db")
+    assert conn.execute("SELECT docs FROM jobs WHERE job_id=?", (job.job_id,)).fetchone()[0] == "[]"
+
+
+def test_jobs_from_other_processes(tmp_path):
+    # 查询进程只提交任务，不处理也不改动其他进程正在处理的任务
+    worker = IndexQueue(tmp_path / "queue.db")
+    with patch.object(worker, "start"):
+        running = worker.submit([("a", "text")], "vault")
+    worker._set_status(running.job_id, RUNNING)
+    with patch.object(IndexQueue, "process_jobs", False):
+        submitter = IndexQueue(tmp_path / "queue.db")
+        job = submitter.submit([("b", "text")], "vault")
+        assert submitter._worker is None
+    assert submitter.get(running.job_id).status == RUNNING
+    worker._set_status(running.job_id, DONE)
+    # 写入进程定期检查队列，处理其他进程提交的任务
+    with patch("uglyrag.search.SearchEngine.build", return_value=1):
+        worker.start()
+        assert job.wait(timeout=5) == DONE
+    worker.stop(timeout=5)
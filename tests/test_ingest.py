@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+from unittest.mock import patch
+
+import pytest
+
+from uglyrag.ingest import build_from_paths, decode_text, expand_paths, read_file
+from uglyrag.journal import IngestJournal
+
+
+@pytest.fixture
+def files(tmp_path):
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "a.md").write_text("# 标题\n内容", encoding="utf-8")
+    (tmp_path / "sub" / "b.txt").write_text("中文内容", encoding="gb18030")
+    (tmp_path / "sub" / "c.bin").write_bytes(b"\x00\x01")
+    return tmp_path
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = IngestJournal(tmp_path / "journal.db")
+    with patch("uglyrag.journal.get_journal", return_value=journal):
+        yield journal
+
+
+def test_expand_paths_directory(files):
+    assert expand_paths([files], extensions=[".md", ".txt"]) == [files / "a.md", files / "sub" / "b.txt"]
+
+
+def test_expand_paths_glob(files):
+    assert expand_paths([str(files / "**" / "*.bin")]) == [files / "sub" / "c.bin"]
+
+
+@pytest.mark.parametrize(
+    "data, expected",
+    [
+        (b"hello", "hello"),
+        ("héllo".encode("utf-16"), "héllo"),
+        ("﻿中文".encode(), "中文"),
+        ("中文内容".encode("gb18030"), "中文内容"),
+        ("café".encode("cp1252"), "café"),
+        ("Résumé of a naïve café — “quoted”".encode("cp1252"), "Résumé of a naïve café — “quoted”"),
+    ],
+)
+def test_decode_text(data, expected):
+    assert decode_text(data) == expected
+
+
+def test_decode_text_without_charset_normalizer():
+    with patch.dict("sys.modules", {"charset_normalizer": None}):
+        assert decode_text("café".encode("cp1252")) == "café"
+        assert decode_text("naïve".encode("cp1252")) == "naïve"
+        assert decode_text(b"\x81\xe9") == "\x81é"
+
+
+def test_read_file_mmap(files):
+    assert read_file(files / "sub" / "b.txt", mmap_threshold=1) == "中文内容"
+    assert read_file(files / "a.md", mmap_threshold=1 << 20) == "# 标题\n内容"
+
+
+def test_build_from_paths_skips_unchanged(files, journal):
+    with patch("uglyrag.search.SearchEngine.build", return_value=2) as mock_build:
+        stats = build_from_paths([files / "a.md", files / "sub"], "vault")
+        assert stats.files_ingested == 2
+        assert stats.chunks == 2
+        docs = mock_build.call_args.args[0]
+        assert sorted(text for _, text in docs) == ["# 标题\n内容", "中文内容"]
+
+        stats = build_from_paths([files / "a.md", files / "sub"], "vault")
+        assert stats.files_skipped == 2
+        assert stats.files_ingested == 0
+
+        (files / "a.md").write_text("# 标题\n新的内容", encoding="utf-8")
+        stats = build_from_paths([files / "a.md", files / "sub"], "vault")
+        assert stats.files_ingested == 1
+        assert mock_build.call_args.args[0] == [(str(files / "a.md"), "# 标题\n新的内容")]
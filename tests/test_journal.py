@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import pytest
+
+from uglyrag.journal import CHUNKED, COMMITTED, EMBEDDED, IngestJournal
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return IngestJournal(tmp_path / "journal.db")
+
+
+DATA = [("a", "1", "a1"), ("a", "2", "a2"), ("b", "1", "b1"), ("c", "1", "c1"), ("c", "2", "c2")]
+
+
+def test_job_id_is_deterministic():
+    docs = [("a", "text a"), ("b", "text b")]
+    assert IngestJournal.job_id("vault", docs) == IngestJournal.job_id("vault", list(docs))
+    assert IngestJournal.job_id("vault", docs) != IngestJournal.job_id("other", docs)
+    assert IngestJournal.job_id("vault", docs) != IngestJournal.job_id("vault", docs, update_exist=True)
+
+
+def test_start_job_keeps_sources_together(journal):
+    batches = journal.start_job("job", "vault", DATA, batch_size=1)
+    assert [batch.keys for batch in batches] == [
+        [("a", "1"), ("a", "2")],
+        [("b", "1")],
+        [("c", "1"), ("c", "2")],
+    ]
+    assert all(batch.stage == CHUNKED for batch in batches)
+
+
+def test_get_batches_unknown_job(journal):
+    assert journal.get_batches("missing") is None
+
+
+def test_progress_is_persisted(journal, tmp_path):
+    batches = journal.start_job("job", "vault", DATA, batch_size=1)
+    journal.mark_embedded(batches[0], {"a1": [0.5, 1.0], "a2": [1.5, 2.0]})
+    journal.mark_committed(batches[0])
+    journal.mark_embedded(batches[1], {"b1": [0.25]})
+
+    reopened = IngestJournal(tmp_path / "journal.db")
+    restored = reopened.get_batches("job")
+    assert restored is not None
+    assert [batch.stage for batch in restored] == [COMMITTED, EMBEDDED, CHUNKED]
+    assert reopened.load_embeddings(restored[1], ["b1"]) == {"b1": [0.25]}
+
+
+def test_finish_job(journal):
+    journal.start_job("job", "vault", DATA, batch_size=2)
+    journal.finish_job("job")
+    assert journal.get_batches("job") is None
+
+
+def test_reset(journal):
+    journal.start_job("job", "vault", DATA, batch_size=2)
+    journal.reset()
+    assert journal.get_batches("job") is None
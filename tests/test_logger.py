@@ -1,12 +1,23 @@
 from __future__ import annotations
 
+import gc
 import logging
+import os
+import sys
 import tempfile
+import weakref
 from datetime import datetime
 from logging import CRITICAL, DEBUG, ERROR, INFO, WARNING, StreamHandler
+from logging.handlers import RotatingFileHandler
 from pathlib import Path
 
-from uglyrag.logger import configure_basic_logging, configure_file_logging, configure_logger, create_formatter
+from uglyrag.logger import (
+    AsyncHandler,
+    configure_basic_logging,
+    configure_file_logging,
+    configure_logger,
+    create_formatter,
+)
 
 
 def test_configure_logger_level():
@@ -62,9 +73,77 @@ def test_configure_file_logging():
         logger = logging.getLogger()
         assert logger.handlers[0].level == DEBUG
         assert logger.handlers[1].level == DEBUG
+        assert isinstance(logger.handlers[1], AsyncHandler)
+        file_handler = logger.handlers[1].listener.handlers[0]
+        assert isinstance(file_handler, RotatingFileHandler)
         assert logger.handlers[0].formatter is not None
-        assert logger.handlers[1].formatter is not None
+        assert file_handler.formatter is not None
         assert logger.handlers[0].formatter._style._fmt == "%(asctime)s - [%(levelname)s] - %(message)s"
-        assert logger.handlers[1].formatter._style._fmt == "%(asctime)s - [%(levelname)s] - %(message)s"
+        assert file_handler.formatter._style._fmt == "%(asctime)s - [%(levelname)s] - %(message)s"
         log_file = data_dir / "logs" / f"{datetime.now().strftime('%Y-%m-%d')}.log"
         assert log_file.exists()
+        configure_basic_logging()
+
+
+def test_file_logging_is_async_and_rotates():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        data_dir = Path(temp_dir)
+        configure_basic_logging("WARNING")
+        configure_file_logging(data_dir, "test.log", log_level="INFO", max_bytes=200, backup_count=2)
+        logger = logging.getLogger()
+        # 根日志记录器的级别取各处理器的最低级别
+        assert logger.level == INFO
+        for i in range(20):
+            logging.info("message %s", i)
+        logging.debug("dropped")
+        logger.handlers[1].stop()
+        log_files = sorted(p.name for p in (data_dir / "logs").iterdir())
+        assert log_files == ["test.log", "test.log.1", "test.log.2"]
+        assert "message 19" in (data_dir / "logs" / "test.log").read_text(encoding="utf-8")
+        assert "dropped" not in "".join(p.read_text(encoding="utf-8") for p in (data_dir / "logs").iterdir())
+        configure_basic_logging()
+
+
+def test_async_handler_freezes_messages(tmp_path):
+    file_handler = RotatingFileHandler(tmp_path / "frozen.log", encoding="utf-8")
+    file_handler.setFormatter(create_formatter())
+    handler = AsyncHandler(file_handler)
+    args = ["before"]
+    record = logging.makeLogRecord({"msg": "value %s", "args": (args,), "levelno": INFO, "levelname": "INFO"})
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        record.exc_info = sys.exc_info()
+    handler.handle(record)
+    args[0] = "after"  # 记录之后修改参数不影响日志内容
+    handler.stop()
+    text = (tmp_path / "frozen.log").read_text(encoding="utf-8")
+    assert "[INFO] - value ['before']" in text
+    assert "ValueError: boom" in text
+
+
+def test_handlers_are_collected():
+    handler = AsyncHandler(logging.NullHandler())
+    ref = weakref.ref(handler)
+    handler.close()
+    del handler
+    gc.collect()
+    assert ref() is None
+
+
+def test_async_handler_after_fork(tmp_path):
+    handler = AsyncHandler(RotatingFileHandler(tmp_path / "fork.log", maxBytes=200, backupCount=1, encoding="utf-8"))
+    pid = os.fork()
+    if pid == 0:
+        # 子进程中重新启动了后台线程，写入自己的日志文件并各自轮转，停止时写入剩余的日志
+        for i in range(10):
+            handler.emit(logging.makeLogRecord({"msg": f"child {i} " + "x" * 40, "levelno": INFO, "levelname": "INFO"}))
+        handler.stop()
+        os._exit(0)
+    handler.emit(logging.makeLogRecord({"msg": "parent", "levelno": INFO, "levelname": "INFO"}))
+    assert os.waitpid(pid, 0)[1] == 0
+    handler.stop()
+    assert (tmp_path / "fork.log").read_text(encoding="utf-8").count("parent") == 1
+    child_log = (tmp_path / f"fork.{pid}.log").read_text(encoding="utf-8")
+    assert "child 9" in child_log and "parent" not in child_log
+    assert (tmp_path / f"fork.{pid}.log.1").exists()
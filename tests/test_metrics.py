@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import threading
+import time
+
+import pytest
+
+from uglyrag.metrics import Histogram, MetricsRegistry, TimedLock, hit_ratio
+
+
+@pytest.fixture
+def registry():
+    return MetricsRegistry()
+
+
+def test_counter(registry):
+    counter = registry.counter("requests_total", "请求次数")
+    assert registry.counter("requests_total") is counter
+    counter.inc()
+    counter.inc(2)
+    assert registry.snapshot() == {"requests_total": 3}
+    counter.inc(module="rerank", status="429")
+    assert counter.value(status="429", module="rerank") == 1
+    assert counter.total() == 4
+    assert registry.snapshot()["requests_total"] == {"": 3, '{module="rerank",status="429"}': 1}
+
+
+def test_register_conflict(registry):
+    registry.counter("requests_total")
+    with pytest.raises(ValueError):
+        registry.histogram("requests_total")
+
+
+def test_histogram_quantile():
+    histogram = Histogram(bounds=(1, 5, 10))
+    for value in (0.2, 0.7, 3, 3, 40):
+        histogram.observe(value)
+    assert histogram.quantile(0.5) == 5
+    assert histogram.quantile(0.99) == 40
+    assert histogram.snapshot()["buckets"] == {"1": 2, "5": 2, "10": 0, "+Inf": 1}
+
+
+def test_gauge_and_hit_ratio(registry):
+    hits = registry.counter("hits_total")
+    misses = registry.counter("misses_total")
+    registry.gauge("hit_ratio", "命中率", hit_ratio(hits, misses))
+    registry.gauge("broken", "", lambda: 1 / 0)
+    assert registry.snapshot()["hit_ratio"] == 0.0
+    hits.inc(3)
+    misses.inc()
+    assert registry.snapshot()["hit_ratio"] == 0.75
+
+
+def test_to_prometheus(registry):
+    registry.counter("errors_total", "失败次数").inc(status="500")
+    histogram = registry.histogram("latency_seconds", "耗时", bounds=(0.1, 1))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    text = registry.to_prometheus()
+    assert "# HELP errors_total 失败次数\n# TYPE errors_total counter\n" in text
+    assert 'errors_total{status="500"} 1' in text
+    assert 'latency_seconds_bucket{le="0.1"} 1\n' in text
+    assert 'latency_seconds_bucket{le="1"} 2\n' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 2\n' in text
+    assert "latency_seconds_count 2\n" in text
+
+
+def test_timed_lock():
+    wait = Histogram()
+    lock = TimedLock(wait)
+    with lock:
+        assert lock.locked()
+        assert not lock.acquire(blocking=False)
+    assert wait.count == 1 and wait.max == 0.0
+
+    lock.acquire()
+    thread = threading.Thread(target=lambda: (lock.acquire(), lock.release()))
+    thread.start()
+    time.sleep(0.05)
+    lock.release()
+    thread.join()
+    assert wait.count == 3
+    assert wait.max >= 0.04
@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import pytest
+import requests
+
+from uglyrag.integrations.jina import JinaAPI
+from uglyrag.mock_jina import MockJinaServer
+
+
+@pytest.fixture
+def server(monkeypatch):
+    with MockJinaServer(dims=32) as server:
+        monkeypatch.setattr(JinaAPI, "url", server.url)
+        yield server
+
+
+def test_embeddings(server):
+    vectors = JinaAPI.embeddings(["向量检索", "vector search"])
+    # JinaAPI 请求中的 dimensions 优先于服务的默认维度
+    assert [len(v) for v in vectors] == [1024, 1024]
+    response = requests.post(f"{server.url}/embeddings", json={"input": "text"})
+    assert len(response.json()["data"][0]["embedding"]) == 32
+    assert server.stats["/v1/embeddings 200"] == 2
+
+
+def test_rerank(server):
+    assert JinaAPI.rerank("vector search", ["other", "vector search", "vector"]) == [0.0, 1.0, 0.5]
+    response = requests.post(f"{server.url}/rerank", json={"query": "vector", "documents": ["a", "vector"], "top_n": 1})
+    assert response.json()["results"] == [{"index": 1, "relevance_score": 1.0, "document": {"text": "vector"}}]
+
+
+def test_connection_reuse(server):
+    with requests.Session() as session:
+        for _ in range(3):
+            session.post(f"{server.url}/embeddings", json={"input": ["text"]}).raise_for_status()
+    assert server.stats["connections"] == 1
+
+
+def test_rate_limit(server):
+    server.rpm = 2
+    statuses = [requests.post(f"{server.url}/embeddings", json={"input": ["text"]}) for _ in range(3)]
+    assert [r.status_code for r in statuses] == [200, 200, 429]
+    assert 0 < int(statuses[2].headers["Retry-After"]) <= 60
+
+
+def test_token_limit(server):
+    server.tpm = 3
+    assert requests.post(f"{server.url}/embeddings", json={"input": ["a b"]}).status_code == 200
+    assert requests.post(f"{server.url}/embeddings", json={"input": ["a b"]}).status_code == 429
+
+
+def test_errors(server):
+    server.error_rate, server.error_status = 1.0, 503
+    assert requests.post(f"{server.url}/embeddings", json={"input": ["text"]}).status_code == 503
+    server.error_rate = 0.0
+    server.max_bytes = 100
+    assert requests.post(f"{server.url}/embeddings", json={"input": ["x" * 200]}).status_code == 413
+    assert requests.post(f"{server.url}/unknown", json={}).status_code == 404
+    assert requests.post(f"{server.url}/embeddings", data=b"not json").status_code == 400
+    assert requests.post(f"{server.url}/embeddings", json={"input": []}).status_code == 400
+
+
+def test_api_key(server):
+    server.api_key = "secret"
+    assert requests.post(f"{server.url}/embeddings", json={"input": ["text"]}).status_code == 401
+    headers = {"Authorization": "Bearer secret"}
+    assert requests.post(f"{server.url}/embeddings", json={"input": ["text"]}, headers=headers).status_code == 200
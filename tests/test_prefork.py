@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import os
+import signal
+import socket
+import time
+from unittest.mock import patch
+
+import pytest
+import requests
+
+from uglyrag.db_manager import DatabaseManager
+from uglyrag.prefork import serve_prefork
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "fork"), reason="需要 fork")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_serve_prefork():
+    port = free_port()
+    with (
+        patch("uglyrag.prefork.SearchEngine.load_modules"),
+        patch("uglyrag.prefork._prepare"),
+        patch.object(DatabaseManager, "embeddings", staticmethod(lambda texts: [[1.0] for _ in texts])),
+        patch("uglyrag.server.SearchEngine.search", side_effect=lambda *_: [(str(os.getpid()), "content")]),
+        patch.object(DatabaseManager, "vault_exists", return_value=True),
+    ):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                serve_prefork(port=port, processes=2, writer=False)
+            finally:
+                os._exit(0)
+    try:
+        workers = set()
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline and len(workers) < 2:
+            try:
+                # 每个请求使用新的连接，由任意一个查询进程接受
+                response = requests.post(f"http://127.0.0.1:{port}/search", json={"query": "query"}, timeout=5)
+            except requests.ConnectionError:
+                time.sleep(0.1)
+                continue
+            workers.add(response.json()["results"][0]["id"])
+        assert len(workers) == 2
+        assert str(pid) not in workers
+        # 没有写入进程时不接受导入任务，避免任务一直停留在队列中
+        response = requests.post(f"http://127.0.0.1:{port}/build", json={"docs": [["a", "text"]]}, timeout=5)
+        assert response.status_code == 503
+    finally:
+        os.kill(pid, signal.SIGTERM)
+        assert os.waitpid(pid, 0)[1] == 0
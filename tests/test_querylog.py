@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from uglyrag import querylog
+from uglyrag.querylog import LoggedQuery, read_log
+from uglyrag.search import SearchEngine
+
+
+@pytest.fixture
+def log_path(tmp_path):
+    path = tmp_path / "queries.jsonl"
+    querylog.configure(path, 1.0)
+    yield path
+    querylog.configure(path, 0)
+
+
+def test_logged_query_round_trip():
+    record = LoggedQuery("查询", "Core", 3, 1.5, 2.0, 3, "", {"search.fts": 1.0})
+    line = record.to_json()
+    assert '"q":"查询"' in line
+    assert LoggedQuery.from_json(line) == record
+
+
+@patch("uglyrag.search.DatabaseManager")
+def test_capture_search(mock_db_manager, log_path):
+    mock_db_manager.search = MagicMock(return_value=[[("1", "content1")], [("2", "content2")]])
+    with patch.object(SearchEngine, "rerank", None):
+        SearchEngine.search("query", "Core", 2)
+    querylog.configure(log_path, 0)  # 关闭后台线程，确保日志写入文件
+    [record] = read_log([log_path])
+    assert (record.query, record.vault, record.top_n, record.results) == ("query", "Core", 2, 2)
+    assert "search.rrf" in record.stages
+    assert record.ms >= record.stages["search.rrf"]
+
+
+@patch("uglyrag.search.DatabaseManager")
+def test_capture_error(mock_db_manager, log_path):
+    mock_db_manager.search = MagicMock(side_effect=RuntimeError)
+    with pytest.raises(RuntimeError):
+        SearchEngine.search("query", "Core")
+    querylog.configure(log_path, 0)
+    assert read_log([log_path])[0].error == "RuntimeError"
+
+
+def test_disabled():
+    querylog.configure(None, 0)
+    with querylog.capture("query", "Core", 5) as record:
+        assert record is None
+
+
+def test_read_log_skips_invalid_lines(tmp_path):
+    path = tmp_path / "queries.jsonl"
+    path.write_text('{"q":"a","v":"Core"}\nnot json\n{"x":1}\n', encoding="utf-8")
+    assert read_log([path]) == [LoggedQuery("a", "Core")]
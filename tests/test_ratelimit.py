@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import pytest
+
+from uglyrag.ratelimit import RateLimiter, TokenBucket
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+        self.sleeps: list[float] = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_token_bucket():
+    clock = FakeClock()
+    bucket = TokenBucket(2, 1, clock, clock.sleep)
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == 0
+    # 令牌用完后按补充速率等待，并发的调用方依次排队
+    assert bucket.reserve() == pytest.approx(1)
+    assert bucket.reserve() == pytest.approx(2)
+    clock.now += 10
+    assert bucket.acquire() == 0
+
+
+def test_token_bucket_large_request():
+    clock = FakeClock()
+    bucket = TokenBucket(5, 1, clock, clock.sleep)
+    assert bucket.acquire(100) == 0  # 超过容量的请求按容量计算
+    assert bucket.acquire(5) == pytest.approx(5)
+    with pytest.raises(ValueError):
+        TokenBucket(0, 1)
+    with pytest.raises(ValueError):
+        RateLimiter(rpm=60, burst=2)
+    assert RateLimiter(rpm=60, burst=1).requests.rate == 1
+
+
+def test_rate_limiter():
+    clock = FakeClock()
+    limiter = RateLimiter(rpm=60, tpm=600, clock=clock, sleep=clock.sleep)
+    assert limiter.enabled and not RateLimiter().enabled
+    # 突发量为上限的十分之一，之后按剩余的额度匀速补充，一分钟内不超过 60 个请求
+    for _ in range(60):
+        limiter.acquire()
+    assert clock.now == pytest.approx(60, rel=0.05)
+    clock.now += 120
+    limiter.acquire(60)
+    assert limiter.acquire(60) == pytest.approx(60 / 9)  # token 数的限制更严格
+
+
+def test_rate_limiter_settle_and_backoff():
+    clock = FakeClock()
+    limiter = RateLimiter(rpm=600, tpm=600, clock=clock, sleep=clock.sleep)
+    limiter.acquire(10)
+    limiter.settle(10, 70)  # 实际用量超过预估
+    assert limiter.acquire(1) > 0
+    clock.now += 600
+    limiter.backoff(3)
+    assert limiter.acquire() >= 3
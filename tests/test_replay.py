@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import time
+
+import pytest
+
+from uglyrag.querylog import LoggedQuery
+from uglyrag.replay import ReplayReport, find_saturation, replay
+
+QUERIES = [LoggedQuery("a", "Core"), LoggedQuery("b", "Test", 3)]
+
+
+def test_replay():
+    calls = []
+    report = replay(QUERIES, lambda q, v, n: calls.append((q, v, n)), qps=200, duration=0.1, arrival="uniform")
+    assert report.sent == report.completed == 20
+    assert calls[:2] == [("a", "Core", 5), ("b", "Test", 3)]
+    assert report.p50_ms <= report.p99_ms
+
+
+def test_replay_vault_override_and_errors():
+    def search(query, vault, top_n):
+        assert vault == "Other"
+        if query == "b":
+            raise RuntimeError
+
+    report = replay(QUERIES, search, qps=100, vault="Other", seed=1)
+    assert (report.sent, report.completed, report.errors) == (2, 1, 1)
+
+
+def test_replay_open_loop_saturation():
+    # 单线程每个查询耗时 20ms，最多 50 QPS，目标 200 QPS 时查询在队列中累积
+    report = replay(QUERIES, lambda q, v, n: time.sleep(0.02), qps=200, concurrency=1, duration=0.1)
+    assert report.saturated
+    assert report.max_ms > 100
+
+
+def test_find_saturation():
+    reports = [ReplayReport(20, 1, completed=10, seconds=1), ReplayReport(5, 1, completed=5, seconds=1)]
+    assert find_saturation(reports) == 20
+    assert find_saturation(reports[1:]) is None
+
+
+def test_replay_invalid_arguments():
+    with pytest.raises(ValueError):
+        replay(QUERIES, print, qps=0)
+    with pytest.raises(ValueError):
+        replay(QUERIES, print, qps=1, arrival="burst")
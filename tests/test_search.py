@@ -4,7 +4,15 @@ from unittest.mock import MagicMock, patch
 
 import pytest
 
-from uglyrag.search import SearchEngine, merge_results
+from uglyrag.journal import IngestJournal
+from uglyrag.search import SearchEngine, merge_results, rerank_candidates, rerank_window
+
+
+@pytest.fixture(autouse=True)
+def journal(tmp_path):
+    journal = IngestJournal(tmp_path / "journal.db")
+    with patch("uglyrag.search.get_journal", return_value=journal):
+        yield journal
 
 
 @patch("uglyrag.search.DatabaseManager")
@@ -56,3 +64,122 @@ def test_rerank():
     expected = []
 
     assert SearchEngine._rerank(query, results) == expected
+
+
+@patch("uglyrag.search.DatabaseManager")
+def test_build_resumes_after_failure(mock_db_manager, journal):
+    mock_db_manager.is_source_valid = MagicMock(return_value=False)
+    mock_db_manager.embed_documents = MagicMock(side_effect=lambda data: {c: [1.0] for _, _, c in data})
+    mock_db_manager.add_documents = MagicMock(side_effect=[None, RuntimeError("crash")])
+
+    docs = [("a", "content a"), ("b", "content b"), ("c", "content c")]
+    with patch.object(SearchEngine, "_batch_size", 1):
+        with pytest.raises(RuntimeError):
+            SearchEngine.build(docs)
+        mock_db_manager.add_documents = MagicMock()
+        mock_db_manager.embed_documents.reset_mock()
+        SearchEngine.build(docs)
+
+    added = [call.args[0] for call in mock_db_manager.add_documents.call_args_list]
+    assert added == [[("b", "1", "content b")], [("c", "1", "content c")]]
+    # 第二批在中断前已经完成向量化，恢复时直接复用记录下的向量
+    assert mock_db_manager.embed_documents.call_count == 1
+    assert journal.get_batches(IngestJournal.job_id("Core", docs)) is None
+
+
+@patch("uglyrag.search.DatabaseManager")
+def test_build_resumes_with_repeated_source(mock_db_manager, journal):
+    # 同一来源出现多次时分段被分到同一个批次，恢复时按来源清理不会删除已提交批次中的分段
+    mock_db_manager.is_source_valid = MagicMock(return_value=False)
+    mock_db_manager.embed_documents = MagicMock(side_effect=lambda data: {c: [1.0] for _, _, c in data})
+    mock_db_manager.add_documents = MagicMock(side_effect=[None, RuntimeError("crash")])
+
+    docs = [("a", "content a1"), ("b", "content b"), ("a", "content a2"), ("c", "content c")]
+    with patch.object(SearchEngine, "_batch_size", 1):
+        with pytest.raises(RuntimeError):
+            SearchEngine.build(docs)
+        assert mock_db_manager.add_documents.call_args_list[0].args[0] == [
+            ("a", "1", "content a1"),
+            ("a", "1", "content a2"),
+        ]
+        mock_db_manager.add_documents = MagicMock()
+        mock_db_manager.is_source_valid.reset_mock()
+        SearchEngine.build(docs)
+
+    cleaned = {call.args[0] for call in mock_db_manager.is_source_valid.call_args_list}
+    assert cleaned == {"b", "c"}
+    added = [call.args[0] for call in mock_db_manager.add_documents.call_args_list]
+    assert added == [[("b", "1", "content b")], [("c", "1", "content c")]]
+
+
+def test_build_background():
+    with patch("uglyrag.search.get_index_queue") as mock_queue:
+        job = SearchEngine.build([("a", "text")], "vault", background=True)
+    mock_queue.return_value.submit.assert_called_once_with([("a", "text")], "vault", False, False)
+    assert job is mock_queue.return_value.submit.return_value
+
+
+@pytest.mark.parametrize("background", [False, True])
+@patch("uglyrag.search.DatabaseManager")
+def test_reset_rejected_while_jobs_pending(mock_db_manager, background):
+    # 后台任务尚未完成时重置数据库会删除任务正在写入的表
+    with patch("uglyrag.search.get_index_queue") as mock_queue:
+        mock_queue.cache_info.return_value.currsize = 1
+        mock_queue.return_value.pending.return_value = 1
+        with pytest.raises(RuntimeError):
+            SearchEngine.build([("a", "text")], "vault", reset_db=True, background=background)
+    mock_db_manager.reset.assert_not_called()
+    mock_queue.return_value.submit.assert_not_called()
+
+
+@patch("uglyrag.search.DatabaseManager")
+def test_warmup(mock_db_manager):
+    rerank = MagicMock(return_value=[1.0])
+    with patch.object(SearchEngine, "rerank", rerank):
+        SearchEngine.warmup("vault")
+    mock_db_manager.warmup.assert_called_once_with("vault")
+    rerank.assert_called_once_with("warmup", ["warmup"])
+
+
+def test_rerank_window():
+    text = "a" * 100 + " alpha beta " + "b" * 100 + " gamma"
+    assert rerank_window(text, "query", 0) == text
+    assert rerank_window(text, "missing", 20) == "a" * 20
+    # 截取包含最多查询词的一段，命中的词位于窗口中间
+    window = rerank_window(text, "Alpha BETA gamma", 20)
+    assert len(window) == 20 and "alpha beta" in window
+    assert rerank_window(text, "gamma", 10) == text[-10:]
+    # 中文按相邻两字匹配
+    assert "检索增强" in rerank_window("无关内容" * 20 + "检索增强生成" + "无关内容" * 20, "检索增强", 8)
+
+
+def test_rerank_candidates():
+    calls = []
+
+    def rerank(query, documents):
+        calls.append(documents)
+        return [float(len(document)) for document in documents]
+
+    candidates = [("1", "x" * 5), ("2", "y" * 10), ("3", "z" * 50)]
+    assert rerank_candidates(rerank, "query", candidates, max_docs=2) == [
+        ("2", "y" * 10),
+        ("1", "x" * 5),
+        ("3", "z" * 50),
+    ]
+    assert calls[-1] == ["x" * 5, "y" * 10]
+    # 交给 rerank 的文本被截断，返回完整内容
+    assert rerank_candidates(rerank, "query", candidates, max_chars=8)[0] == ("2", "y" * 10)
+    assert calls[-1] == ["x" * 5, "y" * 8, "z" * 8]
+
+
+@patch("uglyrag.search.DatabaseManager")
+def test_search_rerank_max_docs(mock_db_manager):
+    mock_db_manager.search = MagicMock(
+        return_value=[[("1", "content1"), ("2", "content2")], [("2", "content2_updated"), ("3", "content3")]]
+    )
+    rerank = MagicMock(side_effect=lambda query, documents: [1.0] * len(documents))
+    with patch.object(SearchEngine, "rerank", rerank), patch.object(SearchEngine, "_rerank_max_docs", 2):
+        results = SearchEngine.search("query")
+    # 按 RRF 顺序只重排前两个候选
+    rerank.assert_called_once_with("query", ["content2_updated", "content1"])
+    assert results == [("2", "content2_updated"), ("1", "content1"), ("3", "content3")]
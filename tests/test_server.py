@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+from unittest.mock import patch
+
+import pytest
+import requests
+
+from uglyrag.db_manager import DatabaseManager
+from uglyrag.server import SearchServer
+
+
+@pytest.fixture
+def server():
+    server = SearchServer(port=0, batch_wait=0.05)
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(server.start())
+        started.set()
+        loop.run_forever()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    started.wait()
+    yield server
+    asyncio.run_coroutine_threadsafe(server.stop(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+
+def url(server, path):
+    return f"http://127.0.0.1:{server.port}{path}"
+
+
+def test_health_and_metrics(server):
+    assert requests.get(url(server, "/health")).json() == {"status": "ok"}
+    response = requests.get(url(server, "/metrics"))
+    assert response.headers["Content-Type"].startswith("text/plain")
+    assert "uglyrag_http_requests_total" in response.text
+
+
+def test_search_batches_query_embeddings(server):
+    batches = []
+
+    def embeddings(texts):
+        batches.append(list(texts))
+        return [[1.0] for _ in texts]
+
+    queries = ["server query a", "server query b", "server query c"]
+    with (
+        patch.object(DatabaseManager, "embeddings", staticmethod(embeddings)),
+        patch("uglyrag.server.SearchEngine.search", return_value=[("1", "content")]) as search,
+        patch.object(DatabaseManager, "vault_exists", return_value=True),
+        requests.Session() as session,
+    ):
+        threads = [
+            threading.Thread(target=lambda q=q: session.post(url(server, "/search"), json={"query": q}))
+            for q in queries
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        response = session.post(url(server, "/search"), json={"query": queries[0], "vault": "Test", "top_n": 1})
+    assert response.json() == {"results": [{"id": "1", "content": "content"}]}
+    search.assert_called_with(queries[0], "Test", 1)
+    # 三个并发查询合并为一次向量模型调用，之后的重复查询命中缓存
+    assert len(batches) == 1 and sorted(batches[0]) == queries
+
+
+def test_build(server):
+    with patch("uglyrag.server.SearchEngine.build") as build:
+        build.return_value.job_id = "job"
+        build.return_value.status = "pending"
+        response = requests.post(url(server, "/build"), json={"docs": [["source", "content"]], "vault": "Core"})
+    assert response.status_code == 202
+    assert response.json() == {"job_id": "job", "status": "pending"}
+    build.assert_called_once_with([("source", "content")], "Core", update_exist=False, background=True)
+
+
+def test_job_status(server):
+    threads = []
+    fields = {"status": "done", "chunks": 3, "error": None}
+
+    def get_field(job_id, column):
+        threads.append(threading.current_thread().name)
+        return fields[column] if job_id == "job" else None
+
+    with patch("uglyrag.server.get_index_queue") as get_queue:
+        get_queue.return_value._get_job_field.side_effect = get_field
+        response = requests.get(url(server, "/build/job"))
+        assert response.json() == {"job_id": "job", "status": "done", "chunks": 3, "error": None}
+        assert requests.get(url(server, "/build/missing")).status_code == 404
+    # 读取队列数据库在线程池中执行，不阻塞事件循环
+    assert threads and all(name.startswith("search") for name in threads)
+
+
+def test_build_without_writer(server):
+    server.accept_builds = False
+    with patch("uglyrag.server.SearchEngine.build") as build:
+        response = requests.post(url(server, "/build"), json={"docs": [["source", "content"]]})
+    assert response.status_code == 503
+    build.assert_not_called()
+
+
+def test_errors(server):
+    assert requests.post(url(server, "/search"), data=b"not json").status_code == 400
+    assert requests.post(url(server, "/search"), json={"query": ""}).status_code == 400
+    assert requests.post(url(server, "/build"), json={"docs": "text"}).status_code == 400
+    assert requests.get(url(server, "/search")).status_code == 405
+    assert requests.get(url(server, "/unknown")).status_code == 404
+    with (
+        patch("uglyrag.server.SearchEngine.search", side_effect=RuntimeError("boom")),
+        patch.object(DatabaseManager, "vault_exists", return_value=True),
+    ):
+        response = requests.post(url(server, "/search"), json={"query": "server error query"})
+    assert response.status_code == 500
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        {"query": "q", "vault": "Core' OR 1=1 --"},
+        {"query": "q", "vault": "1abc"},
+        {"query": "q", "vault": "Core_fts"},
+        {"query": "q", "vault": ["Core"]},
+        {"query": "q", "top_n": "abc"},
+        {"query": "q", "top_n": None},
+        {"query": "q", "top_n": 0},
+        {"query": "q", "top_n": 10_000},
+        {"query": "q", "top_n": True},
+    ],
+)
+def test_invalid_search_parameters(server, body):
+    with patch("uglyrag.server.SearchEngine.search") as search:
+        assert requests.post(url(server, "/search"), json=body).status_code == 400
+    search.assert_not_called()
+
+
+def test_unknown_vault(server):
+    with (
+        patch("uglyrag.server.SearchEngine.search") as search,
+        patch.object(DatabaseManager, "vault_exists", return_value=False) as vault_exists,
+    ):
+        assert requests.post(url(server, "/search"), json={"query": "q", "vault": "Missing"}).status_code == 404
+    vault_exists.assert_called_once_with("Missing")
+    search.assert_not_called()
+    with patch("uglyrag.server.SearchEngine.build") as build:
+        response = requests.post(url(server, "/build"), json={"docs": [["source", "content"]], "vault": "a;drop"})
+    assert response.status_code == 400
+    build.assert_not_called()
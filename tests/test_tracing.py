@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import pstats
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from uglyrag import tracing
+from uglyrag.search import SearchEngine
+from uglyrag.tracing import Profiler, SpanCollector, add_hook, profile, remove_hook, set_profiler, span
+
+
+@pytest.fixture
+def collector():
+    collector = SpanCollector()
+    add_hook(collector)
+    yield collector
+    remove_hook(collector)
+
+
+def test_span_disabled_returns_shared_null_span():
+    assert span("a") is span("b")
+    with span("a") as s:
+        s.set(results=3)
+    assert s.sizes == {}
+
+
+def test_span_collector(collector):
+    with span("search.fts", "Core", top_n=5) as s:
+        s.set(results=3)
+    with pytest.raises(ValueError), span("search.fts", "Core"):
+        raise ValueError
+    stats = collector.snapshot()["search.fts"]
+    assert stats["count"] == 2
+    assert stats["sizes"] == {"top_n": 5, "results": 3}
+    assert stats["errors"] == 1
+    assert "search.fts: 次数 2" in str(collector)
+    collector.reset()
+    assert collector.snapshot() == {}
+
+
+def test_failing_hook_is_ignored(collector):
+    hook = MagicMock(side_effect=RuntimeError)
+    add_hook(hook)
+    try:
+        with span("segment"):
+            pass
+    finally:
+        remove_hook(hook)
+    hook.assert_called_once()
+    assert collector.snapshot()["segment"]["count"] == 1
+
+
+@patch("uglyrag.search.DatabaseManager")
+def test_search_spans(mock_db_manager, collector):
+    mock_db_manager.search = MagicMock(return_value=[[("1", "content1")], [("2", "content2")]])
+    with patch.object(SearchEngine, "rerank", None):
+        SearchEngine.search("query", "Core")
+    stats = collector.snapshot()
+    assert stats["search"]["sizes"] == {"top_n": 5, "results": 2}
+    assert stats["search.rrf"]["sizes"] == {"candidates": 2}
+
+
+def test_profiler(tmp_path):
+    assert profile("search").__enter__() is None
+    set_profiler(Profiler(tmp_path, sample_rate=1.0))
+    try:
+        with profile("search"):
+            sum(range(1000))
+    finally:
+        set_profiler(None)
+    dumps = list(tmp_path.glob("search-*.prof"))
+    assert len(dumps) == 1
+    assert pstats.Stats(str(dumps[0])).total_calls > 0
+
+
+def test_profiler_skips_unsampled(tmp_path):
+    with Profiler(tmp_path, sample_rate=0.0).profile("search"):
+        pass
+    assert list(tmp_path.iterdir()) == []
+    assert tracing._profiler is None
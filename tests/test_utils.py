@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import math
+
+from uglyrag.utils import LazyModule, LRUCache, lazy_load_module, percentile, resolve_module, truncate_embedding
+
+
+def test_truncate_embedding():
+    vector = truncate_embedding([3.0, 4.0, 12.0], 2)
+    assert vector == [0.6, 0.8]
+    assert math.isclose(sum(v * v for v in vector), 1.0)
+
+
+def test_truncate_embedding_keeps_shorter_vectors():
+    assert truncate_embedding([0.1, 0.2], 0) == [0.1, 0.2]
+    assert truncate_embedding([0.1, 0.2], 4) == [0.1, 0.2]
+
+
+class Target:
+    func = staticmethod(lambda x: "fallback")
+
+
+def test_lazy_load_module():
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return lambda x: x.upper()
+
+    lazy_load_module(loader, "func", Target, "warning")
+    assert isinstance(Target.__dict__["func"], LazyModule)
+    assert calls == []
+    assert Target.func("a") == "A"
+    # 加载后属性被替换为真正的函数
+    assert not isinstance(Target.__dict__["func"], LazyModule)
+    assert Target.func("b") == "B"
+    assert calls == [1]
+
+
+def test_lazy_load_module_failure(caplog):
+    class Other:
+        rerank = None
+
+    def loader():
+        raise ImportError("missing")
+
+    lazy_load_module(loader, "rerank", Other, "未引入 rerank 模块")
+    assert Other.rerank is not None
+    assert resolve_module(Other, "rerank") is None
+    assert Other.rerank is None
+    assert "未引入 rerank 模块" in caplog.text
+
+
+def test_percentile():
+    assert percentile([], 50) == 0.0
+    assert percentile([1.23456], 99) == 1.235
+    assert percentile([float(i) for i in range(1, 101)], 50) == 50.5
+    assert percentile([1.0, 2.0], 99) == 1.99
+
+
+def test_lru_cache():
+    cache: LRUCache[str, int] = LRUCache(2)
+    cache.update({"a": 1, "b": 2})
+    assert cache.get("a") == 1  # a 变为最近使用
+    cache["c"] = 3
+    assert dict(cache) == {"a": 1, "c": 3}
+    assert cache.get("b") is None
+    assert cache.copy().maxsize == 2
+    unbounded: LRUCache[int, int] = LRUCache()
+    unbounded.update({i: i for i in range(100)})
+    assert len(unbounded) == 100